@@ -0,0 +1,246 @@
+"""
+API HTTP local para escáneres de mano.
+
+    POST /escaneos   {"usuario": "inventario",
+                      "escaneos": [{"codigo": "7501234", "cantidad": 1}, ...]}
+    GET  /salud
+    GET  /metricas
+
+Los códigos se resuelven contra el catálogo de la tienda del usuario y el lote
+se registra con escaneos.registrar_escaneos_lote, la misma capa que usa la
+página de Conteo Físico. La respuesta trae los totales acumulados del día.
+
+INVENTARIO_API_TOKEN es obligatorio: sin él la API no se inicia, y cada
+petición (salvo GET /salud) debe enviar "Authorization: Bearer <token>".
+Por defecto solo escucha en 127.0.0.1.
+
+Uso:  INVENTARIO_API_TOKEN=... python api_escaneos.py --puerto 8001
+"""
+import argparse
+import hmac
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import database as db
+import escaneos
+import metricas
+
+PUERTO_POR_DEFECTO = int(os.environ.get("INVENTARIO_API_PUERTO", "8001"))
+TOKEN = os.environ.get("INVENTARIO_API_TOKEN")
+ARCHIVO_USUARIOS = "usuarios.csv"
+ROLES_CON_ESCANEO = {"admin", "inventario"}
+MAX_ESCANEOS_POR_LOTE = 5000
+MAX_BYTES_PETICION = 2 * 1024 * 1024
+
+
+class ErrorPeticion(Exception):
+    """Error de la petición con su código HTTP"""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+# ======================================================
+# USUARIOS (MISMO ARCHIVO QUE LA APLICACIÓN)
+# ======================================================
+_usuarios = {"huella": None, "por_username": {}}
+_lock_usuarios = threading.Lock()
+
+
+def _usuario(username):
+    """Datos de un usuario activo; el archivo se relee solo si cambió"""
+    try:
+        info = os.stat(ARCHIVO_USUARIOS)
+        huella = (info.st_mtime_ns, info.st_size)
+    except OSError:
+        huella = None
+
+    with _lock_usuarios:
+        if huella != _usuarios["huella"]:
+            por_username = {}
+            if huella is not None:
+                df = pd.read_csv(ARCHIVO_USUARIOS, dtype=str)
+                if 'tienda' not in df.columns:
+                    df['tienda'] = db.TIENDA_POR_DEFECTO
+                df['tienda'] = df['tienda'].fillna(db.TIENDA_POR_DEFECTO)
+                por_username = {fila['username']: fila for fila in df.to_dict('records')}
+            _usuarios.update(huella=huella, por_username=por_username)
+        return _usuarios["por_username"].get(username)
+
+
+# ======================================================
+# PROCESAMIENTO DE UN LOTE
+# ======================================================
+def _validar_escaneos(items):
+    """Normalizar los escaneos del lote: lista de (indice, codigo, cantidad) y rechazados"""
+    if not isinstance(items, list) or not items:
+        raise ErrorPeticion(400, "'escaneos' debe ser una lista no vacía")
+    if len(items) > MAX_ESCANEOS_POR_LOTE:
+        raise ErrorPeticion(413, f"Máximo {MAX_ESCANEOS_POR_LOTE} escaneos por lote")
+
+    validos, rechazados = [], []
+    for indice, item in enumerate(items):
+        if not isinstance(item, dict):
+            rechazados.append({"indice": indice, "codigo": None, "motivo": "Escaneo inválido"})
+            continue
+        codigo = str(item.get("codigo") or "").strip().replace("\n", "").replace("\r", "")
+        try:
+            cantidad = int(item.get("cantidad", 1))
+        except (TypeError, ValueError):
+            cantidad = 0
+        if not codigo:
+            rechazados.append({"indice": indice, "codigo": None, "motivo": "Código vacío"})
+        elif cantidad < 1:
+            rechazados.append({"indice": indice, "codigo": codigo, "motivo": "Cantidad inválida"})
+        else:
+            validos.append((indice, codigo, cantidad))
+    return validos, rechazados
+
+
+def procesar_lote(datos):
+    """Registrar un lote de escaneos; devuelve el cuerpo de la respuesta"""
+    if not isinstance(datos, dict):
+        raise ErrorPeticion(400, "Se esperaba un objeto JSON")
+
+    usuario = _usuario(str(datos.get("usuario") or ""))
+    if usuario is None or usuario.get("activo") != "1":
+        raise ErrorPeticion(403, "Usuario inexistente o inactivo")
+    if usuario.get("rol") not in ROLES_CON_ESCANEO:
+        raise ErrorPeticion(403, "El usuario no tiene permiso para escanear")
+
+    validos, rechazados = _validar_escaneos(datos.get("escaneos"))
+
+    with db.en_tienda(usuario["tienda"]):
+        catalogo = db.obtener_productos_por_codigos(codigo for _, codigo, _ in validos)
+
+        lote = []
+        for indice, codigo, cantidad in validos:
+            prod = catalogo.get(codigo)
+            if prod is None:
+                rechazados.append({"indice": indice, "codigo": codigo, "motivo": "Código no encontrado"})
+            else:
+                lote.append((codigo, prod, cantidad))
+
+        exito, resultado = escaneos.registrar_escaneos_lote(usuario["nombre"], lote)
+    if not exito:
+        raise ErrorPeticion(500, resultado)
+
+    # Total final de cada código del lote
+    totales = {}
+    for fila in resultado:
+        totales[fila["codigo"]] = {
+            "codigo": fila["codigo"],
+            "producto": fila["producto"],
+            "total_acumulado": fila["total_acumulado"],
+            "stock_sistema": fila["stock_sistema"],
+            "diferencia": fila["total_acumulado"] - fila["stock_sistema"],
+        }
+
+    rechazados.sort(key=lambda r: r["indice"])
+    return {
+        "tienda": usuario["tienda"],
+        "aceptados": len(resultado),
+        "rechazados": rechazados,
+        "totales": list(totales.values()),
+    }
+
+
+# ======================================================
+# SERVIDOR HTTP
+# ======================================================
+class ManejadorEscaneos(BaseHTTPRequestHandler):
+    """Rutas de la API"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        # Sin una línea de log por petición: con miles por segundo es puro ruido
+        pass
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _autorizado(self):
+        # Sin token configurado no se acepta ninguna petición
+        if not TOKEN:
+            return False
+        recibido = self.headers.get("Authorization") or ""
+        return hmac.compare_digest(recibido.encode("utf-8"), f"Bearer {TOKEN}".encode("utf-8"))
+
+    def do_GET(self):
+        if self.path == "/salud":
+            self._responder(200, {"ok": True})
+        elif not self._autorizado():
+            self._responder(401, {"error": "Token inválido"})
+        elif self.path == "/metricas":
+            self._responder(200, {"operaciones": metricas.resumen()})
+        else:
+            self._responder(404, {"error": "Ruta no encontrada"})
+
+    def do_POST(self):
+        if self.path != "/escaneos":
+            self._responder(404, {"error": "Ruta no encontrada"})
+            return
+        if not self._autorizado():
+            self._responder(401, {"error": "Token inválido"})
+            return
+
+        try:
+            longitud = int(self.headers.get("Content-Length") or 0)
+            if longitud > MAX_BYTES_PETICION:
+                # Sin leer el cuerpo la conexión no se puede reutilizar
+                self.close_connection = True
+                raise ErrorPeticion(413, "Petición demasiado grande")
+            try:
+                datos = json.loads(self.rfile.read(longitud) or b"null")
+            except ValueError:
+                raise ErrorPeticion(400, "JSON inválido")
+
+            with metricas.medir("api.escaneos"):
+                respuesta = procesar_lote(datos)
+            self._responder(200, respuesta)
+        except ErrorPeticion as e:
+            self._responder(e.estado, {"error": e.mensaje})
+        except Exception as e:
+            self._responder(500, {"error": f"Error interno: {str(e)}"})
+
+
+def crear_servidor(host="127.0.0.1", puerto=PUERTO_POR_DEFECTO):
+    """Servidor con un hilo por conexión"""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorEscaneos)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API local de escaneos para escáneres de mano")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Interfaz de escucha (por defecto solo esta máquina)")
+    parser.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO)
+    args = parser.parse_args(argv)
+    if not TOKEN:
+        parser.error("INVENTARIO_API_TOKEN no está definido: la API no se inicia sin token")
+
+    servidor = crear_servidor(args.host, args.puerto)
+    print(f"API de escaneos escuchando en http://{args.host}:{args.puerto}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,26 @@ import streamlit as st
 import pandas as pd
 import os
 import hashlib
+import html
+import secrets
+import shutil
+import tempfile
+from urllib.parse import quote
 from datetime import datetime
 import time
 import database as db  # Importamos las funciones de database.py
+from exportacion_excel import escribir_conciliacion_excel, nombre_archivo_excel
+from importacion_stock import leer_archivos_stock, REGLAS_DUPLICADOS
+import conciliacion
+import metricas
+import ritmo_escaneo
+from escaneos import (
+    archivo_escaneos, leer_csv, escribir_csv,
+    cargar_conteos, contar_conteos, cargar_escaneos_detallados,
+    total_escaneado_hoy, registrar_escaneo, asegurar_agregados, version_datos,
+    COLUMNAS_ESCANEOS, iterar_escaneos, csv_por_bloques, volcar_a_archivo,
+    registrar_volcado_escaner, reiniciar_conteo, sin_reinicios, TIPO_RESET, leer_ultimos_escaneos
+)
 
 # ======================================================
 # CONFIGURACIÓN GENERAL
@@ -18,9 +35,7 @@ st.set_page_config(
 
 # USAR LA MISMA RUTA EN TODO EL PROGRAMA
 ARCHIVO_STOCK = "stock_sistema.csv"
-ARCHIVO_CONTEOS = "conteos.csv"
 ARCHIVO_USUARIOS = "usuarios.csv"
-ARCHIVO_ESCANEOS = "escaneos_detallados.csv"
 
 # ======================================================
 # SISTEMA DE AUTENTICACIÓN Y PERMISOS
@@ -51,23 +66,28 @@ def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def cargar_usuarios():
-    """Cargar usuarios desde CSV"""
+    """Cargar usuarios desde CSV (cada usuario pertenece a una tienda)"""
     if os.path.exists(ARCHIVO_USUARIOS):
-        df = pd.read_csv(ARCHIVO_USUARIOS, dtype=str)
+        df = leer_csv(ARCHIVO_USUARIOS, dtype=str)
+        
+        # Archivos anteriores a las tiendas: todos en la tienda por defecto
+        if 'tienda' not in df.columns:
+            df['tienda'] = db.TIENDA_POR_DEFECTO
+        df['tienda'] = df['tienda'].fillna(db.TIENDA_POR_DEFECTO)
         return df
     else:
         usuarios_default = pd.DataFrame([
-            ["admin", "Administrador", hash_password("admin123"), "admin", "1"],
-            ["inventario", "Operador Inventario", hash_password("inventario123"), "inventario", "1"],
-            ["consulta", "Usuario Consulta", hash_password("consulta123"), "consulta", "1"]
-        ], columns=["username", "nombre", "password", "rol", "activo"])
+            ["admin", "Administrador", hash_password("admin123"), "admin", "1", db.TIENDA_POR_DEFECTO],
+            ["inventario", "Operador Inventario", hash_password("inventario123"), "inventario", "1", db.TIENDA_POR_DEFECTO],
+            ["consulta", "Usuario Consulta", hash_password("consulta123"), "consulta", "1", db.TIENDA_POR_DEFECTO]
+        ], columns=["username", "nombre", "password", "rol", "activo", "tienda"])
         
-        usuarios_default.to_csv(ARCHIVO_USUARIOS, index=False)
+        escribir_csv(usuarios_default, ARCHIVO_USUARIOS, index=False)
         return usuarios_default
 
 def guardar_usuarios(df):
     """Guardar usuarios en CSV"""
-    df.to_csv(ARCHIVO_USUARIOS, index=False)
+    escribir_csv(df, ARCHIVO_USUARIOS, index=False)
 
 def verificar_login(username, password):
     """Verificar credenciales de usuario"""
@@ -92,15 +112,25 @@ def verificar_login(username, password):
     
     return False, None, None, None
 
-def crear_usuario(username, nombre, password, rol):
+def tienda_de_usuario(username):
+    """Tienda a la que pertenece un usuario"""
+    usuarios_df = cargar_usuarios()
+    fila = usuarios_df[usuarios_df["username"] == username]
+    return fila.iloc[0]["tienda"] if not fila.empty else db.TIENDA_POR_DEFECTO
+
+def crear_usuario(username, nombre, password, rol, tienda=db.TIENDA_POR_DEFECTO):
     """Crear nuevo usuario"""
     usuarios_df = cargar_usuarios()
     
     if username in usuarios_df["username"].values:
         return False, "El nombre de usuario ya existe"
     
-    nuevo_usuario = pd.DataFrame([[username, nombre, hash_password(password), rol, "1"]], 
-                                 columns=usuarios_df.columns)
+    tienda = tienda.strip() or db.TIENDA_POR_DEFECTO
+    tienda_valida, mensaje = db.registrar_tienda(tienda)
+    if not tienda_valida:
+        return False, mensaje
+    nuevo_usuario = pd.DataFrame([[username, nombre, hash_password(password), rol, "1", tienda]], 
+                                 columns=["username", "nombre", "password", "rol", "activo", "tienda"])
     
     usuarios_df = pd.concat([usuarios_df, nuevo_usuario], ignore_index=True)
     guardar_usuarios(usuarios_df)
@@ -142,270 +172,240 @@ def cargar_stock():
     
     return df
 
-def guardar_stock(df):
-    """Guardar stock (adaptador para mantener compatibilidad)"""
-    # Asegurar que la columna 'marca' exista
-    if 'marca' not in df.columns:
-        df['marca'] = 'SIN MARCA'
-    
-    for _, row in df.iterrows():
-        db.guardar_producto(
-            row['codigo'], 
-            row['producto'], 
-            row.get('marca', 'SIN MARCA'), 
-            row['area'], 
-            row['stock_sistema']
-        )
-
-def cargar_conteos():
-    """Cargar conteos desde CSV (mantener compatibilidad)"""
-    if os.path.exists(ARCHIVO_CONTEOS):
-        df = pd.read_csv(ARCHIVO_CONTEOS)
-        return df
-    else:
-        return pd.DataFrame(columns=["fecha", "usuario", "codigo", "producto", "area", "stock_sistema", "conteo_fisico", "diferencia"])
-
-def guardar_conteos(df):
-    """Guardar conteos en CSV (mantener compatibilidad)"""
-    df.to_csv(ARCHIVO_CONTEOS, index=False)
+def marcas_del_filtro():
+    """Marcas del filtro de la barra lateral para las consultas de la base (None: todas)"""
+    marca = st.session_state.get('marca_seleccionada', 'Todas')
+    return None if marca == 'Todas' else [marca]
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def contar_productos(tienda, version_catalogo, marca):
+    """COUNT del catálogo; solo se repite cuando cambia el catálogo de la tienda"""
+    return db.contar_productos(marca)
+
+def cargar_contadores():
+    """Contadores de la barra lateral sin cargar productos ni conteos"""
+    return {
+        'productos': contar_productos(db.tienda_actual(), db.version_catalogo(),
+                                      st.session_state.get('marca_seleccionada', 'Todas')),
+        'conteos': contar_conteos(),
+    }
 
-def cargar_escaneos_detallados():
-    """Cargar escaneos desde CSV"""
-    if os.path.exists(ARCHIVO_ESCANEOS):
-        try:
-            df = pd.read_csv(ARCHIVO_ESCANEOS)
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-            if 'cantidad_escaneada' in df.columns:
-                df['cantidad_escaneada'] = pd.to_numeric(df['cantidad_escaneada'], errors='coerce').fillna(0).astype(int)
-            if 'total_acumulado' in df.columns:
-                df['total_acumulado'] = pd.to_numeric(df['total_acumulado'], errors='coerce').fillna(0).astype(int)
-            if 'stock_sistema' in df.columns:
-                df['stock_sistema'] = pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int)
-            return df
-        except Exception as e:
-            print(f"Error cargando escaneos: {e}")
-            return pd.DataFrame(columns=["timestamp", "usuario", "codigo", "producto", "area", "cantidad_escaneada", "total_acumulado", "stock_sistema", "tipo_operacion"])
-    else:
-        return pd.DataFrame(columns=["timestamp", "usuario", "codigo", "producto", "area", "cantidad_escaneada", "total_acumulado", "stock_sistema", "tipo_operacion"])
+def guardar_stock(df):
+    """Guardar stock (adaptador para mantener compatibilidad): una sola transacción"""
+    with metricas.medir("db.guardar_stock"):
+        return db.guardar_productos_df(df)
 
 # ======================================================
-# FUNCIÓN CORREGIDA: GUARDAR ESCANEO DETALLADO CON MARCA
+# PROCESAR UN ESCANEO DESDE LA PÁGINA DE CONTEO
 # ======================================================
-def guardar_escaneo_detallado(escaneo_data):
-    """Guardar UN escaneo individual PERMANENTEMENTE con marca incluida"""
+def buscar_producto_conteo(codigo, marca_filtro="Todas"):
+    """Producto del catálogo por código (DataFrame de 0 o 1 fila), respetando el filtro de marca"""
+    encontrado = db.obtener_productos_df_por_codigos([codigo])
+    for marca in (st.session_state.get('marca_seleccionada', 'Todas'), marca_filtro):
+        if marca != "Todas":
+            encontrado = encontrado[encontrado["marca"] == marca]
+    return encontrado
+
+def recargar_panel_escaneo():
+    """Volver a ejecutar solo el fragmento de escaneo; la página completa si se está ejecutando entera"""
     try:
-        # Asegurar tipos de datos
-        escaneo_data['cantidad_escaneada'] = int(escaneo_data['cantidad_escaneada'])
-        escaneo_data['total_acumulado'] = int(escaneo_data['total_acumulado'])
-        escaneo_data['stock_sistema'] = int(escaneo_data['stock_sistema'])
-        
-        # Asegurar que la marca esté presente
-        if 'marca' not in escaneo_data:
-            escaneo_data['marca'] = 'SIN MARCA'
-        
-        # Definir el orden de columnas para consistencia
-        columnas_ordenadas = ['timestamp', 'usuario', 'codigo', 'producto', 'marca', 'area', 
-                             'cantidad_escaneada', 'total_acumulado', 'stock_sistema', 'tipo_operacion']
-        
-        # Crear DataFrame con el orden correcto
-        nuevo_registro = pd.DataFrame([{col: escaneo_data.get(col, None) for col in columnas_ordenadas}])
-        
-        if os.path.exists(ARCHIVO_ESCANEOS):
-            df_existente = pd.read_csv(ARCHIVO_ESCANEOS)
-            
-            # Asegurar que el DataFrame existente tenga todas las columnas necesarias
-            for col in columnas_ordenadas:
-                if col not in df_existente.columns:
-                    df_existente[col] = None
-            
-            # Reordenar columnas del df_existente
-            df_existente = df_existente[columnas_ordenadas]
-            
-            # Concatenar
-            df_final = pd.concat([df_existente, nuevo_registro], ignore_index=True)
-        else:
-            df_final = nuevo_registro
-        
-        # Guardar
-        df_final.to_csv(ARCHIVO_ESCANEOS, index=False)
-        
-        # Actualizar sesión
-        if 'historial_escaneos' not in st.session_state:
-            st.session_state.historial_escaneos = []
-        st.session_state.historial_escaneos.append(escaneo_data)
-        
-        return True, "Escaneo guardado permanentemente"
-    except Exception as e:
-        return False, f"Error al guardar escaneo: {str(e)}"
+        st.rerun(scope="fragment")
+    except st.errors.StreamlitAPIException:
+        st.rerun()
 
-# ======================================================
-# FUNCIÓN CORREGIDA: CARGAR ESCANEOS DETALLADOS
-# ======================================================
-def cargar_escaneos_detallados():
-    """Cargar escaneos desde CSV asegurando columna marca"""
-    columnas_requeridas = ["timestamp", "usuario", "codigo", "producto", "marca", "area", 
-                          "cantidad_escaneada", "total_acumulado", "stock_sistema", "tipo_operacion"]
+def procesar_escaneo_en_conteo(codigo_limpio, cantidad, producto_encontrado):
+    """Registrar el escaneo y actualizar el producto actual de la sesión"""
+    prod = producto_encontrado.iloc[0]
     
-    if os.path.exists(ARCHIVO_ESCANEOS):
-        try:
-            df = pd.read_csv(ARCHIVO_ESCANEOS)
-            
-            # Asegurar que todas las columnas requeridas existan
-            for col in columnas_requeridas:
-                if col not in df.columns:
-                    if col == 'marca':
-                        df[col] = 'SIN MARCA'  # Valor por defecto para marca
-                    else:
-                        df[col] = None
-            
-            # Convertir tipos de datos
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-            if 'cantidad_escaneada' in df.columns:
-                df['cantidad_escaneada'] = pd.to_numeric(df['cantidad_escaneada'], errors='coerce').fillna(0).astype(int)
-            if 'total_acumulado' in df.columns:
-                df['total_acumulado'] = pd.to_numeric(df['total_acumulado'], errors='coerce').fillna(0).astype(int)
-            if 'stock_sistema' in df.columns:
-                df['stock_sistema'] = pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int)
-            
-            return df
-        except Exception as e:
-            print(f"Error cargando escaneos: {e}")
-            return pd.DataFrame(columns=columnas_requeridas)
-    else:
-        return pd.DataFrame(columns=columnas_requeridas)
+    exito, resultado = registrar_escaneo(st.session_state.nombre, codigo_limpio, prod, cantidad)
+    if not exito:
+        st.error(f"❌ {resultado}")
+        return None
+    
+    # Actualizar sesión
+    if 'historial_escaneos' not in st.session_state:
+        st.session_state.historial_escaneos = []
+    st.session_state.historial_escaneos.append(resultado)
+    
+    st.session_state.producto_actual_conteo = {
+        'codigo': codigo_limpio,
+        'nombre': prod["producto"],
+        'marca': resultado["marca"],
+        'area': prod["area"],
+        'stock_sistema': int(prod["stock_sistema"])
+    }
+    st.session_state.conteo_actual_session = resultado["total_acumulado"]
+    st.session_state.total_escaneos_session += 1
+
+    return resultado["total_acumulado"]
 
 # ======================================================
-# FUNCIÓN CORREGIDA: ACTUALIZAR RESUMEN CONTEO (INCLUYE MARCA)
+# DESCARGAS DESDE ARCHIVO TEMPORAL
 # ======================================================
-def actualizar_resumen_conteo(usuario, codigo, producto, area, stock_sistema, nuevo_total, marca='SIN MARCA'):
-    """Actualizar el resumen diario de conteos (ahora incluye marca)"""
+# Con server.enableStaticServing (startup.sh) las exportaciones se copian a
+# static/descargas y el servidor de Streamlit las envía desde el disco, por
+# bloques. st.download_button carga el archivo entero en memoria, así que sin
+# servidor estático solo se ofrecen archivos de hasta LIMITE_DESCARGA_EN_MEMORIA.
+MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+DIRECTORIO_DESCARGAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "descargas")
+VIGENCIA_DESCARGAS_SEGUNDOS = 3600
+LIMITE_DESCARGA_ESTATICA = 200 * 1024 * 1024  # máximo que sirve el servidor estático de Streamlit
+LIMITE_DESCARGA_EN_MEMORIA = 50 * 1024 * 1024
+
+def bloques_por_marca(df, tam_bloque=50_000):
+    """Recorrer un DataFrame ordenado por marca en bloques (para exportar a Excel)"""
+    ordenado = df.assign(marca=df['marca'].fillna('SIN MARCA')).sort_values(['marca', 'codigo'], kind='stable')
+    for inicio in range(0, len(ordenado), tam_bloque):
+        yield ordenado.iloc[inicio:inicio + tam_bloque]
+
+def _limpiar_descargas():
+    """Borrar las descargas publicadas hace más de VIGENCIA_DESCARGAS_SEGUNDOS"""
+    if not os.path.isdir(DIRECTORIO_DESCARGAS):
+        return
+    limite = time.time() - VIGENCIA_DESCARGAS_SEGUNDOS
+    for entrada in os.scandir(DIRECTORIO_DESCARGAS):
+        if entrada.is_dir() and entrada.stat().st_mtime < limite:
+            shutil.rmtree(entrada.path, ignore_errors=True)
+
+def publicar_descarga(ruta, file_name):
+    """
+    Mover un archivo a static/descargas bajo un directorio de nombre
+    aleatorio y devolver su URL relativa. Quien tenga la URL puede
+    descargarlo hasta que se limpie (VIGENCIA_DESCARGAS_SEGUNDOS).
+    """
+    _limpiar_descargas()
+    token = secrets.token_urlsafe(16)
+    destino = os.path.join(DIRECTORIO_DESCARGAS, token)
+    os.makedirs(destino)
+    shutil.move(ruta, os.path.join(destino, file_name))
+    return f"app/static/descargas/{token}/{quote(file_name)}"
+
+def ofrecer_descarga(etiqueta, ruta, file_name, mime):
+    """
+    Descarga de un archivo generado por bloques: enlace al servidor
+    estático si está habilitado o, si el archivo es chico, st.download_button.
+    El temporal nunca se carga entero en memoria por encima del límite.
+    """
+    tamano = os.path.getsize(ruta)
     try:
-        conteos_df = cargar_conteos()
-        hoy = datetime.now().strftime("%Y-%m-%d")
-        
-        mask = ((conteos_df["usuario"] == usuario) & 
-                (conteos_df["codigo"] == codigo) & 
-                (conteos_df["fecha"].str.startswith(hoy)))
-        
-        if mask.any() and not conteos_df[mask].empty:
-            conteos_df.loc[mask, ["conteo_fisico", "diferencia"]] = [nuevo_total, nuevo_total - stock_sistema]
+        if st.get_option("server.enableStaticServing") is True and tamano <= LIMITE_DESCARGA_ESTATICA:
+            url = publicar_descarga(ruta, file_name)
+            st.markdown(f'<a href="{html.escape(url)}" download="{html.escape(file_name)}">{etiqueta}</a>'
+                        f' ({tamano / 1024 / 1024:.1f} MB)', unsafe_allow_html=True)
+        elif tamano <= LIMITE_DESCARGA_EN_MEMORIA:
+            with open(ruta, 'rb') as archivo:
+                st.download_button(etiqueta, data=archivo, file_name=file_name, mime=mime)
         else:
-            nuevo = pd.DataFrame([[
-                f"{hoy} {datetime.now().strftime('%H:%M:%S')}", 
-                usuario, 
-                codigo, 
-                producto,
-                marca,  # Agregamos marca
-                area, 
-                stock_sistema, 
-                nuevo_total, 
-                nuevo_total - stock_sistema
-            ]], columns=["fecha", "usuario", "codigo", "producto", "marca", "area", "stock_sistema", "conteo_fisico", "diferencia"])
-            
-            conteos_df = pd.concat([conteos_df, nuevo], ignore_index=True)
-        
-        guardar_conteos(conteos_df)
-        return True
-    except Exception as e:
-        print(f"Error actualizando resumen: {e}")
-        return False
+            st.error(f"❌ El archivo ({tamano / 1024 / 1024:.0f} MB) es demasiado grande para descargarlo "
+                     "desde la memoria de la aplicación. Inicie Streamlit con "
+                     "--server.enableStaticServing=true (ver startup.sh) o aplique más filtros.")
+    finally:
+        if os.path.exists(ruta):
+            os.remove(ruta)
 
 # ======================================================
-# FUNCIÓN CORREGIDA: CARGAR CONTEO (INCLUYE MARCA)
+# TABLA PAGINADA (ORDEN Y FILTRO EN EL SERVIDOR)
 # ======================================================
-def cargar_conteos():
-    """Cargar conteos desde CSV con soporte para marca"""
-    columnas_requeridas = ["fecha", "usuario", "codigo", "producto", "marca", "area", "stock_sistema", "conteo_fisico", "diferencia"]
-    
-    if os.path.exists(ARCHIVO_CONTEOS):
-        df = pd.read_csv(ARCHIVO_CONTEOS)
-        
-        # Asegurar que todas las columnas requeridas existan
-        for col in columnas_requeridas:
-            if col not in df.columns:
-                if col == 'marca':
-                    df[col] = 'SIN MARCA'
-                else:
-                    df[col] = None
-        
-        return df
-    else:
-        return pd.DataFrame(columns=columnas_requeridas)
-
-# ======================================================
-# MODIFICAR LA FUNCIÓN mostrar_conteo_fisico PARA INCLUIR MARCA
-# ======================================================
-# Busca esta sección en mostrar_conteo_fisico (aproximadamente línea 680-700)
-# y reemplázala con:
+TAMANOS_PAGINA = [25, 50, 100, 250]
+SIN_ORDEN = "(sin orden)"
 
-def procesar_escaneo_en_conteo(codigo_limpio, cantidad, producto_encontrado):
-    """Función auxiliar para procesar escaneo (para mantener el código organizado)"""
-    prod = producto_encontrado.iloc[0]
-    
-    # Obtener marca (asegurar que existe)
-    marca = prod.get("marca", "SIN MARCA")
-    if pd.isna(marca) or marca == "":
-        marca = "SIN MARCA"
-    
-    # Calcular total anterior
-    total_anterior = total_escaneado_hoy(st.session_state.nombre, codigo_limpio)
-    nuevo_total = total_anterior + cantidad
-
-    # --- GUARDAR ESCANEO CON MARCA ---
-    timestamp_actual = datetime.now()
-    
-    escaneo_data = {
-        "timestamp": timestamp_actual,
-        "usuario": st.session_state.nombre,
-        "codigo": codigo_limpio,
-        "producto": prod["producto"],
-        "marca": marca,  # ¡Importante!
-        "area": prod["area"],
-        "cantidad_escaneada": int(cantidad),
-        "total_acumulado": int(nuevo_total),
-        "stock_sistema": int(prod["stock_sistema"]),
-        "tipo_operacion": "ESCANEO"
-    }
-    
-    # Usar la función corregida
-    guardar_escaneo_detallado(escaneo_data)
-
-    # Registrar en base de datos (si aplica)
-    db.registrar_conteo(
-        st.session_state.nombre,
-        codigo_limpio,
-        prod["producto"],
-        marca,  # Pasar marca
-        prod["area"],
-        int(prod["stock_sistema"]),
-        nuevo_total
-    )
+def _ordenar_tabla(df, columna, descendente):
+    """Ordenar por una columna; si mezcla tipos, ordenar por su texto"""
+    try:
+        return df.sort_values(columna, ascending=not descendente, na_position='last', kind='stable')
+    except TypeError:
+        return df.sort_values(columna, ascending=not descendente, na_position='last', kind='stable',
+                              key=lambda serie: serie.astype(str))
+
+def mostrar_tabla_paginada(df, key, column_config=None, orden_defecto=None, descendente=False,
+                           tam_pagina=50):
+    """
+    Mostrar un DataFrame por páginas.
+
+    La búsqueda y el orden se aplican aquí, en el servidor, y solo la página
+    visible se envía al navegador. Las exportaciones deben usar el DataFrame
+    completo, no esta tabla. Con columnas numéricas (y |diferencia|) solo se
+    seleccionan las filas hasta la página visible, sin ordenar todo.
+    Devuelve el DataFrame filtrado.
+    """
+    columnas = list(df.columns)
+    opciones_orden = [SIN_ORDEN] + columnas
+    if 'diferencia' in columnas and pd.api.types.is_numeric_dtype(df['diferencia']):
+        opciones_orden.append(conciliacion.ORDEN_DIFERENCIA_ABSOLUTA)
+    indice_orden = opciones_orden.index(orden_defecto) if orden_defecto in opciones_orden else 0
+
+    col_buscar, col_orden, col_desc, col_tam = st.columns([3, 2, 1, 1])
+    with col_buscar:
+        texto = st.text_input("🔎 Buscar", key=f"{key}_buscar", placeholder="Texto en cualquier columna")
+    with col_orden:
+        orden = st.selectbox("Ordenar por", opciones_orden, index=indice_orden, key=f"{key}_orden")
+    with col_desc:
+        desc = st.checkbox("Descendente", value=descendente, key=f"{key}_desc")
+    with col_tam:
+        tam = st.selectbox("Filas por página", TAMANOS_PAGINA,
+                           index=TAMANOS_PAGINA.index(tam_pagina) if tam_pagina in TAMANOS_PAGINA else 0,
+                           key=f"{key}_tam")
+
+    # Filtro: buscar el texto en las columnas de texto
+    resultado = df
+    texto = (texto or "").strip()
+    if texto and not df.empty:
+        mask = pd.Series(False, index=df.index)
+        for columna in columnas:
+            serie = df[columna]
+            if pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_any_dtype(serie):
+                continue
+            mask |= serie.astype(str).str.contains(texto, case=False, na=False, regex=False)
+        resultado = df[mask]
+
+    total = len(resultado)
+    n_paginas = max(1, -(-total // tam))
+
+    # Volver a la primera página cuando cambian la búsqueda, el orden o los datos
+    clave_pagina = f"{key}_pagina"
+    firma = (texto, orden, desc, tam, len(df))
+    if st.session_state.get(f"{key}_firma") != firma:
+        st.session_state[f"{key}_firma"] = firma
+        st.session_state[clave_pagina] = 1
+    elif st.session_state.get(clave_pagina, 1) > n_paginas:
+        st.session_state[clave_pagina] = n_paginas
+
+    inicio = (int(st.session_state.get(clave_pagina, 1)) - 1) * tam
+    if orden == conciliacion.ORDEN_DIFERENCIA_ABSOLUTA and orden in opciones_orden:
+        clave_orden = resultado['diferencia'].abs()
+    elif orden in columnas and pd.api.types.is_numeric_dtype(resultado[orden]):
+        clave_orden = resultado[orden]
+    else:
+        clave_orden = None
+
+    if clave_orden is not None:
+        # Selección parcial: las primeras inicio + tam filas del orden, no todas
+        posiciones = conciliacion.indices_mayores(clave_orden.to_numpy(dtype=float, na_value=float('nan')),
+                                                  inicio + tam, desc)
+        pagina_df = resultado.iloc[posiciones[inicio:]]
+    elif orden in columnas and not resultado.empty:
+        pagina_df = _ordenar_tabla(resultado, orden, desc).iloc[inicio:inicio + tam]
+    else:
+        pagina_df = resultado.iloc[inicio:inicio + tam]
 
-    # Actualizar resumen de conteos con marca
-    actualizar_resumen_conteo(
-        st.session_state.nombre, 
-        codigo_limpio, 
-        prod["producto"],
-        prod["area"], 
-        int(prod["stock_sistema"]), 
-        nuevo_total,
-        marca  # Nuevo parámetro
+    st.dataframe(
+        pagina_df,
+        use_container_width=True,
+        hide_index=True,
+        column_config=column_config
     )
 
-    # Actualizar sesión
-    st.session_state.producto_actual_conteo = {
-        'codigo': codigo_limpio,
-        'nombre': prod["producto"],
-        'marca': marca,
-        'area': prod["area"],
-        'stock_sistema': int(prod["stock_sistema"])
-    }
-    st.session_state.conteo_actual_session = nuevo_total
-    st.session_state.total_escaneos_session += 1
+    col_info, col_pagina = st.columns([3, 1])
+    with col_pagina:
+        st.number_input("Página", min_value=1, max_value=n_paginas, step=1, key=clave_pagina)
+    with col_info:
+        if total:
+            st.caption(f"Filas {inicio + 1}–{inicio + len(pagina_df)} de {total} · página "
+                       f"{inicio // tam + 1} de {n_paginas}")
+        else:
+            st.caption("Sin filas que coincidan con la búsqueda")
 
-    return True
+    return resultado
 
 # ======================================================
 # PÁGINA DE LOGIN (CORREGIDA - TÍTULO CENTRADO)
@@ -440,6 +440,7 @@ def mostrar_login():
                             st.session_state.usuario = user
                             st.session_state.nombre = nombre
                             st.session_state.rol = rol
+                            st.session_state.tienda = tienda_de_usuario(user)
                             st.session_state.pagina_actual = "🏠 Dashboard"
                             st.success(f"✅ Bienvenido, {nombre}!")
                             st.rerun()
@@ -460,6 +461,18 @@ def mostrar_sidebar():
         st.title(f"👤 {st.session_state.nombre}")
         st.write(f"**Rol:** {st.session_state.rol.upper()}")
         st.write(f"**Usuario:** {st.session_state.usuario}")
+        
+        # Los administradores pueden trabajar sobre cualquier tienda
+        if tiene_permiso("admin"):
+            tiendas = db.listar_tiendas()
+            tienda = db.tienda_actual()
+            nueva_tienda = st.selectbox("🏬 Tienda", tiendas,
+                                        index=tiendas.index(tienda) if tienda in tiendas else 0)
+            if nueva_tienda != tienda:
+                st.session_state.tienda = nueva_tienda
+                st.rerun()
+        else:
+            st.write(f"**Tienda:** {db.tienda_actual()}")
         st.markdown("---")
         
         st.subheader("📌 Navegación")
@@ -493,14 +506,13 @@ def mostrar_sidebar():
         
         st.markdown("---")
         
-        stock_df = cargar_stock()
-        conteos_df = cargar_conteos()
+        contadores = cargar_contadores()
         
         col_info1, col_info2 = st.columns(2)
         with col_info1:
-            st.metric("📦 Productos", len(stock_df))
+            st.metric("📦 Productos", contadores['productos'])
         with col_info2:
-            st.metric("🔢 Conteos", len(conteos_df))
+            st.metric("🔢 Conteos", contadores['conteos'])
         
         st.markdown("---")
         
@@ -509,6 +521,40 @@ def mostrar_sidebar():
                 del st.session_state[key]
             st.rerun()
 
+# ======================================================
+# WIDGET: RITMO DE ESCANEO EN VIVO
+# ======================================================
+def mostrar_ritmo_escaneo():
+    """Mostrar escaneos por minuto por operador y por marca"""
+    st.subheader("⚡ Ritmo de escaneo")
+    
+    ventana = st.radio("Ventana", list(ritmo_escaneo.VENTANAS), index=1, horizontal=True, key="ventana_ritmo")
+    tienda = db.tienda_actual()
+    total = ritmo_escaneo.ritmo_total(ventana, tienda=tienda)
+    
+    if not total["escaneos"]:
+        st.caption(f"Sin escaneos en la última ventana de {ventana}")
+        return
+    
+    col_r1, col_r2, col_r3 = st.columns(3)
+    with col_r1:
+        st.metric("Escaneos/min", total["escaneos_por_minuto"])
+    with col_r2:
+        st.metric("Escaneos", total["escaneos"])
+    with col_r3:
+        st.metric("Unidades", total["unidades"])
+    
+    columnas = {'clave': 'Nombre', 'escaneos_por_minuto': 'Escaneos/min', 'escaneos': 'Escaneos', 'unidades': 'Unidades'}
+    col_op, col_marca = st.columns(2)
+    with col_op:
+        st.markdown("**Por operador**")
+        st.dataframe(pd.DataFrame(ritmo_escaneo.ritmo("operador", ventana, tienda=tienda)).rename(columns=columnas),
+                     use_container_width=True, hide_index=True)
+    with col_marca:
+        st.markdown("**Por marca**")
+        st.dataframe(pd.DataFrame(ritmo_escaneo.ritmo("marca", ventana, tienda=tienda)).head(10).rename(columns=columnas),
+                     use_container_width=True, hide_index=True)
+
 # ======================================================
 # 1️⃣ PÁGINA: DASHBOARD (SECCIÓN DE MÉTRICAS CORREGIDA)
 # ======================================================
@@ -518,8 +564,6 @@ def mostrar_dashboard():
     st.markdown("---")
     
     stock_df = cargar_stock()
-    conteos_df = cargar_conteos()
-    escaneos_df = cargar_escaneos_detallados()
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -528,72 +572,51 @@ def mostrar_dashboard():
         st.metric("📦 Productos", total_productos)
     
     with col2:
-        total_conteos = len(conteos_df)
-        st.metric("🔢 Conteos", total_conteos)
+        st.metric("🔢 Conteos", contar_conteos())
     
     with col3:
-        if not escaneos_df.empty:
-            total_escaneos = len(escaneos_df)
-            st.metric("📱 Escaneos totales", total_escaneos)
-        else:
-            st.metric("📱 Escaneos totales", 0)
+        # Suma mantenida en escaneado_por_producto (sin los eventos RESET)
+        asegurar_agregados()
+        st.metric("📱 Escaneos totales", db.contar_escaneos())
+    
+    # Último conteo por producto y totales por estado (mantenidos en la base)
+    totales_estado = db.obtener_totales_estado()
+    exactos = totales_estado['EXACTO']['productos']
+    diferencias_leves = totales_estado['LEVE']['productos']
+    diferencias_criticas = totales_estado['CRÍTICO']['productos']
+    total_productos_contados = exactos + diferencias_leves + diferencias_criticas
     
     with col4:
-        if not conteos_df.empty and not escaneos_df.empty:
-            # Obtener productos únicos que han sido escaneados (contados)
-            productos_escaneados = escaneos_df['codigo'].nunique()
-            
-            # De esos productos escaneados, cuántos tienen diferencia 0 (exactos)
-            # Necesitamos obtener el último conteo de cada producto
-            ultimos_conteos = conteos_df.sort_values('fecha').groupby('codigo').last().reset_index()
-            exactos = len(ultimos_conteos[ultimos_conteos['diferencia'] == 0])
-            
-            # Calcular precisión sobre productos contados, no sobre total
-            if productos_escaneados > 0:
-                precision = (exactos / productos_escaneados) * 100
-            else:
-                precision = 0
-                
+        if total_productos_contados > 0:
+            # Precisión sobre productos contados (último conteo de cada uno), no sobre total
+            precision = (exactos / total_productos_contados) * 100
             st.metric("🎯 Precisión", f"{precision:.1f}%", 
-                     help=f"Basado en {exactos} exactos de {productos_escaneados} productos contados")
+                     help=f"Basado en {exactos} exactos de {total_productos_contados} productos contados")
         else:
             st.metric("🎯 Precisión", "0%", help="No hay datos de conteo")
     
+    # Ritmo de escaneo en vivo (cubetas en la base, también las de la API; no lee la bitácora)
+    mostrar_ritmo_escaneo()
+    
     # ======================================================
     # NUEVA SECCIÓN: RESUMEN POR ESTADO (COMO EN LA IMAGEN)
     # ======================================================
     st.subheader("📊 Resumen de Conteos por Estado")
     
     # Calcular estadísticas de conteos
-    if not conteos_df.empty and not stock_df.empty:
-        # Obtener productos únicos que han sido contados
-        productos_contados = conteos_df.groupby('codigo').agg({
-            'conteo_fisico': 'max',
-            'diferencia': 'first'
-        }).reset_index()
-        
+    if total_productos_contados > 0 and not stock_df.empty:
         # Total productos en sistema
         total_productos_sistema = len(stock_df)
         
-        # Productos contados (únicos)
-        total_productos_contados = len(productos_contados)
-        
-        # No escaneados
-        no_escaneados = total_productos_sistema - total_productos_contados
+        # No escaneados (conjunto de pendientes mantenido en la base), con el mismo filtro de marca
+        no_escaneados = db.contar_pendientes(marcas_del_filtro())
         
         # Stock total
         stock_total = stock_df['stock_sistema'].sum() if 'stock_sistema' in stock_df.columns else 0
         
-        # Total contado
-        total_contado = productos_contados['conteo_fisico'].sum() if 'conteo_fisico' in productos_contados.columns else 0
-        
-        # Diferencia neta
-        diferencia_neta = productos_contados['diferencia'].sum() if 'diferencia' in productos_contados.columns else 0
-        
-        # Estado de productos
-        exactos = len(productos_contados[productos_contados['diferencia'] == 0])
-        diferencias_leves = len(productos_contados[(productos_contados['diferencia'].abs() > 0) & (productos_contados['diferencia'].abs() <= 5)])
-        diferencias_criticas = len(productos_contados[productos_contados['diferencia'].abs() > 5])
+        # Total contado y diferencia neta (sumas mantenidas por estado)
+        total_contado = sum(t['conteo_fisico'] for t in totales_estado.values())
+        diferencia_neta = int(sum(t['diferencia'] for t in totales_estado.values()))
         
         # Layout de dos columnas: izquierda (resumen numérico) y derecha (distribución por estado)
         col_left, col_right = st.columns([1, 1])
@@ -632,7 +655,7 @@ def mostrar_dashboard():
             with col_est1:
                 st.metric("✅ Exactos", exactos)
             with col_est2:
-                st.metric("🟡 Leves", diferencias_leves)
+                st.metric("🟡 Leves", diferencias_leves, help=f"Diferencia de hasta ±{conciliacion.UMBRAL_LEVE} unidades")
             with col_est3:
                 st.metric("🔴 Críticas", diferencias_criticas)
             
@@ -666,55 +689,50 @@ def mostrar_dashboard():
         # ======================================================
         st.subheader("📋 Listado de Productos")
         
-        # Combinar datos de stock con conteos
-        productos_con_estado = stock_df.copy()
-        productos_con_estado['conteo_fisico'] = 0
-        productos_con_estado['diferencia'] = 0
-        productos_con_estado['estado'] = 'NO ESCANEADO'
-        
-        # Actualizar con datos de conteos
-        for _, row in productos_contados.iterrows():
-            mask = productos_con_estado['codigo'] == row['codigo']
-            if mask.any():
-                productos_con_estado.loc[mask, 'conteo_fisico'] = row['conteo_fisico']
-                productos_con_estado.loc[mask, 'diferencia'] = row['diferencia']
-                if row['diferencia'] == 0:
-                    productos_con_estado.loc[mask, 'estado'] = 'EXACTO'
-                elif abs(row['diferencia']) <= 5:
-                    productos_con_estado.loc[mask, 'estado'] = 'LEVE'
-                else:
-                    productos_con_estado.loc[mask, 'estado'] = 'CRÍTICO'
-        
-        # Aplicar filtros
-        filtros_activos = []
         if st.session_state.get('filtro_no_escaneados', False):
-            filtros_activos.append(productos_con_estado['estado'] == 'NO ESCANEADO')
-        if st.session_state.get('filtro_exactos', True):
-            filtros_activos.append(productos_con_estado['estado'] == 'EXACTO')
-        if st.session_state.get('filtro_leves', True):
-            filtros_activos.append(productos_con_estado['estado'] == 'LEVE')
-        if st.session_state.get('filtro_criticas', True):
-            filtros_activos.append(productos_con_estado['estado'] == 'CRÍTICO')
-        
-        if filtros_activos:
-            mask_final = filtros_activos[0]
-            for mask in filtros_activos[1:]:
-                mask_final = mask_final | mask
-            productos_filtrados = productos_con_estado[mask_final]
+            # Solo pendientes: se leen del conjunto mantenido, sin conciliar todo el catálogo
+            productos_filtrados = db.obtener_productos_con_escaneado(marcas_del_filtro(), solo_no_escaneados=True)
+            productos_filtrados['diferencia'] = 0
+            productos_filtrados['estado'] = conciliacion.NO_ESCANEADO
+            total_listado = total_productos_sistema
         else:
-            productos_filtrados = productos_con_estado
+            # Combinar datos de stock con el último conteo de cada producto (tabla ultimo_conteo)
+            ultimos = db.obtener_ultimos_conteos().set_index('codigo')
+            productos_con_estado = stock_df.copy()
+            contado = productos_con_estado['codigo'].isin(ultimos.index).to_numpy()
+            productos_con_estado['conteo_fisico'] = productos_con_estado['codigo'].map(ultimos['conteo_fisico']).fillna(0).astype(int)
+            productos_con_estado['diferencia'] = productos_con_estado['codigo'].map(ultimos['diferencia']).fillna(0).astype(int)
+            productos_con_estado['estado'] = conciliacion.clasificar(productos_con_estado['diferencia'], contado=contado)
+        
+            # Aplicar filtros
+            filtros_activos = []
+            if st.session_state.get('filtro_exactos', True):
+                filtros_activos.append(productos_con_estado['estado'] == 'EXACTO')
+            if st.session_state.get('filtro_leves', True):
+                filtros_activos.append(productos_con_estado['estado'] == 'LEVE')
+            if st.session_state.get('filtro_criticas', True):
+                filtros_activos.append(productos_con_estado['estado'] == 'CRÍTICO')
+        
+            if filtros_activos:
+                mask_final = filtros_activos[0]
+                for mask in filtros_activos[1:]:
+                    mask_final = mask_final | mask
+                productos_filtrados = productos_con_estado[mask_final]
+            else:
+                productos_filtrados = productos_con_estado
         
-        # Mostrar tabla
-        st.dataframe(
+            total_listado = len(productos_con_estado)
+        
+        # Mostrar tabla (solo la página visible)
+        mostrar_tabla_paginada(
             productos_filtrados[['codigo', 'producto', 'area', 'stock_sistema', 'conteo_fisico', 'diferencia', 'estado']],
-            width='stretch',
-            hide_index=True,
+            key="tabla_dashboard",
             column_config={
                 'diferencia': st.column_config.NumberColumn(format="%+d")
             }
         )
         
-        st.caption(f"Mostrando {len(productos_filtrados)} de {len(productos_con_estado)} productos")
+        st.caption(f"Mostrando {len(productos_filtrados)} de {total_listado} productos")
         
     else:
         st.info("No hay datos de conteo disponibles")
@@ -728,25 +746,27 @@ def mostrar_dashboard():
         st.subheader("📋 Últimos Productos")
         if not stock_df.empty:
             ultimos_productos = stock_df.tail(5)[["codigo", "producto", "marca", "area", "stock_sistema"]]
-            st.dataframe(ultimos_productos, width='stretch', hide_index=True)
+            st.dataframe(ultimos_productos, use_container_width=True, hide_index=True)
         else:
             st.info("No hay productos registrados")
     
     with col_center:
         st.subheader("📈 Últimos Conteos")
-        if not conteos_df.empty:
-            ultimos_conteos = conteos_df.tail(5)[["fecha", "producto", "diferencia"]].copy()
+        # Tabla ultimo_conteo (LIMIT 5), en el mismo orden que antes: el más reciente al final
+        ultimos_conteos = db.obtener_conteos_recientes(5).iloc[::-1][["fecha", "producto", "diferencia"]].copy()
+        if not ultimos_conteos.empty:
             ultimos_conteos["fecha"] = pd.to_datetime(ultimos_conteos["fecha"], errors='coerce').dt.strftime("%H:%M")
-            st.dataframe(ultimos_conteos, width='stretch', hide_index=True)
+            st.dataframe(ultimos_conteos, use_container_width=True, hide_index=True)
         else:
             st.info("No hay conteos registrados")
     
     with col_right:
         st.subheader("📱 Últimos Escaneos")
-        if not escaneos_df.empty:
-            ultimos_escaneos = escaneos_df.tail(5)[["timestamp", "codigo", "cantidad_escaneada"]].copy()
+        # Solo las últimas líneas de la bitácora, leídas desde el final del archivo
+        ultimos_escaneos = leer_ultimos_escaneos(5)[["timestamp", "codigo", "cantidad_escaneada"]].copy()
+        if not ultimos_escaneos.empty:
             ultimos_escaneos["timestamp"] = pd.to_datetime(ultimos_escaneos["timestamp"], errors='coerce').dt.strftime("%H:%M:%S")
-            st.dataframe(ultimos_escaneos, width='stretch', hide_index=True)
+            st.dataframe(ultimos_escaneos, use_container_width=True, hide_index=True)
         else:
             st.info("No hay escaneos registrados")
     
@@ -758,27 +778,25 @@ def mostrar_dashboard():
         st.markdown("---")
         st.subheader(f"📊 Mis Estadísticas - {st.session_state.nombre}")
         
-        mis_conteos = conteos_df[conteos_df["usuario"] == st.session_state.nombre]
-        mis_escaneos = escaneos_df[escaneos_df["usuario"] == st.session_state.nombre] if not escaneos_df.empty else pd.DataFrame()
+        # Totales mantenidos por usuario y día (no filtra el historial completo)
+        mis_estadisticas = db.obtener_estadisticas_usuario(st.session_state.nombre)
+        hoy = db.obtener_estadisticas_usuario(st.session_state.nombre, datetime.now().strftime("%Y-%m-%d"))
         
-        if not mis_conteos.empty:
+        if mis_estadisticas['conteos'] > 0:
             col_stat1, col_stat2, col_stat3, col_stat4 = st.columns(4)
             
             with col_stat1:
-                st.metric("Mis conteos", len(mis_conteos))
+                st.metric("Mis conteos", mis_estadisticas['conteos'], delta=f"{hoy['conteos']} hoy", delta_color="off")
             
             with col_stat2:
-                mis_exactos = len(mis_conteos[mis_conteos["diferencia"] == 0])
-                st.metric("Mis exactos", mis_exactos)
+                st.metric("Mis exactos", mis_estadisticas['exactos'], delta=f"{hoy['exactos']} hoy", delta_color="off")
             
             with col_stat3:
-                if len(mis_conteos) > 0:
-                    mi_precision = (mis_exactos / len(mis_conteos)) * 100
-                    st.metric("Mi precisión", f"{mi_precision:.1f}%")
+                st.metric("Mi precisión", f"{mis_estadisticas['precision']:.1f}%")
             
             with col_stat4:
-                if not mis_escaneos.empty:
-                    st.metric("Mis escaneos", len(mis_escaneos))
+                if mis_estadisticas['escaneos'] > 0:
+                    st.metric("Mis escaneos", mis_estadisticas['escaneos'], delta=f"{hoy['escaneos']} hoy", delta_color="off")
 
 # ======================================================
 # 2️⃣ PÁGINA: CARGA DE STOCK (MODIFICADA PARA INCLUIR MARCA)
@@ -877,6 +895,36 @@ def mostrar_carga_stock():
 # ======================================================
 # 3️⃣ PÁGINA: IMPORTAR DESDE EXCEL (MODIFICADA)
 # ======================================================
+def huella_archivos(archivos, regla):
+    """Huella SHA-256 de los archivos subidos (en orden) y la regla de duplicados"""
+    huella = hashlib.sha256(regla.encode())
+    for archivo in archivos:
+        huella.update(hashlib.sha256(archivo.getvalue()).digest())
+    return huella.hexdigest()
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def leer_excel_stock(huella, _archivos, regla):
+    """
+    Leer todas las hojas de los archivos subidos en paralelo; archivos con la
+    misma huella reutilizan la lectura anterior. Devuelve (DataFrame, informe).
+    """
+    with tempfile.TemporaryDirectory(prefix="importacion_") as directorio:
+        rutas = []
+        for i, archivo in enumerate(_archivos):
+            ruta = os.path.join(directorio, f"{i}_{os.path.basename(archivo.name)}")
+            with open(ruta, "wb") as f:
+                f.write(archivo.getvalue())
+            rutas.append((archivo.name, ruta))
+        return leer_archivos_stock(rutas, regla)
+
+def registrar_importacion_en_sesion(**datos):
+    """Registrar en el historial una importación sin escritura, una sola vez por archivo y sesión"""
+    clave = (datos['huella'], datos['resultado'])
+    registradas = st.session_state.setdefault('importaciones_registradas', set())
+    if clave not in registradas:
+        db.registrar_importacion(**datos)
+        registradas.add(clave)
+
 def mostrar_importar_excel():
     """Mostrar página de importación desde Excel - VERSIÓN OPTIMIZADA"""
     if not tiene_permiso("admin"):
@@ -889,7 +937,8 @@ def mostrar_importar_excel():
     
     with st.expander("📋 Instrucciones de formato", expanded=True):
         st.info("""
-        **El archivo Excel debe tener estas columnas:**
+        **Cada hoja debe tener estas columnas** (se leen todas las hojas de todos los
+        archivos; las hojas sin estas columnas se omiten):
         
         1. **codigo** - Código único del producto
         2. **producto** - Nombre del producto
@@ -908,177 +957,172 @@ def mostrar_importar_excel():
         
         st.dataframe(ejemplo, use_container_width=True)
     
+    with st.expander("🕘 Historial de importaciones"):
+        historial = db.obtener_historial_importaciones()
+        if historial.empty:
+            st.info("📭 Aún no hay importaciones registradas")
+        else:
+            st.dataframe(
+                historial.drop(columns=['huella', 'eliminar_faltantes', 'version_catalogo']),
+                use_container_width=True, hide_index=True,
+                column_config={
+                    "segundos_lectura": st.column_config.NumberColumn("Lectura (s)", format="%.2f"),
+                    "segundos_comparacion": st.column_config.NumberColumn("Comparación (s)", format="%.2f"),
+                    "segundos_escritura": st.column_config.NumberColumn("Escritura (s)", format="%.2f"),
+                }
+            )
+    
     st.markdown("---")
     
     st.subheader("📁 Subir archivo Excel")
     
-    archivo = st.file_uploader("Selecciona tu archivo Excel (.xlsx, .xls)", type=["xlsx", "xls"])
+    archivos = st.file_uploader("Selecciona tus archivos Excel (.xlsx, .xls)", type=["xlsx", "xls"],
+                                accept_multiple_files=True,
+                                help="Se leen todas las hojas de todos los archivos")
     
-    if archivo is not None:
+    if archivos:
         try:
-            with st.spinner("📊 Procesando archivo..."):
-                # Leer solo las columnas necesarias para ser más rápido
-                df_excel = pd.read_excel(archivo, dtype=str, usecols=lambda x: x.lower() in ['codigo', 'producto', 'marca', 'area', 'stock_sistema'])
+            regla = st.selectbox(
+                "🔁 Si un código aparece en varias hojas o archivos",
+                list(REGLAS_DUPLICADOS),
+                format_func=REGLAS_DUPLICADOS.get
+            )
+            eliminar_faltantes = st.checkbox(
+                "🗑️ Eliminar productos que no vienen en los archivos",
+                value=False,
+                help="Si no se marca, los productos ausentes del archivo se conservan"
+            )
             
-            st.success(f"✅ Archivo cargado: {archivo.name}")
+            huella = huella_archivos(archivos, regla)
+            datos_importacion = {'usuario': st.session_state.nombre,
+                                 'archivo': ", ".join(archivo.name for archivo in archivos),
+                                 'huella': huella}
             
-            with st.expander("👁️ Vista previa", expanded=True):
-                st.dataframe(df_excel.head(10), use_container_width=True)
+            # Mismo contenido ya importado y catálogo intacto desde entonces: ni leer ni comparar
+            previa = db.importacion_vigente(huella, eliminar_faltantes)
+            if previa is not None:
+                st.success(f"✅ Estos archivos ya se importaron el {previa['fecha']} ({previa['usuario']}) "
+                           f"y el catálogo no cambió desde entonces")
+                st.info("ℹ️ No hay cambios que aplicar; se omitió la lectura de los archivos")
+                registrar_importacion_en_sesion(
+                    resultado='OMITIDA', filas=previa['filas'], sin_cambios=previa['filas'],
+                    eliminar_faltantes=previa['eliminar_faltantes'], **datos_importacion
+                )
+                return
+            
+            inicio = time.perf_counter()
+            with st.spinner("📊 Procesando archivos..."):
+                df_excel, informe = leer_excel_stock(huella, archivos, regla)
+            segundos_lectura = time.perf_counter() - inicio
+            
+            st.success(f"✅ {informe['hojas_leidas']} hojas leídas de {len(archivos)} archivos "
+                       f"({informe['filas_leidas']} filas, {informe['procesos']} procesos, "
+                       f"{segundos_lectura:.1f} s)")
             
-            # Verificar columnas requeridas
-            columnas_requeridas = {"codigo", "producto", "area", "stock_sistema"}
-            columnas_encontradas = set(df_excel.columns.str.lower() if hasattr(df_excel.columns, 'str') else set(df_excel.columns))
+            if not informe['hojas_omitidas'].empty:
+                st.warning(f"⚠️ {len(informe['hojas_omitidas'])} hojas omitidas por no tener las columnas requeridas")
+                st.dataframe(informe['hojas_omitidas'], use_container_width=True, hide_index=True)
             
-            # Normalizar nombres de columnas
-            df_excel.columns = df_excel.columns.str.lower() if hasattr(df_excel.columns, 'str') else df_excel.columns
+            duplicados = informe['duplicados']
+            if not duplicados.empty:
+                st.info(f"🔁 {len(duplicados)} códigos aparecen más de una vez; "
+                        f"regla aplicada: {REGLAS_DUPLICADOS[regla].lower()}")
+                with st.expander("🔁 Ver códigos repetidos"):
+                    st.dataframe(duplicados.head(1000), use_container_width=True, hide_index=True)
             
-            if columnas_requeridas.issubset(columnas_encontradas):
-                st.success("✅ Columnas verificadas correctamente")
+            with st.expander("👁️ Vista previa", expanded=True):
+                st.dataframe(df_excel.head(10), use_container_width=True)
+            
+            if informe['hojas_leidas'] == 0:
+                st.error("❌ Ninguna hoja tiene las columnas requeridas: codigo, producto, area, stock_sistema")
+            else:
+                total_registros = len(df_excel)
+                st.info(f"📊 Total de productos a importar (sin repetidos): {total_registros}")
                 
-                # Verificar si hay columna 'marca'
-                if 'marca' not in df_excel.columns:
-                    df_excel['marca'] = 'SIN MARCA'
-                    st.info("ℹ️ No se encontró columna 'marca'. Se usará 'SIN MARCA' por defecto.")
+                # Comparar con el catálogo actual antes de escribir nada
+                inicio = time.perf_counter()
+                cambios = db.calcular_cambios_catalogo(df_excel, eliminar_faltantes)
+                segundos_comparacion = time.perf_counter() - inicio
                 
-                total_registros = len(df_excel)
-                st.info(f"📊 Total de registros a importar: {total_registros}")
+                n_nuevos, n_modificados = len(cambios['nuevos']), len(cambios['modificados'])
+                n_eliminados = len(cambios['eliminados'])
+                hay_cambios = n_nuevos + n_modificados + n_eliminados > 0
+                datos_importacion.update(
+                    filas=total_registros, nuevos=n_nuevos, modificados=n_modificados,
+                    eliminados=n_eliminados, sin_cambios=cambios['sin_cambios'],
+                    eliminar_faltantes=int(eliminar_faltantes),
+                    segundos_lectura=segundos_lectura, segundos_comparacion=segundos_comparacion
+                )
+                
+                st.subheader("🔍 Cambios detectados")
+                colc1, colc2, colc3, colc4 = st.columns(4)
+                with colc1:
+                    st.metric("🆕 Nuevos", n_nuevos)
+                with colc2:
+                    st.metric("✏️ Modificados", n_modificados)
+                with colc3:
+                    st.metric("✔️ Sin cambios", cambios['sin_cambios'])
+                with colc4:
+                    st.metric("🗑️ A eliminar", n_eliminados)
+                
+                if n_modificados:
+                    with st.expander("✏️ Ver productos modificados (valores nuevos)"):
+                        st.dataframe(cambios['modificados'].head(1000), use_container_width=True, hide_index=True)
+                if n_nuevos:
+                    with st.expander("🆕 Ver productos nuevos"):
+                        st.dataframe(cambios['nuevos'].head(1000), use_container_width=True, hide_index=True)
+                if n_eliminados:
+                    st.warning(f"⚠️ Se eliminarán {n_eliminados} productos que no están en el archivo")
                 
                 col1, col2 = st.columns(2)
                 with col1:
-                    if st.button("🚀 Importar datos (Rápido)", type="primary", use_container_width=True):
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-                        
+                    if not hay_cambios:
+                        st.info("ℹ️ El catálogo ya coincide con el archivo: no hay cambios que aplicar")
+                        registrar_importacion_en_sesion(resultado='SIN CAMBIOS', **datos_importacion)
+                    elif st.button("🚀 Aplicar cambios", type="primary", use_container_width=True):
                         try:
-                            # Preparar datos
-                            status_text.text("Preparando datos...")
-                            
-                            # Limpiar códigos y convertir stock
-                            df_excel["codigo"] = df_excel["codigo"].apply(limpiar_codigo)
-                            df_excel["stock_sistema"] = pd.to_numeric(df_excel["stock_sistema"], errors='coerce').fillna(0).astype(int)
-                            
-                            # Crear lista de productos para batch insert
-                            productos_batch = []
-                            marcas_unicas = set()
+                            inicio = time.perf_counter()
+                            with st.spinner("Guardando cambios en base de datos..."):
+                                aplicados = db.aplicar_cambios_catalogo(cambios)
+                            db.registrar_importacion(resultado='APLICADA',
+                                                     segundos_escritura=time.perf_counter() - inicio,
+                                                     **datos_importacion)
                             
-                            for idx, row in df_excel.iterrows():
-                                productos_batch.append({
-                                    'codigo': row["codigo"],
-                                    'producto': row["producto"],
-                                    'marca': row["marca"],
-                                    'area': row["area"],
-                                    'stock_sistema': row["stock_sistema"]
-                                })
-                                marcas_unicas.add(row["marca"])
-                                
-                                # Actualizar progreso cada 100 registros
-                                if idx % 100 == 0:
-                                    progress = (idx + 1) / total_registros
-                                    progress_bar.progress(progress)
-                                    status_text.text(f"Procesando {idx + 1} de {total_registros}...")
-                            
-                            # Guardar en batch
-                            status_text.text("Guardando en base de datos...")
-                            db.guardar_productos_batch(productos_batch)
-                            
-                            # Crear marcas nuevas
-                            status_text.text("Registrando marcas...")
-                            for marca in marcas_unicas:
-                                db.crear_marca(marca)
-                            
-                            progress_bar.progress(1.0)
-                            status_text.text("¡Importación completada!")
-                            
-                            st.success(f"✅ {total_registros} productos importados correctamente")
+                            st.success(f"✅ Importación completada: {aplicados['nuevos']} nuevos, "
+                                       f"{aplicados['modificados']} modificados, {aplicados['eliminados']} eliminados")
                             st.balloons()
                             
                         except Exception as e:
+                            db.registrar_importacion(resultado='ERROR', **datos_importacion)
                             st.error(f"❌ Error durante la importación: {str(e)}")
                 
                 with col2:
                     if st.button("📋 Ver muestra de datos", use_container_width=True):
                         st.dataframe(df_excel.head(20), use_container_width=True)
-            else:
-                st.error(f"❌ Faltan columnas requeridas. Necesitas: {columnas_requeridas}")
-                st.write("Columnas encontradas:", list(columnas_encontradas))
                 
         except Exception as e:
-            st.error(f"❌ Error al leer el archivo: {str(e)}")
+            st.error(f"❌ Error al leer los archivos: {str(e)}")
 
 # ======================================================
 # 4️⃣ PÁGINA: CONTEO FÍSICO (MODIFICADA PARA MARCAS)
 # ======================================================
-def mostrar_conteo_fisico():
-    """Mostrar página de conteo físico"""
-    if not tiene_permiso("inventario"):
-        st.error("⛔ No tienes permisos para acceder a esta sección")
-        st.info("Solo usuarios con rol 'inventario' o 'admin' pueden realizar conteos")
-        return
-
-    st.title("🔢 Conteo Físico")
-    st.markdown("---")
-
-    # Cargar datos
-    stock_df = cargar_stock()
-    usuario_actual = st.session_state.nombre
+@st.fragment
+def mostrar_panel_escaneo(tienda, usuario_actual, marca_seleccionada, marcas):
+    """
+    Producto actual, formulario de escaneo y acciones del Conteo Físico.
+    Es un fragmento: registrar un escaneo vuelve a ejecutar solo esta parte,
+    no la página completa (barra lateral, marcas, volcado).
+
+    La tienda llega como argumento porque Streamlit vuelve a ejecutar el
+    fragmento en otro hilo, donde la tienda fijada por main() no existe.
+    """
+    db.usar_tienda(tienda)
     hoy = datetime.now().strftime("%Y-%m-%d")
-    
-    # Selector de marca
-    marcas = db.obtener_todas_marcas()
-    marca_seleccionada = st.selectbox(
-        "🏷️ Filtrar por marca",
-        ["Todas"] + marcas,
-        key="marca_conteo"
-    )
-    
-    if marca_seleccionada != "Todas":
-        stock_df = stock_df[stock_df["marca"] == marca_seleccionada]
-
-    # --- FUNCIÓN PARA VER EL CSV ---
-    def mostrar_contenido_csv():
-        if os.path.exists(ARCHIVO_ESCANEOS):
-            try:
-                df = pd.read_csv(ARCHIVO_ESCANEOS)
-                st.write(f"**Total de registros en CSV:** {len(df)}")
-                st.dataframe(df.tail(10))
-                return df
-            except Exception as e:
-                st.error(f"Error leyendo CSV: {e}")
-        else:
-            st.warning("⚠️ El archivo CSV NO EXISTE")
-        return None
-
-    # --- FUNCIÓN PARA CALCULAR TOTAL ---
-    def total_escaneado_hoy(usuario, codigo):
-        """Calcula el total escaneado hoy por un usuario para un código específico"""
-        if not os.path.exists(ARCHIVO_ESCANEOS):
-            return 0
-
-        try:
-            df = pd.read_csv(ARCHIVO_ESCANEOS)
-            if df.empty or 'cantidad_escaneada' not in df.columns:
-                return 0
-
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-            df['fecha'] = df['timestamp'].dt.strftime('%Y-%m-%d')
-            hoy = datetime.now().strftime('%Y-%m-%d')
-
-            mask = (df['fecha'] == hoy) & (df['usuario'] == usuario) & (df['codigo'].astype(str) == str(codigo))
-            df_filtrado = df[mask]
-
-            if df_filtrado.empty:
-                return 0
-
-            total = pd.to_numeric(df_filtrado['cantidad_escaneada'], errors='coerce').fillna(0).sum()
-            return int(total)
-        except Exception as e:
-            st.error(f"Error calculando total: {e}")
-            return 0
 
     # --- Determinar producto actual ---
     if st.session_state.producto_actual_conteo:
         codigo_actual = st.session_state.producto_actual_conteo.get('codigo')
-        producto_en_stock = stock_df[stock_df["codigo"].astype(str) == str(codigo_actual)]
+        producto_en_stock = buscar_producto_conteo(codigo_actual, marca_seleccionada)
         
         if not producto_en_stock.empty:
             prod = producto_en_stock.iloc[0]
@@ -1093,28 +1137,21 @@ def mostrar_conteo_fisico():
         else:
             st.session_state.producto_actual_conteo = None
 
-    # Si no hay producto en sesión, buscar el último escaneado
-    if not st.session_state.producto_actual_conteo and os.path.exists(ARCHIVO_ESCANEOS):
+    # Si no hay producto en sesión, buscar el último escaneado (en la base, no en la bitácora)
+    if not st.session_state.producto_actual_conteo:
         try:
-            df_temp = pd.read_csv(ARCHIVO_ESCANEOS)
-            if not df_temp.empty and 'timestamp' in df_temp.columns:
-                df_temp['timestamp'] = pd.to_datetime(df_temp['timestamp'], errors='coerce')
-                df_temp = df_temp[df_temp['usuario'] == usuario_actual]
-                if not df_temp.empty:
-                    ultimo = df_temp.sort_values('timestamp', ascending=False).iloc[0]
-                    codigo_ultimo = str(ultimo['codigo']).strip() if 'codigo' in ultimo else None
-                    
-                    if codigo_ultimo:
-                        producto_en_stock = stock_df[stock_df["codigo"].astype(str) == codigo_ultimo]
-                        if not producto_en_stock.empty:
-                            prod = producto_en_stock.iloc[0]
-                            st.session_state.producto_actual_conteo = {
-                                'codigo': prod["codigo"],
-                                'nombre': prod["producto"],
-                                'marca': prod.get("marca", "SIN MARCA"),
-                                'area': prod["area"],
-                                'stock_sistema': int(prod["stock_sistema"])
-                            }
+            codigo_ultimo = db.obtener_ultimo_codigo_usuario(usuario_actual)
+            if codigo_ultimo:
+                producto_en_stock = buscar_producto_conteo(codigo_ultimo, marca_seleccionada)
+                if not producto_en_stock.empty:
+                    prod = producto_en_stock.iloc[0]
+                    st.session_state.producto_actual_conteo = {
+                        'codigo': prod["codigo"],
+                        'nombre': prod["producto"],
+                        'marca': prod.get("marca", "SIN MARCA"),
+                        'area': prod["area"],
+                        'stock_sistema': int(prod["stock_sistema"])
+                    }
         except Exception as e:
             st.error(f"Error al buscar último escaneo: {e}")
 
@@ -1148,21 +1185,16 @@ def mostrar_conteo_fisico():
             diferencia = total_contado - prod['stock_sistema']
             st.metric("Diferencia", f"{diferencia:+d}", delta=diferencia)
         with colm4:
-            # Total escaneos hoy del usuario
-            total_hoy = 0
-            if os.path.exists(ARCHIVO_ESCANEOS):
-                try:
-                    df_temp = pd.read_csv(ARCHIVO_ESCANEOS)
-                    if not df_temp.empty and 'timestamp' in df_temp.columns:
-                        df_temp['fecha'] = pd.to_datetime(df_temp['timestamp']).dt.strftime('%Y-%m-%d')
-                        total_hoy = len(df_temp[(df_temp['fecha'] == hoy) & (df_temp['usuario'] == usuario_actual)])
-                except:
-                    pass
-            st.metric("Mis escaneos hoy", total_hoy)
+            # Total escaneos hoy del usuario (estadísticas mantenidas, sin leer la bitácora)
+            st.metric("Mis escaneos hoy", db.obtener_estadisticas_usuario(usuario_actual, hoy)['escaneos'])
 
     # --- Formulario de escaneo ---
     st.markdown("---")
     st.subheader("📷 Escanear producto")
+    
+    # Resultado del último escaneo (se registró en la ejecución anterior del fragmento)
+    if st.session_state.get('mensaje_escaneo'):
+        st.success(st.session_state.pop('mensaje_escaneo'))
 
     with st.form("form_escaneo", clear_on_submit=True):
         codigo = st.text_input("Código del producto", placeholder="Escanee o ingrese el código")
@@ -1184,7 +1216,7 @@ def mostrar_conteo_fisico():
         if not codigo_limpio:
             st.error("❌ Ingrese un código")
         else:
-            producto_encontrado = stock_df[stock_df["codigo"].astype(str) == str(codigo_limpio)]
+            producto_encontrado = buscar_producto_conteo(codigo_limpio, marca_seleccionada)
 
             if producto_encontrado.empty:
                 st.error(f"❌ Producto '{codigo_limpio}' no encontrado")
@@ -1202,70 +1234,12 @@ def mostrar_conteo_fisico():
                                 st.success(f"✅ Producto creado")
                                 st.rerun()
             else:
-                # Procesar escaneo
-                prod = producto_encontrado.iloc[0]
-                
-                # Calcular total anterior
-                total_anterior = total_escaneado_hoy(usuario_actual, codigo_limpio)
-                nuevo_total = total_anterior + cantidad
-
-                # --- GUARDAR ESCANEO ---
-                timestamp_actual = datetime.now()
-                
-                # Crear DataFrame con TODAS las columnas necesarias
-                nuevo_registro = pd.DataFrame([{
-                    "timestamp": timestamp_actual,
-                    "usuario": usuario_actual,
-                    "codigo": codigo_limpio,
-                    "producto": prod["producto"],
-                    "marca": prod.get("marca", "SIN MARCA"),
-                    "area": prod["area"],
-                    "cantidad_escaneada": int(cantidad),
-                    "total_acumulado": int(nuevo_total),
-                    "stock_sistema": int(prod["stock_sistema"]),
-                    "tipo_operacion": "ESCANEO"
-                }])
-
-                # Guardar en CSV
-                if os.path.exists(ARCHIVO_ESCANEOS):
-                    df_existente = pd.read_csv(ARCHIVO_ESCANEOS)
-                    df_final = pd.concat([df_existente, nuevo_registro], ignore_index=True)
-                else:
-                    df_final = nuevo_registro
-
-                df_final.to_csv(ARCHIVO_ESCANEOS, index=False)
-
-                # Registrar en base de datos
-                db.registrar_conteo(
-                    usuario_actual,
-                    codigo_limpio,
-                    prod["producto"],
-                    prod.get("marca", "SIN MARCA"),
-                    prod["area"],
-                    int(prod["stock_sistema"]),
-                    nuevo_total
-                )
-
-                # Actualizar resumen de conteos
-                actualizar_resumen_conteo(
-                    usuario_actual, codigo_limpio, prod["producto"],
-                    prod["area"], int(prod["stock_sistema"]), nuevo_total
-                )
-
-                # Actualizar sesión
-                st.session_state.producto_actual_conteo = {
-                    'codigo': codigo_limpio,
-                    'nombre': prod["producto"],
-                    'marca': prod.get("marca", "SIN MARCA"),
-                    'area': prod["area"],
-                    'stock_sistema': int(prod["stock_sistema"])
-                }
-                st.session_state.conteo_actual_session = nuevo_total
-                st.session_state.total_escaneos_session += 1
+                # Procesar escaneo (bitácora, base de datos, resumen y ritmo)
+                nuevo_total = procesar_escaneo_en_conteo(codigo_limpio, cantidad, producto_encontrado)
 
-                st.success(f"✅ +{cantidad} = {nuevo_total}")
-                time.sleep(0.5)
-                st.rerun()
+                if nuevo_total is not None:
+                    st.session_state.mensaje_escaneo = f"✅ +{cantidad} = {nuevo_total}"
+                    recargar_panel_escaneo()
 
     # --- Botones de acción con NUEVO BOTÓN DE LIMPIAR ---
     if st.session_state.producto_actual_conteo:
@@ -1276,13 +1250,13 @@ def mostrar_conteo_fisico():
             if st.button("🔄 Cambiar producto", use_container_width=True):
                 st.session_state.producto_actual_conteo = None
                 st.session_state.conteo_actual_session = 0
-                st.rerun()
+                recargar_panel_escaneo()
         
         with col_acc2:
             if st.button("📋 Ver historial", use_container_width=True):
-                if os.path.exists(ARCHIVO_ESCANEOS):
+                if os.path.exists(archivo_escaneos()):
                     try:
-                        df_temp = pd.read_csv(ARCHIVO_ESCANEOS)
+                        df_temp = leer_csv(archivo_escaneos())
                         if not df_temp.empty and 'timestamp' in df_temp.columns:
                             df_temp['timestamp'] = pd.to_datetime(df_temp['timestamp'])
                             historial = df_temp[
@@ -1310,50 +1284,109 @@ def mostrar_conteo_fisico():
             col_conf1, col_conf2 = st.columns(2)
             with col_conf1:
                 if st.button("✅ Sí, reiniciar", key="confirm_si_limpiar"):
-                    # Eliminar escaneos del producto actual para hoy
-                    if os.path.exists(ARCHIVO_ESCANEOS):
-                        df_temp = pd.read_csv(ARCHIVO_ESCANEOS)
-                        if not df_temp.empty:
-                            # Filtrar para excluir los escaneos de hoy de este producto
-                            hoy = datetime.now().strftime("%Y-%m-%d")
-                            df_temp['fecha'] = pd.to_datetime(df_temp['timestamp']).dt.strftime('%Y-%m-%d')
-                            mask = ~((df_temp['fecha'] == hoy) & 
-                                    (df_temp['usuario'] == usuario_actual) & 
-                                    (df_temp['codigo'].astype(str) == str(st.session_state.producto_actual_conteo['codigo'])))
-                            df_temp_filtrado = df_temp[mask]
-                            
-                            # Eliminar columna fecha antes de guardar
-                            if 'fecha' in df_temp_filtrado.columns:
-                                df_temp_filtrado = df_temp_filtrado.drop('fecha', axis=1)
-                            
-                            df_temp_filtrado.to_csv(ARCHIVO_ESCANEOS, index=False)
-                            
-                            # Actualizar sesión
-                            st.session_state.conteo_actual_session = 0
-                            
-                            # Actualizar resumen de conteos (eliminar registro)
-                            conteos_df = cargar_conteos()
-                            if not conteos_df.empty:
-                                hoy = datetime.now().strftime("%Y-%m-%d")
-                                mask_conteos = ~((conteos_df["usuario"] == usuario_actual) & 
-                                               (conteos_df["codigo"] == str(st.session_state.producto_actual_conteo['codigo'])) & 
-                                               (conteos_df["fecha"].str.startswith(hoy)))
-                                conteos_df = conteos_df[mask_conteos]
-                                guardar_conteos(conteos_df)
-                            
-                            st.session_state.mostrar_confirmacion_limpieza = False
-                            st.success("✅ Conteo reiniciado exitosamente")
-                            time.sleep(1)
-                            st.rerun()
+                    # Evento RESET en la bitácora: no se reescriben los archivos
+                    actual = st.session_state.producto_actual_conteo
+                    exito, resultado = reiniciar_conteo(usuario_actual, actual['codigo'], {
+                        'producto': actual['nombre'],
+                        'marca': actual['marca'],
+                        'area': actual['area'],
+                        'stock_sistema': actual['stock_sistema']
+                    })
+                    st.session_state.mostrar_confirmacion_limpieza = False
+                    if exito:
+                        st.session_state.conteo_actual_session = 0
+                        st.session_state.mensaje_escaneo = "✅ Conteo reiniciado exitosamente"
+                        recargar_panel_escaneo()
+                    else:
+                        st.error(f"❌ {resultado}")
             
             with col_conf2:
                 if st.button("❌ Cancelar", key="confirm_no_limpiar"):
                     st.session_state.mostrar_confirmacion_limpieza = False
-                    st.rerun()
+                    recargar_panel_escaneo()
+
+def mostrar_conteo_fisico():
+    """Mostrar página de conteo físico"""
+    if not tiene_permiso("inventario"):
+        st.error("⛔ No tienes permisos para acceder a esta sección")
+        st.info("Solo usuarios con rol 'inventario' o 'admin' pueden realizar conteos")
+        return
+
+    st.title("🔢 Conteo Físico")
+    st.markdown("---")
+
+    usuario_actual = st.session_state.nombre
+    
+    # Selector de marca
+    marcas = db.obtener_todas_marcas()
+    marca_seleccionada = st.selectbox(
+        "🏷️ Filtrar por marca",
+        ["Todas"] + marcas,
+        key="marca_conteo"
+    )
+
+    # --- FUNCIÓN PARA VER EL CSV ---
+    def mostrar_contenido_csv():
+        if os.path.exists(archivo_escaneos()):
+            try:
+                df = leer_csv(archivo_escaneos())
+                st.write(f"**Total de registros en CSV:** {len(df)}")
+                st.dataframe(df.tail(10))
+                return df
+            except Exception as e:
+                st.error(f"Error leyendo CSV: {e}")
+        else:
+            st.warning("⚠️ El archivo CSV NO EXISTE")
+        return None
+
+    mostrar_panel_escaneo(db.tienda_actual(), usuario_actual, marca_seleccionada, marcas)
+
+    # --- Carga de volcado de escáner sin conexión ---
+    with st.expander("📤 Cargar volcado de escáner (sin conexión)"):
+        st.caption("Archivo .txt o .csv con una lectura por línea: código, código y cantidad, o código, "
+                   "cantidad y fecha y hora (separados por coma, punto y coma, tabulador o espacio).")
+        archivo_volcado = st.file_uploader("Archivo del escáner", type=["txt", "csv"], key="volcado_escaner")
+        fecha_volcado = st.date_input("Fecha del volcado", datetime.now().date(), max_value=datetime.now().date(),
+                                      help="Para las lecturas que no traen su propia fecha y hora")
+
+        if archivo_volcado is not None and st.button("📥 Registrar volcado", type="primary"):
+            with st.spinner("Registrando lecturas..."):
+                exito, resultado = registrar_volcado_escaner(usuario_actual, archivo_volcado, fecha_volcado)
+
+            if not exito:
+                st.error(f"❌ {resultado}")
+            else:
+                st.success(f"✅ {resultado['aceptados']:,} lecturas registradas "
+                           f"({resultado['unidades']:,} unidades, {resultado['productos']:,} productos) "
+                           f"de {resultado['lineas']:,} líneas")
+
+                desconocidos = resultado['desconocidos']
+                if not desconocidos.empty:
+                    st.warning(f"⚠️ {len(desconocidos):,} códigos no existen en el catálogo "
+                               f"({int(desconocidos['lineas'].sum()):,} líneas sin registrar)")
+                    st.dataframe(desconocidos, use_container_width=True, hide_index=True,
+                                 column_config={
+                                     "codigo": "Código", "lineas": "Líneas",
+                                     "unidades": "Unidades", "primera_fila": "Primera línea"
+                                 })
+
+                invalidos = resultado['invalidos']
+                if not invalidos.empty:
+                    st.warning(f"⚠️ {len(invalidos):,} líneas con código vacío, cantidad inválida o fecha inválida")
+                    st.dataframe(invalidos.head(1000), use_container_width=True, hide_index=True,
+                                 column_config={"fila": "Línea", "codigo": "Código", "cantidad": "Cantidad",
+                                                "momento": "Fecha"})
 
 # ======================================================
 # 5️⃣ PÁGINA: REPORTES POR MARCA (VERSIÓN SIN TABLA RESUMEN)
 # ======================================================
+COLUMNAS_DETALLE_MARCA = ['codigo', 'producto', 'marca', 'area', 'stock_sistema',
+                          'conteo_fisico', 'diferencia', 'estado']
+
+def agregar_estado_marca(df, hay_escaneos):
+    """Agregar diferencia y estado al detalle por marca (tabla y exportación)"""
+    return conciliacion.conciliar(df, conciliacion.SIGNO, contado=None if hay_escaneos else False)
+
 def mostrar_reportes_marca():
     """Mostrar reportes detallados por marca - VERSIÓN SIN TABLA RESUMEN"""
     st.title("🏷️ Reporte por Marcas")
@@ -1362,7 +1395,6 @@ def mostrar_reportes_marca():
     try:
         # Cargar datos necesarios
         stock_df = cargar_stock()
-        escaneos_df = cargar_escaneos_detallados()
         
         if stock_df.empty:
             st.warning("No hay productos en el sistema")
@@ -1372,13 +1404,6 @@ def mostrar_reportes_marca():
         if 'marca' not in stock_df.columns:
             stock_df['marca'] = 'SIN MARCA'
         
-        # CONVERTIR TODOS LOS CÓDIGOS A STRING
-        stock_df['codigo'] = stock_df['codigo'].astype(str)
-        if not escaneos_df.empty:
-            escaneos_df['codigo'] = escaneos_df['codigo'].astype(str)
-            if 'marca' not in escaneos_df.columns:
-                escaneos_df['marca'] = 'SIN MARCA'
-        
         # Obtener marcas únicas
         marcas = stock_df['marca'].unique().tolist()
         marcas = [m for m in marcas if pd.notna(m) and m != '']
@@ -1388,6 +1413,21 @@ def mostrar_reportes_marca():
             st.warning("No hay marcas disponibles")
             return
         
+        # Avance del conteo por marca (conjunto de pendientes mantenido en la base)
+        st.subheader("📈 Avance del conteo por marca")
+        mostrar_tabla_paginada(
+            db.obtener_avance(),
+            key="tabla_avance_marcas",
+            column_config={
+                'marca': 'Marca',
+                'productos': 'Productos',
+                'contados': 'Contados',
+                'pendientes': 'Pendientes',
+                'avance': st.column_config.ProgressColumn('Avance', format="%.1f%%", min_value=0, max_value=100)
+            },
+            tam_pagina=25
+        )
+        
         st.markdown("---")
         
         # Selector de marcas para ver detalle (MULTISELECT)
@@ -1409,35 +1449,21 @@ def mostrar_reportes_marca():
                 # Checkbox para filtrar
                 solo_no_escaneados = st.checkbox("Mostrar solo productos NO escaneados")
                 
-                # Obtener productos de las marcas seleccionadas
-                productos_marcas = stock_df[stock_df['marca'].isin(marcas_seleccionadas)].copy()
+                # Productos de las marcas seleccionadas con su cantidad escaneada
+                # (agregado por código mantenido en la base en cada escaneo);
+                # con el filtro, solo el conjunto de pendientes
+                asegurar_agregados()
+                avance = db.obtener_avance(marcas=marcas_seleccionadas)
+                productos_marcas = db.obtener_productos_con_escaneado(marcas_seleccionadas, solo_no_escaneados)
                 
                 # Agregar información de conteo
-                if not escaneos_df.empty:
-                    escaneos_marcas = escaneos_df[escaneos_df['marca'].isin(marcas_seleccionadas)]
-                    
-                    if not escaneos_marcas.empty:
-                        escaneos_agrupados = escaneos_marcas.groupby('codigo').agg({
-                            'cantidad_escaneada': 'sum'
-                        }).reset_index()
-                        
-                        conteo_dict = dict(zip(escaneos_agrupados['codigo'], escaneos_agrupados['cantidad_escaneada']))
-                        productos_marcas['conteo_fisico'] = productos_marcas['codigo'].map(conteo_dict).fillna(0).astype(int)
-                    else:
-                        productos_marcas['conteo_fisico'] = 0
-                    
-                    productos_marcas['diferencia'] = productos_marcas['conteo_fisico'] - productos_marcas['stock_sistema']
-                    productos_marcas['estado'] = productos_marcas['diferencia'].apply(
-                        lambda x: '✅ Exacto' if x == 0 else ('⚠️ Sobrante' if x > 0 else '🔻 Faltante')
-                    )
-                else:
-                    productos_marcas['conteo_fisico'] = 0
-                    productos_marcas['diferencia'] = 0
-                    productos_marcas['estado'] = 'NO ESCANEADO'
+                hay_escaneos = bool(avance['contados'].sum()) or bool(productos_marcas['conteo_fisico'].any())
+                productos_marcas = agregar_estado_marca(productos_marcas, hay_escaneos)
                 
-                # Aplicar filtro
-                if solo_no_escaneados:
-                    productos_marcas = productos_marcas[productos_marcas['conteo_fisico'] == 0]
+                contados_marcas = int(avance['contados'].sum())
+                total_marcas = int(avance['productos'].sum())
+                st.progress(contados_marcas / total_marcas if total_marcas else 0.0,
+                            text=f"Avance: {contados_marcas} de {total_marcas} productos contados")
                 
                 if not productos_marcas.empty:
                     # Calcular estadísticas
@@ -1492,23 +1518,12 @@ def mostrar_reportes_marca():
                         'Stock Sis.', 'Conteo', 'Diferencia', 'Estado'
                     ]
                     
-                    # Formatear la columna Diferencia
-                    df_tabla['Diferencia'] = df_tabla['Diferencia'].apply(lambda x: f"{int(x):+d}")
-                    
-                    # Mostrar la tabla sin estilos de color
-                    st.dataframe(
+                    # Mostrar la tabla por páginas; Diferencia sigue siendo numérica para ordenar
+                    mostrar_tabla_paginada(
                         df_tabla,
-                        use_container_width=True,
-                        hide_index=True,
+                        key="tabla_detalle_marcas",
                         column_config={
-                            'Código': 'Código',
-                            'Producto': 'Producto',
-                            'Marca': 'Marca',
-                            'Área': 'Área',
-                            'Stock Sis.': 'Stock Sis.',
-                            'Conteo': 'Conteo',
-                            'Diferencia': 'Diferencia',
-                            'Estado': 'Estado'
+                            'Diferencia': st.column_config.NumberColumn('Diferencia', format="%+d")
                         }
                     )
                     
@@ -1517,14 +1532,33 @@ def mostrar_reportes_marca():
                     
                     # Botón para exportar
                     if st.button("📥 Exportar detalle a CSV", use_container_width=True):
-                        csv = productos_marcas.to_csv(index=False).encode('utf-8')
+                        # Exportación por bloques desde la base, con el mismo filtro de la vista
+                        bloques = (agregar_estado_marca(bloque, hay_escaneos)
+                                   for bloque in db.iterar_productos_con_escaneado(marcas_seleccionadas,
+                                                                                   solo_no_escaneados))
+                        with metricas.medir("csv.exportar.detalle_marcas"):
+                            ruta = volcar_a_archivo(csv_por_bloques(bloques, COLUMNAS_DETALLE_MARCA))
                         marcas_str = "_".join(marcas_seleccionadas)[:50]
-                        st.download_button(
+                        ofrecer_descarga(
                             "⬇️ Descargar CSV",
-                            data=csv,
+                            ruta,
                             file_name=f"detalle_{marcas_str}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
                             mime="text/csv"
                         )
+                    
+                    # Exportar a Excel: una hoja por marca más un resumen
+                    if st.button("📗 Exportar conciliación a Excel", use_container_width=True):
+                        bloques = (agregar_estado_marca(bloque, hay_escaneos)
+                                   for bloque in db.iterar_productos_con_escaneado(marcas_seleccionadas,
+                                                                                   solo_no_escaneados,
+                                                                                   ordenar_por_marca=True))
+                        ruta = escribir_conciliacion_excel(bloques)
+                        ofrecer_descarga(
+                            "⬇️ Descargar Excel",
+                            ruta,
+                            file_name=nombre_archivo_excel("conciliacion_marcas"),
+                            mime=MIME_EXCEL
+                        )
                 else:
                     st.info(f"No hay productos para mostrar en las marcas seleccionadas")
             else:
@@ -1543,82 +1577,215 @@ def mostrar_reportes():
     st.title("📊 Reportes de Conteo")
     st.markdown("---")
     
-    # Pestañas para diferentes vistas
-    tab1, tab2, tab3 = st.tabs(["📈 Resumen General", "🏷️ Por Marcas", "📋 Historial Completo"])
+    vistas = ["📈 Resumen General", "🏷️ Por Marcas", "📋 Historial Completo", "📉 Entre Campañas"]
+    if tiene_permiso("admin"):
+        vistas.append("🏬 Por Tienda")
+    
+    # Selector de vista: a diferencia de st.tabs, solo se ejecuta la vista activa
+    vista = st.radio(
+        "Vista",
+        vistas,
+        horizontal=True,
+        key="vista_reportes",
+        label_visibility="collapsed"
+    )
     
-    with tab1:
+    if vista == "📈 Resumen General":
         mostrar_resumen_general()
-    
-    with tab2:
+    elif vista == "🏷️ Por Marcas":
         # Integrar el reporte por marcas
         mostrar_reportes_marca()
-    
-    with tab3:
+    elif vista == "🏬 Por Tienda":
+        mostrar_resumen_tiendas()
+    elif vista == "📉 Entre Campañas":
+        mostrar_comparacion_campanas()
+    else:
         mostrar_historial_completo()
 
-def mostrar_resumen_general():
-    """Mostrar resumen general de conteos - CON MARCA INCLUIDA"""
+@st.cache_data(max_entries=4, show_spinner=False)
+def calcular_comparacion_campanas(version, n, marca):
+    """Comparación entre campañas cacheada por versión de datos"""
+    return db.comparar_campanas(n, marca)
+
+def mostrar_comparacion_campanas():
+    """Diferencia de cada producto en las últimas campañas: tendencia de mermas"""
+    total_campanas = len(db.listar_campanas())
+    if total_campanas < 2:
+        st.info("Aún no hay campañas archivadas para comparar (ver ⚙️ Configuración → Campañas de conteo)")
+        return
+    
+    col_f1, col_f2 = st.columns(2)
+    with col_f1:
+        n = st.number_input("Campañas a comparar", min_value=2, max_value=total_campanas,
+                            value=min(3, total_campanas), step=1)
+    with col_f2:
+        marca = st.selectbox("🏷️ Marca", ["Todas"] + db.obtener_todas_marcas(), key="marca_comparacion")
+    
+    df, columnas = calcular_comparacion_campanas(version_datos(), int(n), marca)
+    
+    # Faltante en todas las campañas comparadas en que se contó (al menos dos)
+    recurrentes = (df['contadas'] >= 2) & (df[columnas].lt(0).sum(axis=1) == df['contadas'])
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📦 Productos", f"{len(df):,}")
+    with col2:
+        st.metric("🔁 Contados en todas", f"{int((df['contadas'] == len(columnas)).sum()):,}")
+    with col3:
+        st.metric("🔻 Faltante recurrente", f"{int(recurrentes.sum()):,}")
+    with col4:
+        st.metric("📉 Empeoran", f"{int((df['tendencia'] < 0).sum()):,}",
+                  help="Productos cuya diferencia en la última campaña contada es menor que en la primera")
+    
+    formato = {col: st.column_config.NumberColumn(col, format="%+d") for col in columnas}
+    mostrar_tabla_paginada(
+        df,
+        key="tabla_comparacion_campanas",
+        orden_defecto='promedio',
+        column_config={
+            'codigo': 'Código',
+            'producto': 'Producto',
+            'marca': 'Marca',
+            'area': 'Área',
+            'stock_sistema': 'Stock Sis.',
+            **formato,
+            'contadas': 'Campañas contadas',
+            'promedio': st.column_config.NumberColumn('Promedio', format="%+.1f"),
+            'tendencia': st.column_config.NumberColumn('Tendencia', format="%+d")
+        }
+    )
+    
+    if st.button("📥 Exportar comparación", use_container_width=True):
+        ruta = volcar_a_archivo(csv_por_bloques([df], list(df.columns)))
+        ofrecer_descarga(
+            "⬇️ Descargar CSV",
+            ruta,
+            file_name=f"comparacion_campanas_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+            mime="text/csv"
+        )
+
+def mostrar_resumen_tiendas():
+    """Comparativo entre tiendas; cada tienda se consulta en paralelo en su propia base"""
+    resumenes = db.en_todas_las_tiendas(db.resumen_tienda)
+    df = pd.DataFrame([{'tienda': tienda, **resumen} for tienda, resumen in resumenes.items()])
+    
+    contados = int(df['productos_contados'].sum())
+    exactos = int(df['exactos'].sum())
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🏬 Tiendas", len(df))
+    with col2:
+        st.metric("📦 Productos", f"{int(df['productos'].sum()):,}")
+    with col3:
+        st.metric("🔢 Productos contados", f"{contados:,}")
+    with col4:
+        st.metric("🎯 Precisión global", f"{(exactos / contados * 100) if contados else 0:.1f}%")
+    
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'tienda': 'Tienda',
+            'productos': 'Productos',
+            'stock_total': 'Stock total',
+            'productos_contados': 'Contados',
+            'conteo_total': 'Unidades contadas',
+            'diferencia_neta': st.column_config.NumberColumn('Diferencia neta', format="%+d"),
+            'exactos': 'Exactos',
+            'leves': 'Leves',
+            'criticos': 'Críticos',
+            'precision': st.column_config.NumberColumn('Precisión', format="%.1f%%")
+        }
+    )
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def calcular_resumen_general(version):
+    """
+    Resumen por producto (con marca) y métricas de escaneo.
+    Cacheado por versión de datos: solo se recalcula si cambian los archivos o la base.
+    """
     conteos_df = cargar_conteos()
     escaneos_df = cargar_escaneos_detallados()
     
+    # Los eventos RESET restan unidades pero no cuentan como escaneos
+    escaneos_validos = sin_reinicios(escaneos_df)
+    metricas_escaneo = {
+        'total_escaneos': len(escaneos_validos),
+        'productos_contados': escaneos_validos['codigo'].nunique() if not escaneos_df.empty else 0,
+        'total_unidades': int(escaneos_df['cantidad_escaneada'].sum()) if not escaneos_df.empty else 0,
+        'usuarios_activos': escaneos_validos['usuario'].nunique() if not escaneos_df.empty else 0
+    }
+    
+    if escaneos_df.empty:
+        return None, metricas_escaneo, not conteos_df.empty
+    
+    # Asegurar que los códigos sean strings
+    escaneos_df['codigo'] = escaneos_df['codigo'].astype(str)
+    
+    # Verificar si existe la columna 'marca' en escaneos_df
+    if 'marca' not in escaneos_df.columns:
+        escaneos_df['marca'] = 'SIN MARCA'
+    
+    # Crear resumen por producto (INCLUYENDO MARCA)
+    resumen_precision = escaneos_df.groupby(['codigo', 'producto', 'marca', 'area']).agg({
+        'cantidad_escaneada': 'sum'
+    }).reset_index()
+    
+    resumen_precision.columns = ['codigo', 'producto', 'marca', 'area', 'conteo_fisico']
+    
+    # Productos cuyo conteo se reinició y no se volvió a escanear
+    reiniciados = escaneos_df.loc[escaneos_df['tipo_operacion'] == TIPO_RESET, 'codigo']
+    if not reiniciados.empty:
+        sin_conteo = (resumen_precision['conteo_fisico'] <= 0) & resumen_precision['codigo'].isin(reiniciados)
+        resumen_precision = resumen_precision[~sin_conteo].reset_index(drop=True)
+        metricas_escaneo['productos_contados'] = resumen_precision['codigo'].nunique()
+    
+    # Cargar stock
+    stock_df = cargar_stock()
+    if not stock_df.empty:
+        stock_df['codigo'] = stock_df['codigo'].astype(str)
+        stock_df_subset = stock_df[['codigo', 'stock_sistema']].copy()
+    else:
+        stock_df_subset = pd.DataFrame(columns=['codigo', 'stock_sistema'])
+    
+    # Merge con stock
+    if not stock_df_subset.empty:
+        resumen_precision = resumen_precision.merge(
+            stock_df_subset, 
+            on='codigo', 
+            how='left'
+        )
+    else:
+        resumen_precision['stock_sistema'] = 0
+    
+    # Llenar valores nulos
+    resumen_precision['stock_sistema'] = resumen_precision['stock_sistema'].fillna(0).astype(int)
+    
+    # Calcular diferencias (las tablas muestran primero la mayor diferencia absoluta)
+    conciliacion.conciliar(resumen_precision, conciliacion.SIGNO)
+    
+    return resumen_precision, metricas_escaneo, not conteos_df.empty
+
+def mostrar_resumen_general():
+    """Mostrar resumen general de conteos - CON MARCA INCLUIDA"""
+    resumen_precision, metricas_escaneo, hay_conteos = calcular_resumen_general(version_datos())
+    
     # ==============================================
     # SECCIÓN 1: TABLA DE PRODUCTOS (PRIMERO) - CON MARCA
     # ==============================================
-    if not escaneos_df.empty:
+    if resumen_precision is not None:
         st.subheader("📋 Detalle de productos escaneados")
         
-        # Asegurar que los códigos sean strings
-        escaneos_df['codigo'] = escaneos_df['codigo'].astype(str)
-        
-        # Verificar si existe la columna 'marca' en escaneos_df
-        if 'marca' not in escaneos_df.columns:
-            escaneos_df['marca'] = 'SIN MARCA'
-        
-        # Crear resumen por producto (INCLUYENDO MARCA)
-        resumen_precision = escaneos_df.groupby(['codigo', 'producto', 'marca', 'area']).agg({
-            'cantidad_escaneada': 'sum'
-        }).reset_index()
-        
-        resumen_precision.columns = ['codigo', 'producto', 'marca', 'area', 'conteo_fisico']
-        
-        # Cargar stock
-        stock_df = cargar_stock()
-        if not stock_df.empty:
-            stock_df['codigo'] = stock_df['codigo'].astype(str)
-            stock_df_subset = stock_df[['codigo', 'stock_sistema']].copy()
-        else:
-            stock_df_subset = pd.DataFrame(columns=['codigo', 'stock_sistema'])
-        
-        # Merge con stock
-        if not stock_df_subset.empty:
-            resumen_precision = resumen_precision.merge(
-                stock_df_subset, 
-                on='codigo', 
-                how='left'
-            )
-        else:
-            resumen_precision['stock_sistema'] = 0
-        
-        # Llenar valores nulos
-        resumen_precision['stock_sistema'] = resumen_precision['stock_sistema'].fillna(0).astype(int)
-        
-        # Calcular diferencias
-        resumen_precision['diferencia'] = resumen_precision['conteo_fisico'] - resumen_precision['stock_sistema']
-        resumen_precision['estado'] = resumen_precision['diferencia'].apply(
-            lambda x: '✅ Exacto' if x == 0 else ('⚠️ Sobrante' if x > 0 else '🔻 Faltante')
-        )
-        
-        # Ordenar por diferencia absoluta (mayor primero)
-        resumen_precision['abs_diferencia'] = resumen_precision['diferencia'].abs()
-        resumen_precision = resumen_precision.sort_values('abs_diferencia', ascending=False).drop('abs_diferencia', axis=1)
-        
         # Mostrar tabla de productos CON MARCA
         columnas_mostrar = ['codigo', 'producto', 'marca', 'area', 'stock_sistema', 'conteo_fisico', 'diferencia', 'estado']
         
-        st.dataframe(
+        mostrar_tabla_paginada(
             resumen_precision[columnas_mostrar],
-            use_container_width=True,
-            hide_index=True,
+            key="tabla_resumen_general",
+            orden_defecto=conciliacion.ORDEN_DIFERENCIA_ABSOLUTA,
+            descendente=True,
             column_config={
                 'codigo': 'Código',
                 'producto': 'Producto',
@@ -1633,16 +1800,26 @@ def mostrar_resumen_general():
         
         st.caption(f"📊 Mostrando {len(resumen_precision)} productos escaneados")
         
+        if st.button("📗 Exportar conciliación a Excel", key="excel_resumen_general", use_container_width=True):
+            ruta = escribir_conciliacion_excel(bloques_por_marca(resumen_precision))
+            ofrecer_descarga(
+                "⬇️ Descargar Excel",
+                ruta,
+                file_name=nombre_archivo_excel("conciliacion_general"),
+                mime=MIME_EXCEL
+            )
+        
         # ==============================================
         # EXPANDER: VER SOLO PRODUCTOS CON DIFERENCIAS (CON MARCA)
         # ==============================================
         with st.expander("🔍 Ver solo productos con diferencias"):
             productos_con_diferencia = resumen_precision[resumen_precision['diferencia'] != 0].copy()
             if not productos_con_diferencia.empty:
-                st.dataframe(
+                mostrar_tabla_paginada(
                     productos_con_diferencia[columnas_mostrar],
-                    use_container_width=True,
-                    hide_index=True,
+                    key="tabla_resumen_diferencias",
+                    orden_defecto=conciliacion.ORDEN_DIFERENCIA_ABSOLUTA,
+                    descendente=True,
                     column_config={
                         'diferencia': st.column_config.NumberColumn(format="%+d")
                     }
@@ -1661,7 +1838,7 @@ def mostrar_resumen_general():
     # ==============================================
     st.subheader("📈 Métricas Principales")
     
-    if escaneos_df.empty:
+    if resumen_precision is None:
         col_m1, col_m2, col_m3, col_m4 = st.columns(4)
         with col_m1:
             st.metric("📦 Productos contados", 0)
@@ -1672,11 +1849,11 @@ def mostrar_resumen_general():
         with col_m4:
             st.metric("👥 Usuarios activos", 0)
     else:
-        # Calcular métricas de escaneos
-        total_escaneos = len(escaneos_df)
-        productos_contados = escaneos_df['codigo'].nunique()
-        total_unidades = escaneos_df['cantidad_escaneada'].sum()
-        usuarios_activos = escaneos_df['usuario'].nunique()
+        # Métricas de escaneos (calculadas junto con el resumen)
+        total_escaneos = metricas_escaneo['total_escaneos']
+        productos_contados = metricas_escaneo['productos_contados']
+        total_unidades = metricas_escaneo['total_unidades']
+        usuarios_activos = metricas_escaneo['usuarios_activos']
         
         # Mostrar en 4 columnas
         col_m1, col_m2, col_m3, col_m4 = st.columns(4)
@@ -1704,7 +1881,7 @@ def mostrar_resumen_general():
     # ==============================================
     st.subheader("🎯 Análisis de Precisión")
     
-    if not conteos_df.empty and not escaneos_df.empty and 'resumen_precision' in locals():
+    if hay_conteos and resumen_precision is not None:
         # Agregar filtro por marca
         if 'marca' in resumen_precision.columns:
             marcas_disponibles = ['Todas'] + sorted(resumen_precision['marca'].unique().tolist())
@@ -1768,9 +1945,9 @@ def mostrar_resumen_general():
     
     else:
         # Si no hay datos suficientes
-        if escaneos_df.empty:
+        if resumen_precision is None:
             st.info("📭 No hay escaneos registrados para analizar")
-        elif 'resumen_precision' not in locals():
+        elif not hay_conteos:
             st.info("📊 No hay suficientes datos para el análisis de precisión")
         else:
             # Mostrar métricas en cero
@@ -1784,9 +1961,14 @@ def mostrar_resumen_general():
             with col_p4:
                 st.metric("📊 Diferencia neta", "+0")
 
+@st.cache_data(max_entries=2, show_spinner=False)
+def cargar_historial(version):
+    """Bitácora de escaneos cacheada por versión de datos"""
+    return cargar_escaneos_detallados()
+
 def mostrar_historial_completo():
     """Mostrar historial completo de escaneos"""
-    escaneos_df = cargar_escaneos_detallados()
+    escaneos_df = cargar_historial(version_datos())
     
     if not escaneos_df.empty:
         st.subheader("📋 Historial de Escaneos")
@@ -1813,20 +1995,25 @@ def mostrar_historial_completo():
         if 'usuario_filtro' in locals() and usuario_filtro != "Todos":
             df_filtrado = df_filtrado[df_filtrado['usuario'] == usuario_filtro]
         
-        st.dataframe(
-            df_filtrado.sort_values('timestamp', ascending=False),
-            use_container_width=True,
-            hide_index=True
+        mostrar_tabla_paginada(
+            df_filtrado,
+            key="tabla_historial",
+            orden_defecto='timestamp',
+            descendente=True
         )
         
         st.metric("Registros mostrados", len(df_filtrado))
         
         # Botón exportar
         if st.button("📥 Exportar historial filtrado", use_container_width=True):
-            csv = df_filtrado.to_csv(index=False).encode('utf-8')
-            st.download_button(
+            # Exportación por bloques leyendo la bitácora con los mismos filtros
+            usuario_export = usuario_filtro if 'usuario_filtro' in locals() else None
+            bloques = iterar_escaneos(fecha_inicio, fecha_fin, usuario_export)
+            with metricas.medir("csv.exportar.historial"):
+                ruta = volcar_a_archivo(csv_por_bloques(bloques, COLUMNAS_ESCANEOS + ['fecha']))
+            ofrecer_descarga(
                 "⬇️ Descargar CSV",
-                data=csv,
+                ruta,
                 file_name=f"historial_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
                 mime="text/csv"
             )
@@ -1863,9 +2050,12 @@ def mostrar_gestion_usuarios():
                 nuevo_password = st.text_input("Contraseña *", type="password")
                 nuevo_rol = st.selectbox("Rol *", ["admin", "inventario", "consulta"])
             
+            nueva_tienda = st.text_input("Tienda *", value=db.tienda_actual(),
+                                         help="Cada tienda guarda sus productos y conteos en su propia base")
+            
             if st.form_submit_button("👤 Crear Usuario", use_container_width=True):
-                if nuevo_username and nuevo_nombre and nuevo_password:
-                    exito, mensaje = crear_usuario(nuevo_username, nuevo_nombre, nuevo_password, nuevo_rol)
+                if nuevo_username and nuevo_nombre and nuevo_password and nueva_tienda.strip():
+                    exito, mensaje = crear_usuario(nuevo_username, nuevo_nombre, nuevo_password, nuevo_rol, nueva_tienda)
                     if exito:
                         st.success(mensaje)
                         st.rerun()
@@ -1911,6 +2101,7 @@ def mostrar_gestion_usuarios():
                 with col2:
                     st.write(f"**Rol:** {usuario['rol']}")
                     st.write(f"**Estado:** {'✅ Activo' if usuario['activo'] == '1' else '❌ Inactivo'}")
+                    st.write(f"**Tienda:** {usuario['tienda']}")
                 
                 with col3:
                     # Botón para editar (abre formulario de edición)
@@ -1935,28 +2126,35 @@ def mostrar_gestion_usuarios():
                             nuevo_estado_edit = st.selectbox("Estado", ["Activo", "Inactivo"],
                                                             index=0 if usuario['activo'] == '1' else 1)
                         
+                        nueva_tienda_edit = st.text_input("Tienda", value=usuario['tienda'])
                         nueva_password_edit = st.text_input("Nueva contraseña (dejar en blanco para no cambiar)", type="password")
                         
                         col_btn1, col_btn2, col_btn3 = st.columns(3)
                         
                         with col_btn1:
                             if st.form_submit_button("💾 Guardar cambios", type="primary", use_container_width=True):
-                                cambios_realizados = False
+                                tienda_edit = nueva_tienda_edit.strip() or db.TIENDA_POR_DEFECTO
+                                tienda_valida, mensaje_tienda = db.registrar_tienda(tienda_edit)
+                                if not tienda_valida:
+                                    st.error(f"❌ {mensaje_tienda}")
+                                else:
+                                    cambios_realizados = False
                                 
-                                # Actualizar datos
-                                usuarios_df.loc[idx, 'nombre'] = nuevo_nombre_edit
-                                usuarios_df.loc[idx, 'rol'] = nuevo_rol_edit
-                                usuarios_df.loc[idx, 'activo'] = '1' if nuevo_estado_edit == "Activo" else '0'
+                                    # Actualizar datos
+                                    usuarios_df.loc[idx, 'nombre'] = nuevo_nombre_edit
+                                    usuarios_df.loc[idx, 'rol'] = nuevo_rol_edit
+                                    usuarios_df.loc[idx, 'activo'] = '1' if nuevo_estado_edit == "Activo" else '0'
+                                    usuarios_df.loc[idx, 'tienda'] = tienda_edit
                                 
-                                # Actualizar contraseña si se proporcionó una nueva
-                                if nueva_password_edit:
-                                    usuarios_df.loc[idx, 'password'] = hash_password(nueva_password_edit)
-                                    cambios_realizados = True
+                                    # Actualizar contraseña si se proporcionó una nueva
+                                    if nueva_password_edit:
+                                        usuarios_df.loc[idx, 'password'] = hash_password(nueva_password_edit)
+                                        cambios_realizados = True
                                 
-                                guardar_usuarios(usuarios_df)
-                                st.session_state[f"editando_{usuario['username']}"] = False
-                                st.success(f"✅ Usuario {usuario['username']} actualizado correctamente")
-                                st.rerun()
+                                    guardar_usuarios(usuarios_df)
+                                    st.session_state[f"editando_{usuario['username']}"] = False
+                                    st.success(f"✅ Usuario {usuario['username']} actualizado correctamente")
+                                    st.rerun()
                         
                         with col_btn2:
                             if st.form_submit_button("❌ Cancelar", use_container_width=True):
@@ -2034,6 +2232,18 @@ def mostrar_sidebar():
         st.write(f"**Rol:** {st.session_state.rol.upper()}")
         st.write(f"**Usuario:** {st.session_state.usuario}")
         
+        # Los administradores pueden trabajar sobre cualquier tienda
+        if tiene_permiso("admin"):
+            tiendas = db.listar_tiendas()
+            tienda = db.tienda_actual()
+            nueva_tienda = st.selectbox("🏬 Tienda", tiendas,
+                                        index=tiendas.index(tienda) if tienda in tiendas else 0)
+            if nueva_tienda != tienda:
+                st.session_state.tienda = nueva_tienda
+                st.rerun()
+        else:
+            st.write(f"**Tienda:** {db.tienda_actual()}")
+        
         # Botón para cambiar contraseña (siempre visible)
         if st.button("🔐 Cambiar contraseña", use_container_width=True, key="btn_cambiar_pass"):
             st.session_state.mostrar_cambiar_pass = True
@@ -2107,14 +2317,13 @@ def mostrar_sidebar():
         
         st.markdown("---")
         
-        stock_df = cargar_stock()
-        conteos_df = cargar_conteos()
+        contadores = cargar_contadores()
         
         col_info1, col_info2 = st.columns(2)
         with col_info1:
-            st.metric("📦 Productos", len(stock_df))
+            st.metric("📦 Productos", contadores['productos'])
         with col_info2:
-            st.metric("🔢 Conteos", len(conteos_df))
+            st.metric("🔢 Conteos", contadores['conteos'])
         
         st.markdown("---")
         
@@ -2158,7 +2367,7 @@ def mostrar_configuracion():
         st.caption(f"Activos: {activos}")
     
     with col4:
-        st.metric("Escaneos totales", len(escaneos_df) if not escaneos_df.empty else 0)
+        st.metric("Escaneos totales", len(sin_reinicios(escaneos_df)) if not escaneos_df.empty else 0)
     
     st.markdown("---")
     
@@ -2167,10 +2376,10 @@ def mostrar_configuracion():
     if st.button("📁 Crear backup completo", use_container_width=True):
         fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        stock_df.to_csv(f"backup_stock_{fecha}.csv", index=False)
-        conteos_df.to_csv(f"backup_conteos_{fecha}.csv", index=False)
-        usuarios_df.to_csv(f"backup_usuarios_{fecha}.csv", index=False)
-        escaneos_df.to_csv(f"backup_escaneos_{fecha}.csv", index=False)
+        escribir_csv(stock_df, db.ruta_tienda(f"backup_stock_{fecha}.csv"), operacion="csv.escribir.backup", index=False)
+        escribir_csv(conteos_df, db.ruta_tienda(f"backup_conteos_{fecha}.csv"), operacion="csv.escribir.backup", index=False)
+        escribir_csv(usuarios_df, f"backup_usuarios_{fecha}.csv", operacion="csv.escribir.backup", index=False)
+        escribir_csv(escaneos_df, db.ruta_tienda(f"backup_escaneos_{fecha}.csv"), operacion="csv.escribir.backup", index=False)
         
         st.success(f"✅ Backup creado: backup_{fecha}.csv")
         st.info("Se crearon 4 archivos de backup")
@@ -2178,97 +2387,101 @@ def mostrar_configuracion():
     st.markdown("---")
     
     # ======================================================
-    # NUEVA SECCIÓN: LIMPIAR TODO EL CONTEO
+    # SECCIÓN: RENDIMIENTO (TIEMPOS POR OPERACIÓN)
     # ======================================================
-    st.subheader("🧹 Limpiar todo el conteo")
-    st.warning("⚠️ **Área de alto riesgo** - Estas acciones son irreversibles")
+    st.subheader("⏱️ Rendimiento")
+    st.caption(f"Percentiles de las últimas {metricas.MUESTRAS_POR_OPERACION} ejecuciones de cada página, función de base de datos y lectura/escritura CSV")
     
-    with st.expander("🛑 Haga clic para ver opciones de limpieza total", expanded=False):
+    resumen_tiempos = metricas.resumen()
+    if resumen_tiempos:
+        st.dataframe(
+            pd.DataFrame(resumen_tiempos),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'operacion': 'Operación',
+                'muestras': 'Muestras',
+                'p50_ms': st.column_config.NumberColumn('p50 (ms)', format="%.1f"),
+                'p95_ms': st.column_config.NumberColumn('p95 (ms)', format="%.1f"),
+                'p99_ms': st.column_config.NumberColumn('p99 (ms)', format="%.1f"),
+                'max_ms': st.column_config.NumberColumn('Máx (ms)', format="%.1f"),
+                'total_s': st.column_config.NumberColumn('Total (s)', format="%.2f")
+            }
+        )
+    else:
+        st.info("Aún no hay mediciones registradas")
+    
+    col_met1, col_met2 = st.columns(2)
+    with col_met1:
+        if st.button("💾 Exportar métricas", use_container_width=True):
+            ruta = metricas.exportar()
+            st.success(f"✅ Métricas guardadas en {ruta}")
+    with col_met2:
+        if st.button("🔄 Reiniciar métricas", use_container_width=True):
+            metricas.reiniciar()
+            st.rerun()
+    
+    st.markdown("---")
+    
+    # ======================================================
+    # SECCIÓN: CAMPAÑAS DE CONTEO
+    # ======================================================
+    st.subheader("🗂️ Campañas de conteo")
+    st.caption("Cada ciclo de inventario es una campaña. Iniciar una nueva archiva la actual "
+               "(solo lectura) sin borrar conteos ni escaneos; las páginas muestran solo la campaña activa.")
+    
+    campanas_df = db.listar_campanas()
+    activa = campanas_df[campanas_df['activa']].iloc[0]
+    st.info(f"📌 Campaña activa: **{activa['nombre']}** (#{activa['id']})")
+    
+    st.dataframe(
+        campanas_df.assign(estado=campanas_df['activa'].map({True: "Activa", False: "Archivada"}))
+                   .drop(columns='activa'),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'id': 'N°',
+            'nombre': 'Campaña',
+            'inicio': 'Inicio',
+            'fin': 'Fin',
+            'productos_contados': 'Productos contados',
+            'exactos': 'Exactos',
+            'estado': 'Estado'
+        }
+    )
+    
+    with st.expander("🆕 Iniciar nueva campaña", expanded=False):
         st.markdown("""
-        ### ⚠️ ADVERTENCIA
-        - Esta acción eliminará **TODOS** los conteos y escaneos
-        - Afectará a **TODOS** los usuarios
-        - Los productos en stock **NO** se eliminarán
-        - **No se puede deshacer**
+        - La campaña activa queda **archivada** con sus conteos y escaneos
+        - Afectará a **TODOS** los usuarios: el conteo vuelve a empezar en 0
+        - Los productos en stock **NO** cambian
         """)
         
-        # Checkbox de confirmación
-        confirmacion1 = st.checkbox("✅ Entiendo que esto eliminará TODOS los conteos y escaneos")
+        nombre_campana = st.text_input("Nombre de la campaña", placeholder=f"Inventario {datetime.now().strftime('%Y-%m')}")
+        confirmacion = st.checkbox("✅ Entiendo que el conteo actual quedará archivado")
         
-        if confirmacion1:
-            st.markdown("---")
-            st.markdown("### 🔴 Confirmación final")
-            st.markdown("Para proceder, escriba **'ELIMINAR TODO'** en el campo de texto:")
-            
-            texto_confirmacion = st.text_input("Confirmación de seguridad", type="password")
-            
-            col_btn1, col_btn2, col_btn3 = st.columns([1, 1, 2])
-            
-            with col_btn1:
-                if st.button("🧹 LIMPIAR TODO", type="primary", use_container_width=True, disabled=texto_confirmacion != "ELIMINAR TODO"):
-                    if texto_confirmacion == "ELIMINAR TODO":
-                        try:
-                            # Crear backup automático antes de limpiar
-                            fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            backup_dir = "backups_automaticos"
-                            
-                            # Crear directorio de backups si no existe
-                            if not os.path.exists(backup_dir):
-                                os.makedirs(backup_dir)
-                            
-                            # Guardar backups
-                            if not stock_df.empty:
-                                stock_df.to_csv(f"{backup_dir}/backup_stock_ANTES_LIMPIEZA_{fecha}.csv", index=False)
-                            if not conteos_df.empty:
-                                conteos_df.to_csv(f"{backup_dir}/backup_conteos_ANTES_LIMPIEZA_{fecha}.csv", index=False)
-                            if not escaneos_df.empty:
-                                escaneos_df.to_csv(f"{backup_dir}/backup_escaneos_ANTES_LIMPIEZA_{fecha}.csv", index=False)
-                            
-                            # LIMPIAR ARCHIVOS DE CONTEO
-                            
-                            # 1. Limpiar escaneos_detallados.csv
-                            columnas_escaneos = ["timestamp", "usuario", "codigo", "producto", "area", "cantidad_escaneada", "total_acumulado", "stock_sistema", "tipo_operacion"]
-                            df_vacio_escaneos = pd.DataFrame(columns=columnas_escaneos)
-                            df_vacio_escaneos.to_csv(ARCHIVO_ESCANEOS, index=False)
-                            
-                            # 2. Limpiar conteos.csv
-                            columnas_conteos = ["fecha", "usuario", "codigo", "producto", "area", "stock_sistema", "conteo_fisico", "diferencia"]
-                            df_vacio_conteos = pd.DataFrame(columns=columnas_conteos)
-                            df_vacio_conteos.to_csv(ARCHIVO_CONTEOS, index=False)
-                            
-                            # 3. Limpiar sesión del usuario actual
-                            st.session_state.producto_actual_conteo = None
-                            st.session_state.conteo_actual_session = 0
-                            st.session_state.total_escaneos_session = 0
-                            st.session_state.historial_escaneos = []
-                            
-                            # 4. Limpiar base de datos (si aplica)
-                            try:
-                                db.limpiar_todos_conteos()
-                            except:
-                                pass  # Si no existe la función, continuar
-                            
-                            st.success(f"✅ **¡TODOS LOS CONTEOS HAN SIDO ELIMINADOS!**")
-                            st.info(f"📁 Se creó un backup automático en la carpeta '{backup_dir}' antes de la limpieza")
-                            st.balloons()
-                            
-                            # Mostrar resumen de la limpieza
-                            st.markdown("### 📊 Estado actual del sistema:")
-                            col_res1, col_res2 = st.columns(2)
-                            with col_res1:
-                                st.metric("Productos en stock", len(stock_df))
-                            with col_res2:
-                                st.metric("Conteos actuales", 0)
-                            
-                            time.sleep(2)
-                            st.rerun()
-                            
-                        except Exception as e:
-                            st.error(f"❌ Error durante la limpieza: {str(e)}")
-            
-            with col_btn2:
-                if st.button("❌ Cancelar", use_container_width=True):
-                    st.rerun()
+        if st.button("🗂️ Iniciar campaña", type="primary", use_container_width=True,
+                     disabled=not (confirmacion and nombre_campana.strip())):
+            try:
+                nueva = db.iniciar_campana(nombre_campana)
+                
+                # Limpiar sesión del usuario actual
+                st.session_state.producto_actual_conteo = None
+                st.session_state.conteo_actual_session = 0
+                st.session_state.total_escaneos_session = 0
+                st.session_state.historial_escaneos = []
+                
+                st.success(f"✅ Campaña **{nombre_campana.strip()}** (#{nueva}) iniciada; la anterior quedó archivada")
+                time.sleep(1)
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error al iniciar la campaña: {str(e)}")
+
+# ======================================================
+# INSTRUMENTACIÓN DE PÁGINAS
+# ======================================================
+# Cada mostrar_* registra su duración en metricas (ver Configuración)
+metricas.instrumentar(globals(), "pagina", filtro=lambda nombre: nombre.startswith("mostrar_"))
 
 # ======================================================
 # APLICACIÓN PRINCIPAL
@@ -2277,6 +2490,9 @@ def main():
     """Función principal de la aplicación"""
     inicializar_sesion()
     
+    # Enrutar todas las lecturas y escrituras de esta ejecución a la tienda del usuario
+    db.usar_tienda(st.session_state.get('tienda'))
+    
     if not st.session_state.autenticado:
         mostrar_login()
         return
@@ -0,0 +1,7 @@
+"""
+Benchmarks con datos sintéticos para las páginas y funciones de datos.
+
+- generador: catálogos y bitácoras de escaneos sintéticas
+- stub_streamlit: sustituto de streamlit para ejecutar páginas sin navegador
+- ejecutar: corre los casos y reporta tiempo, memoria pico y filas/segundo en JSON
+"""
@@ -0,0 +1,187 @@
+"""
+Prueba de carga de la API de escaneos (api_escaneos.py) en localhost.
+
+Uso (desde la raíz del repositorio):
+
+    # Contra una API ya levantada (usuario y códigos existentes)
+    python -m benchmarks.carga_api --url http://127.0.0.1:8001 --usuario inventario \
+        --codigos 7501234,7505678
+
+    # Autónomo: genera catálogo y usuarios en un directorio temporal y
+    # levanta la API como subproceso (con un token al azar si no hay --token)
+    python -m benchmarks.carga_api --productos 20000 --lotes 400 --hilos 8
+
+Cada hilo envía lotes de --tam-lote escaneos con códigos al azar. Se reporta
+escaneos por segundo y la latencia por lote (p50/p95/p99) como JSON.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USUARIO_CARGA = "carga"
+
+
+def _percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    return ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))]
+
+
+def preparar_datos(directorio, n_productos, semilla):
+    """Catálogo en una base temporal y un usuario de inventario; devuelve los códigos"""
+    os.environ["INVENTARIO_DB"] = os.path.join(directorio, "inventario.db")
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    import pandas as pd
+    import database as db
+    from benchmarks import generador
+
+    catalogo = generador.generar_catalogo(n_productos, semilla=semilla)
+    db.guardar_productos_batch(catalogo.to_dict("records"))
+
+    pd.DataFrame([[USUARIO_CARGA, "Prueba de carga", "-", "inventario", "1", db.TIENDA_POR_DEFECTO]],
+                 columns=["username", "nombre", "password", "rol", "activo", "tienda"]
+                 ).to_csv(os.path.join(directorio, "usuarios.csv"), index=False)
+    return catalogo["codigo"].tolist()
+
+
+def levantar_api(directorio, puerto, token):
+    """Iniciar api_escaneos.py en el directorio de datos y esperar a /salud"""
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "api_escaneos.py"), "--puerto", str(puerto)],
+        cwd=directorio, env=dict(os.environ, PYTHONPATH=RAIZ, INVENTARIO_API_TOKEN=token),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    limite = time.time() + 30
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"La API terminó al iniciar: {proceso.stderr.read().decode()}")
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=1)
+            conexion.request("GET", "/salud")
+            if conexion.getresponse().status == 200:
+                return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError("La API no respondió a tiempo")
+
+
+def trabajador(url, usuario, codigos, n_lotes, tam_lote, semilla, latencias, errores, token):
+    """Enviar n_lotes por una conexión persistente"""
+    destino = urlparse(url)
+    conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=60)
+    encabezados = {"Content-Type": "application/json"}
+    if token:
+        encabezados["Authorization"] = f"Bearer {token}"
+    rng = random.Random(semilla)
+
+    for _ in range(n_lotes):
+        cuerpo = json.dumps({
+            "usuario": usuario,
+            "escaneos": [{"codigo": rng.choice(codigos), "cantidad": 1} for _ in range(tam_lote)],
+        })
+        inicio = time.perf_counter()
+        try:
+            conexion.request("POST", "/escaneos", body=cuerpo, headers=encabezados)
+            respuesta = conexion.getresponse()
+            datos = json.loads(respuesta.read())
+            if respuesta.status != 200 or datos["aceptados"] != tam_lote:
+                errores.append(datos.get("error") or datos.get("rechazados"))
+        except Exception as e:
+            errores.append(str(e))
+            conexion.close()
+            conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=60)
+        latencias.append(time.perf_counter() - inicio)
+    conexion.close()
+
+
+def ejecutar_carga(url, usuario, codigos, lotes, tam_lote, hilos, semilla, token=None):
+    """Repartir los lotes entre hilos y medir el total"""
+    latencias, errores = [], []
+    por_hilo = [lotes // hilos + (1 if i < lotes % hilos else 0) for i in range(hilos)]
+
+    inicio = time.perf_counter()
+    trabajos = [threading.Thread(target=trabajador,
+                                 args=(url, usuario, codigos, n, tam_lote, semilla + i,
+                                       latencias, errores, token))
+                for i, n in enumerate(por_hilo) if n]
+    for t in trabajos:
+        t.start()
+    for t in trabajos:
+        t.join()
+    segundos = time.perf_counter() - inicio
+
+    ordenadas = sorted(latencias)
+    escaneos = (len(latencias) - len(errores)) * tam_lote
+    return {
+        "lotes": len(latencias),
+        "tam_lote": tam_lote,
+        "hilos": hilos,
+        "errores": len(errores),
+        "primer_error": errores[0] if errores else None,
+        "escaneos": escaneos,
+        "segundos": round(segundos, 3),
+        "escaneos_por_segundo": round(escaneos / segundos, 1) if segundos else None,
+        "latencia_lote_ms": {
+            "p50": round(_percentil(ordenadas, 50) * 1000, 2) if ordenadas else None,
+            "p95": round(_percentil(ordenadas, 95) * 1000, 2) if ordenadas else None,
+            "p99": round(_percentil(ordenadas, 99) * 1000, 2) if ordenadas else None,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de escaneos")
+    parser.add_argument("--url", help="API ya levantada; sin --url se levanta una temporal")
+    parser.add_argument("--usuario", default=USUARIO_CARGA)
+    parser.add_argument("--codigos", help="Códigos separados por coma (con --url)")
+    parser.add_argument("--token", default=os.environ.get("INVENTARIO_API_TOKEN"))
+    parser.add_argument("--productos", type=int, default=20_000)
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--lotes", type=int, default=400)
+    parser.add_argument("--tam-lote", type=int, default=250)
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Guardar el resultado JSON en este archivo")
+    args = parser.parse_args(argv)
+
+    proceso = None
+    with tempfile.TemporaryDirectory(prefix="carga_api_") as directorio:
+        try:
+            if args.url:
+                if not args.codigos:
+                    parser.error("--codigos es obligatorio con --url")
+                url, codigos = args.url, args.codigos.split(",")
+            else:
+                codigos = preparar_datos(directorio, args.productos, args.semilla)
+                args.token = args.token or secrets.token_urlsafe(16)
+                proceso = levantar_api(directorio, args.puerto, args.token)
+                url = f"http://127.0.0.1:{args.puerto}"
+
+            resultado = ejecutar_carga(url, args.usuario, codigos, args.lotes, args.tam_lote,
+                                       args.hilos, args.semilla, args.token)
+        finally:
+            if proceso is not None:
+                proceso.terminate()
+                proceso.wait()
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == "__main__":
+    main()
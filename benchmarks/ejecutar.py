@@ -0,0 +1,277 @@
+"""
+Ejecutar los benchmarks y reportar los resultados como JSON.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.ejecutar --productos 100000 --escaneos 1000000 --salida bench.json
+
+Cada caso ejecuta una función de datos o una página completa de app.py con
+streamlit sustituido, y mide tiempo de pared, memoria pico (tracemalloc) y
+filas por segundo. Los datos se generan en un directorio temporal con su
+propia base SQLite, sin tocar /tmp/inventario.db.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ArchivoSubido(io.BytesIO):
+    """Imita el objeto que devuelve st.file_uploader"""
+
+    def __init__(self, contenido, name):
+        super().__init__(contenido)
+        self.name = name
+
+
+def version_codigo():
+    """Commit actual, para comparar resultados entre versiones"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def preparar_entorno(directorio):
+    """Apuntar la base de datos al directorio de trabajo e importar app.py"""
+    os.environ["INVENTARIO_DB"] = os.path.join(directorio, "inventario.db")
+
+    from benchmarks import stub_streamlit
+    stub_streamlit.instalar()
+
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    import app
+    import database as db
+
+    os.chdir(directorio)
+    return app, db, stub_streamlit
+
+
+def cargar_datos(db, args, directorio):
+    """Generar catálogo y escaneos y cargarlos como lo haría la aplicación"""
+    from benchmarks import generador
+
+    catalogo = generador.generar_catalogo(args.productos, args.marcas, args.areas, args.semilla)
+    db.guardar_productos_batch(catalogo.to_dict("records"))
+
+    conteos = generador.escribir_escaneos(catalogo, directorio, args.escaneos,
+                                          n_usuarios=args.usuarios, semilla=args.semilla)
+
+    conn = db.get_connection()
+    conn.executemany('''INSERT INTO conteos
+                        (fecha, usuario, codigo, producto, marca, area, stock_sistema, conteo_fisico, diferencia)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     conteos[generador.COLUMNAS_CONTEOS].itertuples(index=False, name=None))
+    conn.commit()
+    conn.close()
+
+    ruta_excel = os.path.join(directorio, "stock_benchmark.xlsx")
+    ruta_excel_areas = os.path.join(directorio, "stock_por_area.xlsx")
+    # Reimportación típica: el 5% de los productos cambia de stock
+    muestra = catalogo.head(args.filas_excel).copy()
+    muestra.loc[muestra.index[::20], "stock_sistema"] += 1
+    generador.escribir_excel(muestra, ruta_excel)
+    generador.escribir_excel(muestra, ruta_excel_areas, hoja_por_area=True)
+    excel = {}
+    for ruta in (ruta_excel, ruta_excel_areas):
+        with open(ruta, "rb") as f:
+            excel[os.path.basename(ruta)] = f.read()
+
+    return catalogo, len(conteos), excel
+
+
+def definir_casos(app, db, stub, catalogo, n_conteos, excel, args):
+    """Lista de (nombre, función, respuestas de widgets, filas procesadas)"""
+    n_productos = len(catalogo)
+    n_escaneos = args.escaneos
+    marcas = sorted(catalogo["marca"].unique().tolist())
+    codigos = catalogo["codigo"].tolist()
+
+    def escanear(pagina, desde=0):
+        def ejecutar():
+            for i in range(desde, desde + args.escaneos_formulario):
+                stub.RESPUESTAS["Código del producto"] = codigos[i % len(codigos)]
+                try:
+                    pagina()
+                except stub.Rerun:
+                    pass
+        return ejecutar
+
+    def exportar_excel():
+        bloques = (app.agregar_estado_marca(bloque, True)
+                   for bloque in db.iterar_productos_con_escaneado(None, ordenar_por_marca=True))
+        os.remove(app.escribir_conciliacion_excel(bloques))
+
+    def guardar_por_fila():
+        # El adaptador anterior: una conexión y un commit por producto
+        for fila in catalogo.head(args.filas_por_fila).to_dict("records"):
+            db.guardar_producto(fila["codigo"], fila["producto"], fila["marca"], fila["area"],
+                                int(fila["stock_sistema"]))
+
+    def importar(nombre):
+        def ejecutar():
+            stub.RESPUESTAS["Selecciona tus archivos Excel (.xlsx, .xls)"] = [ArchivoSubido(excel[nombre], nombre)]
+            app.mostrar_importar_excel()
+        return ejecutar
+
+    volcado = "\n".join(f"{codigos[i % len(codigos)]},{1 + i % 3}"
+                         for i in range(args.lecturas_volcado)).encode()
+
+    def cargar_volcado():
+        stub.RESPUESTAS["Archivo del escáner"] = ArchivoSubido(volcado, "volcado.csv")
+        app.mostrar_conteo_fisico()
+
+    return [
+        ("db.obtener_todos_productos", lambda: db.obtener_todos_productos(), {}, n_productos),
+        ("db.obtener_todas_marcas", db.obtener_todas_marcas, {}, n_productos),
+        ("db.obtener_resumen_por_marca", db.obtener_resumen_por_marca, {}, n_productos + n_conteos),
+        ("cargar_stock", app.cargar_stock, {}, n_productos),
+        ("cargar_conteos", app.cargar_conteos, {}, n_conteos),
+        ("cargar_escaneos_detallados", app.cargar_escaneos_detallados, {}, n_escaneos),
+        ("mostrar_sidebar", app.mostrar_sidebar, {}, n_productos + n_conteos),
+        ("mostrar_dashboard", app.mostrar_dashboard, {}, n_productos + n_conteos + n_escaneos),
+        ("mostrar_dashboard[no escaneados]", app.mostrar_dashboard,
+         {"Mostrar solo productos NO escaneados": True}, n_productos),
+        ("mostrar_carga_stock", app.mostrar_carga_stock, {}, n_productos),
+        ("mostrar_reportes_marca", app.mostrar_reportes_marca, {}, n_productos + n_escaneos),
+        ("mostrar_reportes_marca[30 marcas]", app.mostrar_reportes_marca,
+         {"🔍 Seleccionar marcas para ver detalle": marcas[:30]}, n_productos + n_escaneos),
+        ("mostrar_reportes_marca[30 marcas, no escaneados]", app.mostrar_reportes_marca,
+         {"🔍 Seleccionar marcas para ver detalle": marcas[:30],
+          "Mostrar solo productos NO escaneados": True}, n_productos),
+        ("mostrar_resumen_general", app.mostrar_resumen_general, {}, n_productos + n_conteos + n_escaneos),
+        ("mostrar_historial_completo", app.mostrar_historial_completo, {}, n_escaneos),
+        ("mostrar_resumen_tiendas", app.mostrar_resumen_tiendas, {}, n_productos + n_conteos),
+        ("mostrar_reportes", app.mostrar_reportes, {}, n_productos + n_conteos + n_escaneos),
+        ("mostrar_configuracion", app.mostrar_configuracion, {}, n_productos + n_conteos + n_escaneos),
+        ("exportar_excel[catálogo]", exportar_excel, {}, n_productos),
+        ("guardar_stock", lambda: app.guardar_stock(catalogo.copy()), {}, n_productos),
+        ("guardar_stock[por fila]", guardar_por_fila, {}, min(args.filas_por_fila, n_productos)),
+        ("importar_excel", importar("stock_benchmark.xlsx"), {"🚀 Aplicar cambios": True},
+         min(args.filas_excel, n_productos)),
+        ("importar_excel[hoja por área]", importar("stock_por_area.xlsx"), {"🚀 Aplicar cambios": True},
+         min(args.filas_excel, n_productos)),
+        # Al final: agrega escaneos a la bitácora
+        ("escaneo_formulario", escanear(app.mostrar_conteo_fisico), {"✅ Registrar": True},
+         args.escaneos_formulario),
+        # Lo que se vuelve a ejecutar tras cada escaneo: solo el fragmento del formulario
+        ("escaneo_formulario[fragmento]",
+         escanear(lambda: app.mostrar_panel_escaneo(app.db.tienda_actual(), app.st.session_state.nombre,
+                                                    "Todas", []),
+                  desde=args.escaneos_formulario),
+         {"✅ Registrar": True}, args.escaneos_formulario),
+        ("volcado_escaner", cargar_volcado, {"📥 Registrar volcado": True}, args.lecturas_volcado),
+    ]
+
+
+def medir(stub, funcion, respuestas, repeticiones):
+    """Tiempo de pared (mejor de N) y memoria pico de una ejecución"""
+    def ejecutar():
+        stub.RESPUESTAS.clear()
+        stub.RESPUESTAS.update(respuestas)
+        try:
+            funcion()
+        except stub.Rerun:
+            pass
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        ejecutar()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    ejecutar()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(tiempos), pico
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del sistema de inventario")
+    parser.add_argument("--productos", type=int, default=10_000, help="SKUs del catálogo (1k-1M)")
+    parser.add_argument("--escaneos", type=int, default=100_000, help="Filas de la bitácora de escaneos (hasta 10M)")
+    parser.add_argument("--marcas", type=int, default=200)
+    parser.add_argument("--areas", type=int, default=12)
+    parser.add_argument("--usuarios", type=int, default=20)
+    parser.add_argument("--filas-excel", type=int, default=10_000, help="Filas del Excel a importar")
+    parser.add_argument("--filas-por-fila", type=int, default=2_000,
+                        help="Productos del caso guardar_stock[por fila] (una transacción por producto)")
+    parser.add_argument("--escaneos-formulario", type=int, default=5, help="Escaneos por el formulario de Conteo Físico")
+    parser.add_argument("--lecturas-volcado", type=int, default=50_000, help="Lecturas del volcado de escáner sin conexión")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--casos", nargs="*", help="Ejecutar solo estos casos")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--directorio", help="Directorio de trabajo (por defecto uno temporal)")
+    parser.add_argument("--salida", help="Archivo JSON de salida (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    salida = os.path.abspath(args.salida) if args.salida else None
+    directorio = os.path.abspath(args.directorio or tempfile.mkdtemp(prefix="bench_inventario_"))
+    os.makedirs(directorio, exist_ok=True)
+
+    app, db, stub = preparar_entorno(directorio)
+
+    inicio = time.perf_counter()
+    catalogo, n_conteos, excel = cargar_datos(db, args, directorio)
+    segundos_generacion = time.perf_counter() - inicio
+
+    stub.estado.update(autenticado=True, usuario="admin", nombre="Administrador", rol="admin",
+                       pagina_actual="🏠 Dashboard")
+    app.inicializar_sesion()
+
+    resultados = []
+    for nombre, funcion, respuestas, filas in definir_casos(app, db, stub, catalogo, n_conteos, excel, args):
+        if args.casos and nombre not in args.casos:
+            continue
+        segundos, pico = medir(stub, funcion, respuestas, args.repeticiones)
+        resultados.append({
+            "caso": nombre,
+            "segundos": round(segundos, 4),
+            "memoria_pico_mb": round(pico / 1024 / 1024, 2),
+            "filas": filas,
+            "filas_por_segundo": round(filas / segundos, 1) if segundos > 0 else None,
+        })
+        print(f"{nombre}: {segundos:.3f}s", file=sys.stderr)
+
+    reporte = {
+        "version": version_codigo(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parametros": {
+            "productos": args.productos,
+            "escaneos": args.escaneos,
+            "conteos": n_conteos,
+            "marcas": args.marcas,
+            "areas": args.areas,
+            "usuarios": args.usuarios,
+            "filas_excel": args.filas_excel,
+            "repeticiones": args.repeticiones,
+        },
+        "segundos_generacion": round(segundos_generacion, 2),
+        "resultados": resultados,
+    }
+
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if salida:
+        with open(salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+    return reporte
+
+
+if __name__ == "__main__":
+    main()
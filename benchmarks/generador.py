@@ -0,0 +1,128 @@
+"""
+Generador de datos sintéticos para los benchmarks.
+
+Crea catálogos de productos con muchas marcas y áreas, y bitácoras de
+escaneos (escaneos_detallados.csv + conteos.csv) de hasta millones de filas,
+escritas por bloques para no cargar todo en memoria.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+AREAS_BASE = ["Farmacia", "Cajas", "Pasillos", "Equipos médicos", "Bodega", "Otros"]
+
+COLUMNAS_ESCANEOS = ["timestamp", "usuario", "codigo", "producto", "marca", "area",
+                     "cantidad_escaneada", "total_acumulado", "stock_sistema", "tipo_operacion"]
+
+COLUMNAS_CONTEOS = ["fecha", "usuario", "codigo", "producto", "marca", "area",
+                    "stock_sistema", "conteo_fisico", "diferencia"]
+
+
+def generar_catalogo(n_productos, n_marcas=200, n_areas=12, semilla=0):
+    """Generar un catálogo de productos como DataFrame"""
+    rng = np.random.default_rng(semilla)
+
+    marcas = np.array([f"MARCA{i:04d}" for i in range(n_marcas)])
+    areas = np.array(AREAS_BASE + [f"Area {i}" for i in range(max(0, n_areas - len(AREAS_BASE)))])[:n_areas]
+
+    # Distribución desigual de productos por marca, como en un catálogo real
+    pesos = rng.pareto(1.5, n_marcas) + 1
+    pesos /= pesos.sum()
+
+    codigos = np.char.add("P", np.char.zfill(np.arange(n_productos).astype(str), 8))
+    return pd.DataFrame({
+        "codigo": codigos,
+        "producto": np.char.add("Producto ", np.arange(n_productos).astype(str)),
+        "marca": rng.choice(marcas, n_productos, p=pesos),
+        "area": rng.choice(areas, n_productos),
+        "stock_sistema": rng.integers(0, 200, n_productos),
+    })
+
+
+def escribir_escaneos(catalogo, directorio, n_escaneos, n_usuarios=20, n_dias=30,
+                      tam_bloque=500_000, semilla=0):
+    """
+    Escribir escaneos_detallados.csv y conteos.csv por bloques.
+
+    Cada bloque cubre días distintos, así los totales acumulados por
+    (usuario, código, día) son exactos sin arrastrar estado entre bloques.
+    Devuelve el DataFrame de conteos (una fila por usuario/código/día).
+    """
+    rng = np.random.default_rng(semilla + 1)
+    ruta_escaneos = os.path.join(directorio, "escaneos_detallados.csv")
+    ruta_conteos = os.path.join(directorio, "conteos.csv")
+
+    usuarios = np.array([f"Operador {i}" for i in range(n_usuarios)])
+    n_bloques = max(1, -(-n_escaneos // tam_bloque))
+    dias_por_bloque = max(1, n_dias // n_bloques)
+    inicio = pd.Timestamp("2024-01-01 08:00:00")
+
+    conteos_bloques = []
+    escritos = 0
+    for bloque in range(n_bloques):
+        n = min(tam_bloque, n_escaneos - escritos)
+        if n <= 0:
+            break
+
+        idx = rng.integers(0, len(catalogo), n)
+        prods = catalogo.iloc[idx].reset_index(drop=True)
+
+        dia = inicio + pd.Timedelta(days=bloque * dias_por_bloque)
+        # Microsegundos incluidos, como los timestamps que escribe la aplicación
+        microsegundos = np.sort(rng.integers(0, dias_por_bloque * 36_000 * 1_000_000, n))
+        timestamps = dia + pd.to_timedelta(microsegundos, unit="us")
+
+        df = pd.DataFrame({
+            "timestamp": timestamps,
+            "usuario": rng.choice(usuarios, n),
+            "codigo": prods["codigo"],
+            "producto": prods["producto"],
+            "marca": prods["marca"],
+            "area": prods["area"],
+            "cantidad_escaneada": rng.choice([1, 1, 1, 2, 3, 5, 10], n),
+            "stock_sistema": prods["stock_sistema"],
+            "tipo_operacion": "ESCANEO",
+        })
+        df["dia"] = df["timestamp"].dt.strftime("%Y-%m-%d")
+        df["total_acumulado"] = df.groupby(["usuario", "codigo", "dia"])["cantidad_escaneada"].cumsum()
+
+        df[COLUMNAS_ESCANEOS].to_csv(ruta_escaneos, mode="a" if bloque else "w",
+                                     header=bloque == 0, index=False)
+
+        ultimos = df.groupby(["usuario", "codigo", "dia"], sort=False).tail(1)
+        conteos = pd.DataFrame({
+            "fecha": ultimos["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "usuario": ultimos["usuario"],
+            "codigo": ultimos["codigo"],
+            "producto": ultimos["producto"],
+            "marca": ultimos["marca"],
+            "area": ultimos["area"],
+            "stock_sistema": ultimos["stock_sistema"],
+            "conteo_fisico": ultimos["total_acumulado"],
+            "diferencia": ultimos["total_acumulado"] - ultimos["stock_sistema"],
+        })
+        conteos_bloques.append(conteos)
+        escritos += n
+
+    conteos_df = pd.concat(conteos_bloques, ignore_index=True) if conteos_bloques else \
+        pd.DataFrame(columns=COLUMNAS_CONTEOS)
+    conteos_df.to_csv(ruta_conteos, index=False)
+    return conteos_df
+
+
+def escribir_excel(catalogo, ruta, hoja_por_area=False):
+    """
+    Escribir el catálogo como libro Excel de importación (modo write-only).
+    Con hoja_por_area, una hoja por área como en las exportaciones del ERP.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    grupos = catalogo.groupby("area", sort=True) if hoja_por_area else [("stock", catalogo)]
+    for nombre, grupo in grupos:
+        ws = wb.create_sheet(str(nombre)[:31])
+        ws.append(["codigo", "producto", "marca", "area", "stock_sistema"])
+        for fila in grupo.itertuples(index=False):
+            ws.append([fila.codigo, fila.producto, fila.marca, fila.area, int(fila.stock_sistema)])
+    wb.save(ruta)
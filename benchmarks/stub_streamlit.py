@@ -0,0 +1,139 @@
+"""
+Sustituto mínimo de streamlit para ejecutar las páginas sin navegador.
+
+Todas las llamadas de dibujo son no-ops. Los widgets devuelven su valor por
+defecto salvo que el benchmark defina una respuesta para su etiqueta en
+``RESPUESTAS`` (por ejemplo, pulsar un botón o escribir un código).
+"""
+import sys
+import types
+
+# Etiqueta del widget -> valor que debe devolver
+RESPUESTAS = {}
+
+
+class Rerun(Exception):
+    """Equivalente a la excepción que lanza st.rerun()"""
+
+
+class StreamlitAPIException(Exception):
+    """Equivalente a streamlit.errors.StreamlitAPIException"""
+
+
+class EstadoSesion(dict):
+    """session_state con acceso por atributo, como en streamlit"""
+
+    def __getattr__(self, nombre):
+        try:
+            return self[nombre]
+        except KeyError:
+            raise AttributeError(nombre)
+
+    def __setattr__(self, nombre, valor):
+        self[nombre] = valor
+
+    def __delattr__(self, nombre):
+        del self[nombre]
+
+
+class Elemento:
+    """Contenedor genérico: acepta cualquier llamada y sirve como 'with'"""
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, nombre):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+
+def _etiqueta(args, kwargs):
+    if args:
+        return args[0]
+    return kwargs.get("label")
+
+
+def _widget(defecto):
+    def widget(*args, **kwargs):
+        etiqueta = _etiqueta(args, kwargs)
+        valor = RESPUESTAS.get(etiqueta, defecto(*args, **kwargs))
+        if kwargs.get("key"):
+            estado[kwargs["key"]] = valor
+        return valor
+    return widget
+
+
+def _selectbox(label, options=(), index=0, **kwargs):
+    opciones = list(options)
+    return opciones[index] if opciones and index is not None else None
+
+
+def _multiselect(label, options=(), default=None, **kwargs):
+    return list(default or [])
+
+
+def _decorador(func=None, **kwargs):
+    """Sirve para @st.cache_data, @st.fragment y sus variantes con argumentos"""
+    if func is None:
+        return lambda f: f
+    return func
+
+
+def _columnas(spec, *args, **kwargs):
+    n = spec if isinstance(spec, int) else len(spec)
+    return [Elemento() for _ in range(n)]
+
+
+def _rerun(*args, **kwargs):
+    raise Rerun()
+
+
+estado = EstadoSesion()
+
+
+def crear_modulo():
+    """Crear el módulo 'streamlit' falso"""
+    st = types.ModuleType("streamlit")
+    elemento = Elemento()
+
+    st.session_state = estado
+    st.sidebar = elemento
+    st.column_config = elemento
+    st.columns = _columnas
+    st.tabs = _columnas
+    st.rerun = _rerun
+    st.cache_data = _decorador
+    st.cache_resource = _decorador
+    st.cache_data.clear = lambda: None
+    st.fragment = _decorador
+    st.errors = types.SimpleNamespace(StreamlitAPIException=StreamlitAPIException)
+
+    st.button = _widget(lambda *a, **k: False)
+    st.form_submit_button = _widget(lambda *a, **k: False)
+    st.download_button = _widget(lambda *a, **k: False)
+    st.checkbox = _widget(lambda label, value=False, **k: value)
+    st.text_input = _widget(lambda label, value="", **k: value)
+    st.number_input = _widget(lambda label, min_value=0, value=None, **k: min_value if value is None else value)
+    st.date_input = _widget(lambda label, value=None, **k: value)
+    st.file_uploader = _widget(lambda *a, **k: None)
+    st.selectbox = _widget(_selectbox)
+    st.radio = _widget(_selectbox)
+    st.multiselect = _widget(_multiselect)
+
+    # Todo lo demás (title, metric, dataframe, expander, form...) es un no-op
+    st.__getattr__ = lambda nombre: elemento
+    return st
+
+
+def instalar():
+    """Registrar el módulo falso antes de importar app.py"""
+    sys.modules["streamlit"] = crear_modulo()
+    return sys.modules["streamlit"]
@@ -0,0 +1,104 @@
+"""
+Motor de conciliación: stock del sistema contra conteo físico.
+
+Clasificación vectorizada (np.select) con dos esquemas:
+- TOLERANCIA: EXACTO / LEVE / CRÍTICO según UMBRAL_LEVE (dashboard y
+  tablas mantenidas de la base)
+- SIGNO: Exacto / Sobrante / Faltante (reportes y exportaciones)
+
+El umbral de diferencia leve se configura con INVENTARIO_UMBRAL_LEVE.
+Para mostrar las N mayores diferencias se usa selección parcial
+(np.partition) en lugar de ordenar todo.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# Diferencia absoluta máxima para considerar una diferencia "leve"
+UMBRAL_LEVE = int(os.environ.get("INVENTARIO_UMBRAL_LEVE", "5"))
+
+TOLERANCIA = "tolerancia"
+SIGNO = "signo"
+
+NO_ESCANEADO = "NO ESCANEADO"
+ESTADOS_TOLERANCIA = ["EXACTO", "LEVE", "CRÍTICO"]
+ESTADOS_SIGNO = ["✅ Exacto", "⚠️ Sobrante", "🔻 Faltante"]
+
+# Opción de orden de las tablas con columna diferencia: por su valor absoluto
+ORDEN_DIFERENCIA_ABSOLUTA = "|diferencia|"
+
+
+def clasificar_diferencia(diferencia, umbral_leve=None):
+    """Estado de tolerancia de una sola diferencia (para escrituras fila a fila)"""
+    umbral = UMBRAL_LEVE if umbral_leve is None else umbral_leve
+    if diferencia == 0:
+        return "EXACTO"
+    if abs(diferencia) <= umbral:
+        return "LEVE"
+    return "CRÍTICO"
+
+
+def clasificar(diferencia, esquema=TOLERANCIA, contado=None, umbral_leve=None):
+    """
+    Estados de un arreglo de diferencias. contado (máscara booleana) marca
+    los productos con conteo; el resto queda NO ESCANEADO.
+    """
+    d = np.asarray(diferencia)
+    if esquema == TOLERANCIA:
+        umbral = UMBRAL_LEVE if umbral_leve is None else umbral_leve
+        condiciones = [d == 0, np.abs(d) <= umbral]
+        estados, otro = ESTADOS_TOLERANCIA[:2], ESTADOS_TOLERANCIA[2]
+    elif esquema == SIGNO:
+        condiciones = [d == 0, d > 0]
+        estados, otro = ESTADOS_SIGNO[:2], ESTADOS_SIGNO[2]
+    else:
+        raise ValueError(f"Esquema de clasificación desconocido: {esquema}")
+
+    if contado is not None:
+        condiciones = [~np.asarray(contado, dtype=bool)] + condiciones
+        estados = [NO_ESCANEADO] + estados
+    return np.select(condiciones, estados, default=otro)
+
+
+def conciliar(df, esquema=TOLERANCIA, contado=None, umbral_leve=None):
+    """
+    Agregar diferencia (conteo_fisico - stock_sistema) y estado a un
+    DataFrame con esas columnas. Los no contados quedan con diferencia 0.
+    Modifica y devuelve df.
+    """
+    diferencia = (pd.to_numeric(df['conteo_fisico'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+                  - pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).to_numpy(dtype=np.int64))
+    if contado is not None:
+        diferencia = np.where(np.asarray(contado, dtype=bool), diferencia, 0)
+    df['diferencia'] = diferencia
+    df['estado'] = clasificar(diferencia, esquema, contado, umbral_leve)
+    return df
+
+
+def indices_mayores(valores, n, descendente=True):
+    """
+    Posiciones de los n primeros valores en orden descendente (o ascendente),
+    sin ordenar todo el arreglo. Los empates conservan el orden original y los
+    NaN van al final, igual que un sort_values estable.
+    """
+    v = np.asarray(valores, dtype=float)
+    v = v if descendente else -v
+    v = np.where(np.isnan(v), -np.inf, v)
+    total = len(v)
+    if n <= 0 or total == 0:
+        return np.array([], dtype=np.intp)
+    if n >= total:
+        return np.argsort(-v, kind='stable')
+
+    umbral = np.partition(v, total - n)[total - n]
+    mayores = np.flatnonzero(v > umbral)
+    empates = np.flatnonzero(v == umbral)[:n - len(mayores)]
+    candidatos = np.sort(np.concatenate([mayores, empates]))
+    return candidatos[np.argsort(-v[candidatos], kind='stable')]
+
+
+def top_diferencias(df, n, columna='diferencia', absoluta=True):
+    """Las n filas con mayor diferencia (absoluta por defecto), de mayor a menor"""
+    valores = df[columna].abs() if absoluta else df[columna]
+    return df.iloc[indices_mayores(valores.to_numpy(dtype=float), n)]
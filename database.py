@@ -1,16 +1,116 @@
 import sqlite3
 import pandas as pd
 import os
+import re
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import conciliacion
+import metricas
+
+# ======================================================
+# TIENDAS: UNA BASE SQLITE POR TIENDA
+# ======================================================
+# La tienda por defecto usa DB_PATH; cada otra tienda usa un archivo hermano
+# con su sufijo (/tmp/inventario_norte.db). La tienda activa se guarda por
+# hilo: Streamlit ejecuta cada sesión en su propio hilo y app.py la fija al
+# inicio de cada ejecución según el usuario conectado.
+
+# Usar /tmp para escritura en Azure (read-write).
+# INVENTARIO_DB permite apuntar a otra base (por ejemplo en benchmarks).
+DB_PATH = os.environ.get("INVENTARIO_DB", "/tmp/inventario.db")
+TIENDA_POR_DEFECTO = "PRINCIPAL"
+MAX_HILOS_TIENDAS = 8
+
+_hilo = threading.local()
+
+def sufijo_tienda(tienda):
+    """Sufijo de archivo para una tienda: minúsculas, letras, números y '_'"""
+    return re.sub(r'[^a-z0-9]+', '_', str(tienda).strip().lower()).strip('_') or 'tienda'
+
+def ruta_tienda(ruta_base, tienda=None):
+    """Ruta de un archivo (base o CSV) para la tienda indicada o la activa"""
+    tienda = tienda or tienda_actual()
+    if tienda == TIENDA_POR_DEFECTO:
+        return ruta_base
+    raiz, extension = os.path.splitext(ruta_base)
+    return f"{raiz}_{sufijo_tienda(tienda)}{extension}"
+
+def usar_tienda(tienda):
+    """Fijar la tienda activa del hilo actual"""
+    _hilo.tienda = tienda or TIENDA_POR_DEFECTO
+
+def tienda_actual():
+    """Tienda activa del hilo actual"""
+    return getattr(_hilo, "tienda", TIENDA_POR_DEFECTO)
+
+@contextmanager
+def en_tienda(tienda):
+    """Cambiar temporalmente la tienda activa del hilo"""
+    anterior = tienda_actual()
+    usar_tienda(tienda)
+    try:
+        yield
+    finally:
+        usar_tienda(anterior)
+
+def registrar_tienda(nombre):
+    """
+    Agregar una tienda al registro (vive en la base de la tienda por defecto).
+    Los archivos de una tienda salen de sufijo_tienda, así que un nombre que
+    solo difiere de otra tienda en mayúsculas o signos se rechaza en lugar de
+    compartir sus productos y conteos. Devuelve (True, nombre) o (False,
+    mensaje de error).
+    """
+    nombre = str(nombre).strip()
+    if not nombre or nombre == TIENDA_POR_DEFECTO:
+        return True, TIENDA_POR_DEFECTO
+    conn = get_connection(TIENDA_POR_DEFECTO)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        registradas = [fila[0] for fila in conn.execute("SELECT nombre FROM tiendas")]
+        for existente in [TIENDA_POR_DEFECTO] + registradas:
+            if existente != nombre and sufijo_tienda(existente) == sufijo_tienda(nombre):
+                conn.rollback()
+                return False, f"La tienda '{nombre}' se confunde con la tienda existente '{existente}'"
+        conn.execute("INSERT OR IGNORE INTO tiendas (nombre) VALUES (?)", (nombre,))
+        conn.commit()
+    finally:
+        conn.close()
+    return True, nombre
+
+def listar_tiendas():
+    """Tienda por defecto más las registradas, en orden alfabético"""
+    conn = get_connection(TIENDA_POR_DEFECTO)
+    registradas = [fila[0] for fila in conn.execute("SELECT nombre FROM tiendas ORDER BY nombre")]
+    conn.close()
+    return [TIENDA_POR_DEFECTO] + [t for t in registradas if t != TIENDA_POR_DEFECTO]
+
+def en_todas_las_tiendas(funcion, *args, tiendas=None, **kwargs):
+    """
+    Ejecutar una función de este módulo en cada tienda, en paralelo.
+    Devuelve {tienda: resultado} en el orden de las tiendas.
+    """
+    tiendas = list(tiendas) if tiendas is not None else listar_tiendas()
+    
+    def ejecutar(tienda):
+        with en_tienda(tienda):
+            return funcion(*args, **kwargs)
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_HILOS_TIENDAS, len(tiendas)))) as pool:
+        resultados = list(pool.map(ejecutar, tiendas))
+    return dict(zip(tiendas, resultados))
 
 # ======================================================
 # CONEXIÓN A BASE DE DATOS SQLITE
 # ======================================================
+# Bases cuya tabla conteos ya se revisó (columna campana) en este proceso
+_conteos_con_campana = set()
 
-def get_connection():
-    """Obtiene conexión a SQLite"""
-    # Usar /tmp para escritura en Azure (read-write)
-    db_path = "/tmp/inventario.db"
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+def get_connection(tienda=None):
+    """Obtiene conexión a la base SQLite de la tienda (por defecto la activa)"""
+    conn = sqlite3.connect(ruta_tienda(DB_PATH, tienda), check_same_thread=False)
     
     # Crear tablas si no existen
     c = conn.cursor()
@@ -34,7 +134,15 @@ def get_connection():
                  area TEXT,
                  stock_sistema INTEGER,
                  conteo_fisico INTEGER,
-                 diferencia INTEGER)''')
+                 diferencia INTEGER,
+                 campana INTEGER DEFAULT 1)''')
+    
+    # Bases anteriores a las campañas: sus conteos quedan en la campaña 1
+    ruta = ruta_tienda(DB_PATH, tienda)
+    if ruta not in _conteos_con_campana:
+        if 'campana' not in [fila[1] for fila in c.execute("PRAGMA table_info(conteos)")]:
+            c.execute("ALTER TABLE conteos ADD COLUMN campana INTEGER DEFAULT 1")
+        _conteos_con_campana.add(ruta)
     
     # Tabla de usuarios
     c.execute('''CREATE TABLE IF NOT EXISTS usuarios
@@ -49,6 +157,132 @@ def get_connection():
                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
                  nombre TEXT UNIQUE)''')
     
+    # Último conteo por producto (se mantiene en cada registrar_conteo)
+    c.execute('''CREATE TABLE IF NOT EXISTS ultimo_conteo
+                (codigo TEXT PRIMARY KEY,
+                 fecha TEXT,
+                 usuario TEXT,
+                 conteo_fisico INTEGER,
+                 diferencia INTEGER,
+                 estado TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_conteo_fecha ON ultimo_conteo (fecha)")
+    
+    # Totales por estado (EXACTO / LEVE / CRÍTICO) sobre ultimo_conteo
+    c.execute('''CREATE TABLE IF NOT EXISTS totales_estado
+                (estado TEXT PRIMARY KEY,
+                 productos INTEGER,
+                 conteo_fisico INTEGER,
+                 diferencia INTEGER)''')
+    
+    c.execute("CREATE INDEX IF NOT EXISTS idx_conteos_codigo ON conteos (codigo)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_conteos_campana_codigo ON conteos (campana, codigo)")
+    
+    # Un reinicio es una fila de anulación (sin conteo_fisico): anula los conteos
+    # anteriores del mismo usuario, código y día sin borrarlos. conteos_vigentes
+    # son los conteos que ninguna anulación posterior alcanza.
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_conteos_anulaciones ON conteos (campana, codigo, usuario)
+                 WHERE conteo_fisico IS NULL''')
+    c.execute('''CREATE VIEW IF NOT EXISTS conteos_vigentes AS
+                 SELECT * FROM conteos c
+                 WHERE c.conteo_fisico IS NOT NULL
+                   AND NOT EXISTS (SELECT 1 FROM conteos a
+                                   WHERE a.conteo_fisico IS NULL AND a.campana = c.campana
+                                     AND a.codigo = c.codigo AND a.usuario = c.usuario
+                                     AND a.id > c.id AND date(a.fecha) = date(c.fecha))''')
+    
+    # Cantidad escaneada acumulada por producto (se mantiene en cada escaneo)
+    c.execute('''CREATE TABLE IF NOT EXISTS escaneado_por_producto
+                (codigo TEXT PRIMARY KEY,
+                 cantidad INTEGER,
+                 escaneos INTEGER)''')
+    
+    c.execute("CREATE INDEX IF NOT EXISTS idx_productos_marca ON productos (marca)")
+    
+    # Metadatos (por ejemplo, qué agregados ya se poblaron desde la bitácora)
+    c.execute('''CREATE TABLE IF NOT EXISTS meta
+                (clave TEXT PRIMARY KEY,
+                 valor TEXT)''')
+    
+    # Total escaneado en el día por usuario y código (total acumulado de los escaneos)
+    c.execute('''CREATE TABLE IF NOT EXISTS total_diario
+                (fecha TEXT,
+                 usuario TEXT,
+                 codigo TEXT,
+                 total INTEGER,
+                 PRIMARY KEY (fecha, usuario, codigo))''')
+    
+    # Escaneos y unidades por cubeta de tiempo (ritmo_escaneo), compartidos entre procesos
+    c.execute('''CREATE TABLE IF NOT EXISTS ritmo_escaneo
+                (periodo INTEGER,
+                 dimension TEXT,
+                 clave TEXT,
+                 escaneos INTEGER,
+                 unidades INTEGER,
+                 PRIMARY KEY (periodo, dimension, clave)) WITHOUT ROWID''')
+    
+    # Estadísticas por usuario y día (se mantienen en cada escaneo)
+    c.execute('''CREATE TABLE IF NOT EXISTS estadisticas_usuario
+                (usuario TEXT,
+                 fecha TEXT,
+                 conteos INTEGER,
+                 exactos INTEGER,
+                 escaneos INTEGER,
+                 PRIMARY KEY (usuario, fecha))''')
+    
+    # Campañas de conteo (ciclos de inventario); la activa está en meta
+    c.execute('''CREATE TABLE IF NOT EXISTS campanas
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 nombre TEXT,
+                 inicio TEXT,
+                 fin TEXT,
+                 productos_contados INTEGER,
+                 exactos INTEGER)''')
+    
+    # Último conteo de cada producto al cerrar cada campaña (ver comparar_campanas)
+    c.execute('''CREATE TABLE IF NOT EXISTS cierre_campana
+                (codigo TEXT,
+                 campana INTEGER,
+                 conteo_fisico INTEGER,
+                 diferencia INTEGER,
+                 PRIMARY KEY (codigo, campana)) WITHOUT ROWID''')
+    
+    # Registro de tiendas (solo se usa en la base de la tienda por defecto)
+    c.execute('''CREATE TABLE IF NOT EXISTS tiendas
+                (nombre TEXT PRIMARY KEY)''')
+    
+    # Productos aún sin conteo y avance por marca y área (se mantienen en cada escaneo)
+    c.execute('''CREATE TABLE IF NOT EXISTS pendientes
+                (codigo TEXT PRIMARY KEY,
+                 marca TEXT,
+                 area TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pendientes_marca_area ON pendientes (marca, area)")
+    c.execute('''CREATE TABLE IF NOT EXISTS avance_marca_area
+                (marca TEXT,
+                 area TEXT,
+                 productos INTEGER,
+                 pendientes INTEGER,
+                 PRIMARY KEY (marca, area))''')
+    
+    # Historial de importaciones de stock (huella del archivo y tiempos)
+    c.execute('''CREATE TABLE IF NOT EXISTS importaciones
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 fecha TEXT,
+                 usuario TEXT,
+                 archivo TEXT,
+                 huella TEXT,
+                 resultado TEXT,
+                 filas INTEGER,
+                 nuevos INTEGER,
+                 modificados INTEGER,
+                 eliminados INTEGER,
+                 sin_cambios INTEGER,
+                 eliminar_faltantes INTEGER,
+                 version_catalogo INTEGER,
+                 segundos_lectura REAL,
+                 segundos_comparacion REAL,
+                 segundos_escritura REAL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_importaciones_huella ON importaciones (huella)")
+    
     conn.commit()
     return conn
 
@@ -82,16 +316,80 @@ def obtener_todos_productos(marca_filtro='Todas'):
     
     return df
 
+def contar_productos(marca_filtro='Todas'):
+    """Cantidad de productos (COUNT sobre el índice, sin cargar la tabla)"""
+    conn = get_connection()
+    if marca_filtro != 'Todas':
+        fila = conn.execute("SELECT COUNT(*) FROM productos WHERE marca = ?", (marca_filtro,)).fetchone()
+    else:
+        fila = conn.execute("SELECT COUNT(*) FROM productos").fetchone()
+    conn.close()
+    return fila[0]
+
+def obtener_productos_por_codigos(codigos):
+    """Productos del catálogo con los códigos indicados, como dict codigo -> fila"""
+    codigos = list(dict.fromkeys(str(codigo) for codigo in codigos))
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    productos = {}
+    for inicio in range(0, len(codigos), 500):
+        parte = codigos[inicio:inicio + 500]
+        filas = conn.execute(f'''SELECT codigo, producto, marca, area, stock_sistema FROM productos
+                                  WHERE codigo IN ({", ".join("?" * len(parte))})''', parte).fetchall()
+        for fila in filas:
+            producto = dict(fila)
+            producto['marca'] = producto['marca'] or 'SIN MARCA'
+            producto['stock_sistema'] = int(producto['stock_sistema'] or 0)
+            productos[str(producto['codigo'])] = producto
+    conn.close()
+    return productos
+
+def obtener_productos_df_por_codigos(codigos):
+    """Productos del catálogo con los códigos indicados, como DataFrame (para cruces vectorizados)"""
+    codigos = list(dict.fromkeys(str(codigo) for codigo in codigos))
+    conn = get_connection()
+    partes = []
+    for inicio in range(0, len(codigos), 500):
+        parte = codigos[inicio:inicio + 500]
+        partes.append(pd.read_sql_query(f'''SELECT codigo, producto, marca, area, stock_sistema FROM productos
+                                             WHERE codigo IN ({", ".join("?" * len(parte))})''',
+                                        conn, params=parte, dtype={'codigo': str}))
+    conn.close()
+
+    if not partes:
+        return pd.DataFrame(columns=['codigo', 'producto', 'marca', 'area', 'stock_sistema'])
+    df = pd.concat(partes, ignore_index=True)
+    df['marca'] = df['marca'].fillna('SIN MARCA').replace('', 'SIN MARCA')
+    df['stock_sistema'] = pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int)
+    return df
+
+def _marcar_cambio_catalogo(c):
+    """Incrementar la versión del catálogo; toda escritura en productos debe llamarla"""
+    c.execute('''INSERT INTO meta (clave, valor) VALUES ('version_catalogo', '1')
+                 ON CONFLICT(clave) DO UPDATE SET valor = CAST(valor AS INTEGER) + 1''')
+
+def version_catalogo():
+    """Versión actual del catálogo (cambia con cada escritura en productos)"""
+    conn = get_connection()
+    fila = conn.execute("SELECT valor FROM meta WHERE clave = 'version_catalogo'").fetchone()
+    conn.close()
+    return int(fila[0]) if fila else 0
+
 def guardar_producto(codigo, producto, marca, area, stock_sistema):
     """Guardar o actualizar un producto"""
     conn = get_connection()
     c = conn.cursor()
+    anteriores = _marcas_de_codigos(c, [codigo])
     c.execute('''INSERT OR REPLACE INTO productos 
                 (codigo, producto, marca, area, stock_sistema) 
                 VALUES (?, ?, ?, ?, ?)''',
              (codigo, producto, marca, area, stock_sistema))
+    _registrar_marcas(c, [marca])
+    _quitar_marcas_sin_productos(c, anteriores)
+    _marcar_cambio_catalogo(c)
     conn.commit()
     conn.close()
+    _invalidar_marcas()
 
 def guardar_productos_batch(productos_list):
     """Guardar múltiples productos en batch"""
@@ -107,40 +405,105 @@ def guardar_productos_batch(productos_list):
                     VALUES (?, ?, ?, ?, ?)''',
                  (prod['codigo'], prod['producto'], prod['marca'], 
                   prod['area'], prod['stock_sistema']))
+    _registrar_marcas(c, [prod['marca'] for prod in productos_list])
+    _marcar_cambio_catalogo(c)
     
     conn.commit()
     conn.close()
+    _invalidar_marcas()
+
+def guardar_productos_df(df):
+    """
+    Guardar o actualizar los productos de un DataFrame (COLUMNAS_PRODUCTO;
+    marca opcional) en una sola transacción con executemany. Devuelve la
+    cantidad de filas escritas.
+    """
+    if df.empty:
+        return 0
+    
+    df = df.assign(codigo=df['codigo'].astype(str),
+                   stock_sistema=pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int))
+    if 'marca' not in df.columns:
+        df['marca'] = 'SIN MARCA'
+    
+    with transaccion() as conn:
+        c = conn.cursor()
+        c.executemany('''INSERT OR REPLACE INTO productos (codigo, producto, marca, area, stock_sistema)
+                         VALUES (?, ?, ?, ?, ?)''', _filas_producto(df, COLUMNAS_PRODUCTO))
+        _registrar_marcas(c, df['marca'].unique())
+        _marcar_cambio_catalogo(c)
+    _invalidar_marcas()
+    return len(df)
 
 def eliminar_producto(codigo):
     """Eliminar un producto"""
     conn = get_connection()
     c = conn.cursor()
+    marcas = _marcas_de_codigos(c, [codigo])
     c.execute("DELETE FROM productos WHERE codigo = ?", (codigo,))
+    _quitar_marcas_sin_productos(c, marcas)
+    _marcar_cambio_catalogo(c)
     conn.commit()
     conn.close()
+    _invalidar_marcas()
 
 # ======================================================
 # FUNCIONES PARA MARCAS
 # ======================================================
 
+# Registro de marcas: la tabla marcas se llena al guardar o importar productos
+# y con crear_marca; la marca que se queda sin productos al eliminar o
+# cambiar de marca un producto sale del registro. Cada proceso guarda la
+# lista por base de datos y la descarta cuando él mismo escribe marcas.
+MARCAS_POR_DEFECTO = ["SIN MARCA", "GENVEN", "LETI", "OTROS"]
+_cache_marcas = {}
+
+def _invalidar_marcas():
+    _cache_marcas.pop(ruta_tienda(DB_PATH), None)
+
+def _registrar_marcas(c, marcas):
+    """Agregar al registro, en una sola sentencia, las marcas que aún no estén"""
+    nombres = {str(marca) for marca in marcas if marca is not None and not pd.isna(marca) and str(marca) != ''}
+    c.executemany("INSERT OR IGNORE INTO marcas (nombre) VALUES (?)", [(nombre,) for nombre in nombres])
+
+def _marcas_de_codigos(c, codigos):
+    """Marcas actuales de los productos indicados (antes de eliminarlos o cambiarlos de marca)"""
+    codigos = [str(codigo) for codigo in codigos]
+    marcas = set()
+    for inicio in range(0, len(codigos), 500):
+        parte = codigos[inicio:inicio + 500]
+        c.execute(f"SELECT DISTINCT marca FROM productos WHERE codigo IN ({', '.join('?' * len(parte))})", parte)
+        marcas.update(fila[0] for fila in c.fetchall())
+    return marcas
+
+def _quitar_marcas_sin_productos(c, marcas):
+    """Sacar del registro las marcas indicadas que se quedaron sin productos"""
+    c.executemany('''DELETE FROM marcas
+                     WHERE nombre = ? AND NOT EXISTS (SELECT 1 FROM productos WHERE marca = ?)''',
+                  [(marca, marca) for marca in marcas if marca is not None])
+
 def obtener_todas_marcas():
-    """Obtener lista de todas las marcas"""
-    conn = get_connection()
-    
-    try:
-        # Intentar obtener marcas de la tabla productos
-        df = pd.read_sql_query("SELECT DISTINCT marca FROM productos WHERE marca IS NOT NULL AND marca != '' ORDER BY marca", conn)
-        marcas = df['marca'].tolist() if not df.empty else []
-    except:
-        marcas = []
-    
-    conn.close()
+    """Obtener lista de todas las marcas (ordenada, desde la tabla marcas)"""
+    ruta = ruta_tienda(DB_PATH)
+    marcas = _cache_marcas.get(ruta)
+    if marcas is None:
+        conn = get_connection()
+        c = conn.cursor()
+        
+        # Base existente: poblar el registro una vez con las marcas del catálogo
+        c.execute("SELECT EXISTS(SELECT 1 FROM meta WHERE clave = 'marcas')")
+        if not c.fetchone()[0]:
+            c.execute('''INSERT OR IGNORE INTO marcas (nombre)
+                         SELECT DISTINCT marca FROM productos WHERE length(marca) > 0''')
+            c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('marcas', '1')")
+            conn.commit()
+        
+        marcas = [fila[0] for fila in c.execute("SELECT nombre FROM marcas ORDER BY nombre")]
+        conn.close()
+        _cache_marcas[ruta] = marcas
     
     # Agregar marcas por defecto si no hay ninguna
-    if not marcas:
-        marcas = ["SIN MARCA", "GENVEN", "LETI", "OTROS"]
-    
-    return marcas
+    return list(marcas) if marcas else list(MARCAS_POR_DEFECTO)
 
 def crear_marca(nombre_marca):
     """Crear una nueva marca"""
@@ -156,6 +519,7 @@ def crear_marca(nombre_marca):
         c.execute("INSERT OR IGNORE INTO marcas (nombre) VALUES (?)", (nombre_marca,))
         conn.commit()
         conn.close()
+        _invalidar_marcas()
         return True
     except:
         conn.close()
@@ -174,42 +538,989 @@ def registrar_conteo(usuario, codigo, producto, marca, area, stock_sistema, cont
     diferencia = conteo_fisico - stock_sistema
     
     c = conn.cursor()
+    if _estadisticas_pobladas(c):
+        dia = fecha[:10]
+        _registrar_estadisticas(c, usuario, dia, _diferencias_del_dia(c, usuario, dia, [codigo]),
+                                {codigo: diferencia}, 1)
     c.execute('''INSERT INTO conteos 
-                (fecha, usuario, codigo, producto, marca, area, stock_sistema, conteo_fisico, diferencia) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-             (fecha, usuario, codigo, producto, marca, area, stock_sistema, conteo_fisico, diferencia))
+                (fecha, usuario, codigo, producto, marca, area, stock_sistema, conteo_fisico, diferencia, campana) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+             (fecha, usuario, codigo, producto, marca, area, stock_sistema, conteo_fisico, diferencia,
+              _campana_activa(c)))
+    if _ultimo_conteo_poblado(c):
+        _actualizar_ultimo_conteo(c, codigo, (fecha, usuario, conteo_fisico, diferencia))
+    else:
+        reconstruir_ultimo_conteo(conn)
     conn.commit()
     conn.close()
 
 def obtener_conteos_usuario(usuario, fecha=None):
-    """Obtener conteos de un usuario específico"""
+    """Obtener conteos de un usuario específico (campaña activa)"""
     conn = get_connection()
+    campana = _campana_activa(conn.cursor())
     
     if fecha:
-        query = "SELECT * FROM conteos WHERE usuario = ? AND date(fecha) = date(?)"
-        df = pd.read_sql_query(query, conn, params=[usuario, fecha])
+        query = "SELECT * FROM conteos_vigentes WHERE campana = ? AND usuario = ? AND date(fecha) = date(?)"
+        df = pd.read_sql_query(query, conn, params=[campana, usuario, fecha])
     else:
-        query = "SELECT * FROM conteos WHERE usuario = ?"
-        df = pd.read_sql_query(query, conn, params=[usuario])
+        query = "SELECT * FROM conteos_vigentes WHERE campana = ? AND usuario = ?"
+        df = pd.read_sql_query(query, conn, params=[campana, usuario])
+    
+    conn.close()
+    return df
+
+def _reiniciar_conteo(c, usuario, codigo, fecha):
+    campana = _campana_activa(c)
+    c.execute('''SELECT COUNT(*) FROM conteos_vigentes
+                 WHERE campana = ? AND codigo = ? AND usuario = ? AND date(fecha) = date(?)''',
+              (campana, codigo, usuario, fecha))
+    anulados = c.fetchone()[0]
+    if not anulados:
+        return
+    
+    if _estadisticas_pobladas(c):
+        exacto = _diferencias_del_dia(c, usuario, fecha, [codigo]).get(codigo) == 0
+        _sumar_estadisticas(c, usuario, fecha, -1, -int(exacto), -anulados)
+    
+    # Fila de anulación en lugar de borrar: los conteos anulados quedan en la tabla
+    ahora = datetime.now().isoformat()
+    c.execute("INSERT INTO conteos (fecha, usuario, codigo, campana) VALUES (?, ?, ?, ?)",
+              (ahora if ahora.startswith(fecha) else fecha, usuario, codigo, campana))
+    c.execute("UPDATE total_diario SET total = 0 WHERE fecha = ? AND usuario = ? AND codigo = ?",
+              (fecha, usuario, codigo))
+    
+    # El último conteo del producto pasa a ser el anterior que siga vigente
+    c.execute('''SELECT fecha, usuario, conteo_fisico, diferencia FROM conteos_vigentes
+                 WHERE campana = ? AND codigo = ? ORDER BY id DESC LIMIT 1''', (campana, codigo))
+    anterior = c.fetchone()
+    if _ultimo_conteo_poblado(c):
+        _actualizar_ultimo_conteo(c, codigo, anterior)
+    else:
+        _reconstruir_ultimo_conteo(c)
+
+def reiniciar_conteo_producto(usuario, codigo, fecha):
+    """Anular los conteos de un usuario para un código en una fecha (YYYY-MM-DD)"""
+    conn = get_connection()
+    _reiniciar_conteo(conn.cursor(), usuario, codigo, fecha)
+    conn.commit()
+    conn.close()
+
+def registrar_reinicio(conn, usuario, codigo, fecha):
+    """
+    Reiniciar a 0 el conteo del día de un usuario para un código dentro de una
+    transacción abierta. Descuenta lo escaneado hoy del agregado por producto
+    y devuelve esa cantidad (la del evento RESET de la bitácora).
+    """
+    c = conn.cursor()
+    c.execute("SELECT total FROM total_diario WHERE fecha = ? AND usuario = ? AND codigo = ?",
+              (fecha, usuario, codigo))
+    fila = c.fetchone()
+    total = int(fila[0]) if fila else 0
+
+    _reiniciar_conteo(c, usuario, codigo, fecha)
+    if total:
+        c.execute("UPDATE escaneado_por_producto SET cantidad = cantidad - ? WHERE codigo = ?",
+                  (total, codigo))
+    return total
+
+# ======================================================
+# CAMPAÑAS DE CONTEO
+# ======================================================
+# Cada ciclo de inventario es una campaña. Los conteos llevan su campaña y
+# todas las consultas se limitan a la activa (índice campana, codigo); la
+# bitácora y el resumen CSV de cada campaña van en archivos propios (ver
+# ruta_campana). Iniciar una campaña archiva la anterior sin borrar nada:
+# solo cambia meta['campana_activa'] y vacía las tablas mantenidas, que
+# dependen del tamaño del catálogo y no del historial.
+CAMPANA_INICIAL = 1
+_cache_campana = {}
+
+def _campana_activa(c):
+    c.execute("SELECT valor FROM meta WHERE clave = 'campana_activa'")
+    fila = c.fetchone()
+    return int(fila[0]) if fila else CAMPANA_INICIAL
+
+def campana_activa(tienda=None):
+    """
+    Id de la campaña activa de la tienda, guardado en memoria del proceso.
+    iniciar_campana lo actualiza y cada transacción de escritura lo vuelve a
+    leer con la base bloqueada, así lo que se escribe va siempre a la campaña
+    vigente aunque otro proceso la haya cambiado.
+    """
+    ruta = ruta_tienda(DB_PATH, tienda)
+    campana = _cache_campana.get(ruta)
+    if campana is None:
+        conn = get_connection(tienda)
+        campana = _cache_campana[ruta] = _campana_activa(conn.cursor())
+        conn.close()
+    return campana
+
+def ruta_campana(ruta_base, campana):
+    """Ruta de un archivo de la campaña: la inicial conserva el nombre original"""
+    if campana == CAMPANA_INICIAL:
+        return ruta_base
+    raiz, extension = os.path.splitext(ruta_base)
+    return f"{raiz}_c{campana}{extension}"
+
+def _asegurar_campana_inicial(c):
+    c.execute("INSERT OR IGNORE INTO campanas (id, nombre) VALUES (?, 'Campaña inicial')", (CAMPANA_INICIAL,))
+
+def listar_campanas():
+    """Campañas de la tienda activa, de la más reciente a la más antigua, con la activa marcada"""
+    conn = get_connection()
+    c = conn.cursor()
+    activa = _campana_activa(c)
+    if activa == CAMPANA_INICIAL:
+        _asegurar_campana_inicial(c)
+        conn.commit()
+    df = pd.read_sql_query('''SELECT id, nombre, inicio, fin, productos_contados, exactos
+                              FROM campanas ORDER BY id DESC''', conn)
+    conn.close()
+    df['activa'] = df['id'] == activa
+    return df
+
+def iniciar_campana(nombre):
+    """
+    Archivar la campaña activa (guarda productos contados, exactos y su
+    cierre por producto) e iniciar una nueva. Devuelve el id de la nueva campaña.
+    """
+    import datetime
+    ahora = datetime.datetime.now().isoformat(timespec='seconds')
+    
+    with transaccion() as conn:
+        c = conn.cursor()
+        actual = _campana_activa(c)
+        _asegurar_campana_inicial(c)
+        if not _ultimo_conteo_poblado(c):
+            _reconstruir_ultimo_conteo(c)
+        c.execute('''UPDATE campanas SET fin = ?,
+                        productos_contados = (SELECT COALESCE(SUM(productos), 0) FROM totales_estado),
+                        exactos = (SELECT COALESCE(SUM(productos), 0) FROM totales_estado WHERE estado = 'EXACTO')
+                     WHERE id = ?''', (ahora, actual))
+        _guardar_cierre(c, actual)
+        
+        c.execute("INSERT INTO campanas (nombre, inicio) VALUES (?, ?)", (str(nombre).strip(), ahora))
+        nueva = c.lastrowid
+        c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('campana_activa', ?)", (str(nueva),))
+        
+        # Tablas mantenidas de la campaña nueva: vacías y marcadas como pobladas
+        c.execute("DELETE FROM escaneado_por_producto")
+        c.execute("DELETE FROM total_diario")
+        c.execute("DELETE FROM estadisticas_usuario")
+        c.executemany("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)",
+                      [('escaneado_por_producto', '1'), ('total_diario', ahora[:10]),
+                       ('estadisticas_usuario', '1')])
+        _reconstruir_ultimo_conteo(c)
+    _cache_campana[ruta_tienda(DB_PATH)] = nueva
+    return nueva
+
+# ======================================================
+# CIERRES DE CAMPAÑA Y COMPARACIÓN ENTRE CAMPAÑAS
+# ======================================================
+# cierre_campana guarda el último conteo de cada código al archivar una
+# campaña (sin rowid, con clave codigo + campana). Comparar N campañas es una
+# sola pasada por productos con una búsqueda por clave en cada cierre; la
+# campaña activa se toma de ultimo_conteo.
+
+def _guardar_cierre(c, campana, desde_ultimo_conteo=True):
+    """Cierre de una campaña: desde ultimo_conteo (la activa) o desde conteos (archivadas sin cierre)"""
+    if desde_ultimo_conteo:
+        c.execute('''INSERT OR REPLACE INTO cierre_campana (codigo, campana, conteo_fisico, diferencia)
+                     SELECT codigo, ?, conteo_fisico, diferencia FROM ultimo_conteo''', (campana,))
+    else:
+        c.execute('''INSERT OR REPLACE INTO cierre_campana (codigo, campana, conteo_fisico, diferencia)
+                     SELECT codigo, campana, conteo_fisico, diferencia FROM conteos
+                     WHERE id IN (SELECT MAX(id) FROM conteos_vigentes WHERE campana = ? GROUP BY codigo)''',
+                  (campana,))
+    c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, '1')", (f'cierre_campana_{campana}',))
+
+def _campanas_sin_cierre(c):
+    c.execute('''SELECT id FROM campanas
+                 WHERE fin IS NOT NULL
+                   AND 'cierre_campana_' || id NOT IN (SELECT clave FROM meta)''')
+    return [fila[0] for fila in c.fetchall()]
+
+def asegurar_cierres():
+    """Guardar el cierre de las campañas archivadas que aún no lo tengan"""
+    conn = get_connection()
+    faltantes = _campanas_sin_cierre(conn.cursor())
+    conn.close()
+    if not faltantes:
+        return
+    
+    with transaccion() as conn:
+        c = conn.cursor()
+        for campana in _campanas_sin_cierre(c):
+            _guardar_cierre(c, campana, desde_ultimo_conteo=False)
+
+def comparar_campanas(n=3, marca_filtro='Todas'):
+    """
+    Diferencia de cada producto del catálogo en las últimas n campañas (la
+    activa incluida), de la más antigua a la más reciente. Devuelve
+    (DataFrame, columnas de campaña); el DataFrame trae además contadas,
+    promedio y tendencia (última diferencia menos la primera).
+    """
+    asegurar_cierres()
+    obtener_totales_estado()  # asegura ultimo_conteo de la campaña activa
+    
+    conn = get_connection()
+    c = conn.cursor()
+    activa = _campana_activa(c)
+    c.execute("SELECT id, nombre FROM campanas WHERE fin IS NOT NULL AND id != ? ORDER BY id DESC LIMIT ?",
+              (activa, max(n - 1, 0)))
+    archivadas = c.fetchall()[::-1]
+    c.execute("SELECT nombre FROM campanas WHERE id = ?", (activa,))
+    fila = c.fetchone()
+    nombre_activa = fila[0] if fila else 'Campaña inicial'
+    
+    # Los nombres los escribe el usuario: en SQL van alias posicionales (d0, d1...)
+    # y se renombran en el DataFrame
+    columnas = [f"{nombre} (#{campana})" for campana, nombre in archivadas] + [f"{nombre_activa} (#{activa})"]
+    alias = [f"d{i}" for i in range(len(columnas))]
+    selects = [f"s{i}.diferencia AS {alias[i]}" for i in range(len(archivadas))]
+    selects.append(f"u.diferencia AS {alias[-1]}")
+    joins = [f"LEFT JOIN cierre_campana s{i} ON s{i}.codigo = p.codigo AND s{i}.campana = ?"
+             for i in range(len(archivadas))]
+    params = [campana for campana, _ in archivadas]
+    
+    query = f'''SELECT p.codigo, p.producto, p.marca, p.area, p.stock_sistema, {", ".join(selects)}
+                FROM productos p
+                {" ".join(joins)}
+                LEFT JOIN ultimo_conteo u ON u.codigo = p.codigo'''
+    if marca_filtro != 'Todas':
+        query += " WHERE p.marca = ?"
+        params.append(marca_filtro)
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    
+    df = df.rename(columns=dict(zip(alias, columnas)))
+    df['codigo'] = df['codigo'].astype(str)
+    df['stock_sistema'] = pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int)
+    diferencias = df[columnas].astype('float64')
+    df[columnas] = diferencias.astype('Int64')
+    df['contadas'] = diferencias.notna().sum(axis=1)
+    df['promedio'] = diferencias.mean(axis=1).round(1)
+    df['tendencia'] = (diferencias.ffill(axis=1).iloc[:, -1] - diferencias.bfill(axis=1).iloc[:, 0]).astype('Int64')
+    return df, columnas
+
+# ======================================================
+# ÚLTIMO CONTEO POR PRODUCTO Y TOTALES POR ESTADO
+# ======================================================
+
+# Umbral y estados compartidos con el motor de conciliación (INVENTARIO_UMBRAL_LEVE)
+UMBRAL_DIFERENCIA_LEVE = conciliacion.UMBRAL_LEVE
+
+ESTADOS_CONTEO = conciliacion.ESTADOS_TOLERANCIA
+
+def clasificar_diferencia(diferencia):
+    """Estado de un producto según su diferencia contra el sistema"""
+    return conciliacion.clasificar_diferencia(diferencia, UMBRAL_DIFERENCIA_LEVE)
+
+def _sumar_totales(c, estado, productos, conteo_fisico, diferencia):
+    c.execute('''INSERT INTO totales_estado (estado, productos, conteo_fisico, diferencia)
+                 VALUES (?, ?, ?, ?)
+                 ON CONFLICT(estado) DO UPDATE SET
+                    productos = productos + excluded.productos,
+                    conteo_fisico = conteo_fisico + excluded.conteo_fisico,
+                    diferencia = diferencia + excluded.diferencia''',
+              (estado, productos, conteo_fisico, diferencia))
+
+def _ultimo_conteo_poblado(c):
+    """
+    Si totales_estado ya se construyó con el umbral vigente (si no, hay que
+    reconstruir desde conteos)
+    """
+    c.execute("SELECT EXISTS(SELECT 1 FROM totales_estado)")
+    if not c.fetchone()[0]:
+        return False
+    c.execute("SELECT valor FROM meta WHERE clave = 'umbral_leve'")
+    fila = c.fetchone()
+    return fila is not None and fila[0] == str(UMBRAL_DIFERENCIA_LEVE)
+
+def _actualizar_ultimo_conteo(c, codigo, nuevo):
+    """
+    Reemplazar el último conteo de un código y ajustar los totales por estado.
+    nuevo es (fecha, usuario, conteo_fisico, diferencia) o None para quitarlo.
+    """
+    c.execute("SELECT estado, conteo_fisico, diferencia FROM ultimo_conteo WHERE codigo = ?", (codigo,))
+    anterior = c.fetchone()
+    if anterior:
+        _sumar_totales(c, anterior[0], -1, -anterior[1], -anterior[2])
+    
+    if nuevo is None:
+        c.execute("DELETE FROM ultimo_conteo WHERE codigo = ?", (codigo,))
+        if anterior:
+            _agregar_pendiente(c, codigo)
+        return
+    
+    if not anterior:
+        _quitar_pendiente(c, codigo)
+    
+    fecha, usuario, conteo_fisico, diferencia = nuevo
+    estado = clasificar_diferencia(diferencia)
+    c.execute('''INSERT OR REPLACE INTO ultimo_conteo
+                 (codigo, fecha, usuario, conteo_fisico, diferencia, estado)
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (codigo, fecha, usuario, conteo_fisico, diferencia, estado))
+    _sumar_totales(c, estado, 1, conteo_fisico, diferencia)
+
+def reconstruir_ultimo_conteo(conn=None):
+    """Recalcular ultimo_conteo y totales_estado desde la tabla conteos"""
+    propia = conn is None
+    if propia:
+        conn = get_connection()
+    
+    _reconstruir_ultimo_conteo(conn.cursor())
+    conn.commit()
+    
+    if propia:
+        conn.close()
+
+def _reconstruir_ultimo_conteo(c):
+    c.execute("DELETE FROM ultimo_conteo")
+    c.execute("DELETE FROM totales_estado")
+    c.execute('''INSERT INTO ultimo_conteo (codigo, fecha, usuario, conteo_fisico, diferencia, estado)
+                 SELECT codigo, fecha, usuario, conteo_fisico, diferencia,
+                        CASE WHEN diferencia = 0 THEN 'EXACTO'
+                             WHEN abs(diferencia) <= ? THEN 'LEVE'
+                             ELSE 'CRÍTICO' END
+                 FROM conteos
+                 WHERE id IN (SELECT MAX(id) FROM conteos_vigentes WHERE campana = ? GROUP BY codigo)''',
+              (UMBRAL_DIFERENCIA_LEVE, _campana_activa(c)))
+    c.execute('''INSERT INTO totales_estado (estado, productos, conteo_fisico, diferencia)
+                 SELECT estado, COUNT(*), SUM(conteo_fisico), SUM(diferencia)
+                 FROM ultimo_conteo GROUP BY estado''')
+    c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('umbral_leve', ?)",
+              (str(UMBRAL_DIFERENCIA_LEVE),))
+    _reconstruir_pendientes(c)
+
+def obtener_totales_estado():
+    """
+    Totales de productos contados por estado, leídos de totales_estado.
+    Devuelve dict estado -> {'productos', 'conteo_fisico', 'diferencia'}.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    # Base existente sin la tabla mantenida, o con otro umbral: poblarla una vez
+    if not _ultimo_conteo_poblado(c):
+        reconstruir_ultimo_conteo(conn)
+    c.execute("SELECT estado, productos, conteo_fisico, diferencia FROM totales_estado")
+    filas = c.fetchall()
     
+    conn.close()
+    
+    totales = {estado: {'productos': 0, 'conteo_fisico': 0, 'diferencia': 0} for estado in ESTADOS_CONTEO}
+    for estado, productos, conteo_fisico, diferencia in filas:
+        totales[estado] = {'productos': productos, 'conteo_fisico': conteo_fisico, 'diferencia': diferencia}
+    return totales
+
+def obtener_ultimos_conteos():
+    """Último conteo de cada producto (codigo, conteo_fisico, diferencia, estado)"""
+    obtener_totales_estado()  # asegura que la tabla esté poblada
+    conn = get_connection()
+    df = pd.read_sql_query("SELECT codigo, conteo_fisico, diferencia, estado FROM ultimo_conteo", conn)
     conn.close()
     return df
 
-def limpiar_todos_conteos():
-    """Eliminar TODOS los registros de conteo"""
+def obtener_conteos_recientes(limite=5):
+    """Los últimos productos contados (fecha, codigo, producto, diferencia), del más reciente al más antiguo"""
+    obtener_totales_estado()  # asegura que la tabla esté poblada
+    conn = get_connection()
+    df = pd.read_sql_query('''SELECT u.fecha, u.codigo, p.producto, u.diferencia
+                              FROM ultimo_conteo u
+                              LEFT JOIN productos p ON p.codigo = u.codigo
+                              ORDER BY u.fecha DESC LIMIT ?''', conn, params=(limite,))
+    conn.close()
+    return df
+
+def obtener_ultimo_codigo_usuario(usuario):
+    """Código del último escaneo del usuario en la campaña activa (None si no escaneó)"""
+    conn = get_connection()
+    # Recorre conteos desde el final (+campana evita el índice, que obligaría a ordenar)
+    fila = conn.execute('''SELECT codigo FROM conteos WHERE usuario = ? AND +campana = ?
+                           ORDER BY id DESC LIMIT 1''', (usuario, campana_activa())).fetchone()
+    conn.close()
+    return fila[0] if fila else None
+
+# ======================================================
+# PRODUCTOS PENDIENTES DE ESCANEAR Y AVANCE POR MARCA
+# ======================================================
+# pendientes guarda los códigos del catálogo sin último conteo; el primer
+# escaneo de un código lo quita y descuenta avance_marca_area. Un cambio en
+# el catálogo (version_catalogo) obliga a reconstruir ambas tablas.
+
+def _sumar_avance(c, marca, area, pendientes):
+    c.execute("UPDATE avance_marca_area SET pendientes = pendientes + ? WHERE marca IS ? AND area IS ?",
+              (pendientes, marca, area))
+
+def _quitar_pendiente(c, codigo):
+    c.execute("SELECT marca, area FROM pendientes WHERE codigo = ?", (codigo,))
+    fila = c.fetchone()
+    if fila:
+        c.execute("DELETE FROM pendientes WHERE codigo = ?", (codigo,))
+        _sumar_avance(c, fila[0], fila[1], -1)
+
+def _agregar_pendiente(c, codigo):
+    c.execute('''INSERT OR IGNORE INTO pendientes (codigo, marca, area)
+                 SELECT codigo, marca, area FROM productos WHERE codigo = ?''', (codigo,))
+    if c.rowcount:
+        c.execute("SELECT marca, area FROM pendientes WHERE codigo = ?", (codigo,))
+        _sumar_avance(c, *c.fetchone(), 1)
+
+def _reconstruir_pendientes(c):
+    c.execute("DELETE FROM pendientes")
+    c.execute('''INSERT INTO pendientes (codigo, marca, area)
+                 SELECT codigo, marca, area FROM productos
+                 WHERE codigo NOT IN (SELECT codigo FROM ultimo_conteo)''')
+    c.execute("DELETE FROM avance_marca_area")
+    c.execute('''INSERT INTO avance_marca_area (marca, area, productos, pendientes)
+                 SELECT p.marca, p.area, COUNT(*), COUNT(*) - COUNT(u.codigo)
+                 FROM productos p
+                 LEFT JOIN ultimo_conteo u ON u.codigo = p.codigo
+                 GROUP BY p.marca, p.area''')
+    c.execute('''INSERT OR REPLACE INTO meta (clave, valor)
+                 SELECT 'pendientes', COALESCE((SELECT valor FROM meta WHERE clave = 'version_catalogo'), '0')''')
+
+def _pendientes_vigentes(c):
+    """Si pendientes corresponde a la versión actual del catálogo"""
+    c.execute('''SELECT EXISTS(SELECT 1 FROM meta
+                 WHERE clave = 'pendientes'
+                   AND valor = COALESCE((SELECT valor FROM meta WHERE clave = 'version_catalogo'), '0'))''')
+    return bool(c.fetchone()[0]) and _ultimo_conteo_poblado(c)
+
+def asegurar_pendientes():
+    """Reconstruir pendientes y avance si cambió el catálogo o no se han poblado"""
+    conn = get_connection()
+    vigentes = _pendientes_vigentes(conn.cursor())
+    conn.close()
+    if vigentes:
+        return
+
+    with transaccion() as conn:
+        c = conn.cursor()
+        if not _ultimo_conteo_poblado(c):
+            _reconstruir_ultimo_conteo(c)
+        elif not _pendientes_vigentes(c):
+            _reconstruir_pendientes(c)
+
+def _filtro_marcas(marcas):
+    if marcas is None:
+        return "", []
+    return f" WHERE marca IN ({', '.join('?' * len(marcas))})", list(marcas)
+
+def contar_pendientes(marcas=None):
+    """Productos sin escanear de las marcas indicadas (None: todo el catálogo)"""
+    asegurar_pendientes()
+    filtro, params = _filtro_marcas(marcas)
+    conn = get_connection()
+    fila = conn.execute(f"SELECT COALESCE(SUM(pendientes), 0) FROM avance_marca_area{filtro}", params).fetchone()
+    conn.close()
+    return int(fila[0])
+
+def obtener_avance(por_area=False, marcas=None):
+    """
+    Avance del conteo por marca (y área si por_area): productos, contados,
+    pendientes y avance (% contado), leído de avance_marca_area.
+    """
+    asegurar_pendientes()
+    claves = ['marca', 'area'] if por_area else ['marca']
+    filtro, params = _filtro_marcas(marcas)
+    conn = get_connection()
+    df = pd.read_sql_query(f'''SELECT {", ".join(claves)}, SUM(productos) AS productos,
+                                      SUM(pendientes) AS pendientes
+                               FROM avance_marca_area{filtro}
+                               GROUP BY {", ".join(claves)} ORDER BY {", ".join(claves)}''',
+                           conn, params=params)
+    conn.close()
+
+    df['contados'] = df['productos'] - df['pendientes']
+    df['avance'] = (df['contados'] / df['productos'].where(df['productos'] > 0) * 100).fillna(0).round(1)
+    return df[claves + ['productos', 'contados', 'pendientes', 'avance']]
+
+# ======================================================
+# CANTIDAD ESCANEADA POR PRODUCTO
+# ======================================================
+
+def sumar_escaneado(codigo, cantidad, escaneos=1):
+    """Sumar (o restar, con valores negativos) cantidad escaneada a un producto"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''INSERT INTO escaneado_por_producto (codigo, cantidad, escaneos)
+                 VALUES (?, ?, ?)
+                 ON CONFLICT(codigo) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad,
+                    escaneos = escaneos + excluded.escaneos''',
+              (codigo, int(cantidad), int(escaneos)))
+    conn.commit()
+    conn.close()
+
+def reemplazar_escaneado_por_producto(df):
+    """Reemplazar el agregado completo (df con codigo, cantidad, escaneos)"""
     conn = get_connection()
     c = conn.cursor()
-    c.execute("DELETE FROM conteos")
+    c.execute("DELETE FROM escaneado_por_producto")
+    c.executemany("INSERT INTO escaneado_por_producto (codigo, cantidad, escaneos) VALUES (?, ?, ?)",
+                  df[['codigo', 'cantidad', 'escaneos']].itertuples(index=False, name=None))
+    c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('escaneado_por_producto', '1')")
     conn.commit()
     conn.close()
 
+def contar_escaneos():
+    """Escaneos de la campaña activa (sin los eventos RESET), sumados de escaneado_por_producto"""
+    conn = get_connection()
+    fila = conn.execute("SELECT COALESCE(SUM(escaneos), 0) FROM escaneado_por_producto").fetchone()
+    conn.close()
+    return int(fila[0])
+
+def escaneado_por_producto_poblado():
+    """Si el agregado ya se pobló desde la bitácora de escaneos"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT EXISTS(SELECT 1 FROM meta WHERE clave = 'escaneado_por_producto')")
+    poblado = bool(c.fetchone()[0])
+    conn.close()
+    return poblado
+
+# ======================================================
+# TOTAL DIARIO POR USUARIO Y CÓDIGO
+# ======================================================
+# Total acumulado del día de cada usuario por código; evita releer la
+# bitácora en cada escaneo. Se puebla desde la bitácora una vez al día.
+
+def totales_diarios_poblados(fecha):
+    """Si total_diario ya se pobló para la fecha (YYYY-MM-DD)"""
+    conn = get_connection()
+    fila = conn.execute("SELECT valor FROM meta WHERE clave = 'total_diario'").fetchone()
+    conn.close()
+    return fila is not None and fila[0] == fecha
+
+def reemplazar_totales_diarios(fecha, df):
+    """Reemplazar los totales del día (df con usuario, codigo, total) y descartar días anteriores"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM total_diario")
+    c.executemany("INSERT INTO total_diario (fecha, usuario, codigo, total) VALUES (?, ?, ?, ?)",
+                  ((fecha, usuario, codigo, int(total))
+                   for usuario, codigo, total in df[['usuario', 'codigo', 'total']].itertuples(index=False, name=None)))
+    c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('total_diario', ?)", (fecha,))
+    conn.commit()
+    conn.close()
+
+def obtener_total_diario(usuario, codigo, fecha):
+    """Total escaneado en la fecha por un usuario para un código"""
+    conn = get_connection()
+    fila = conn.execute("SELECT total FROM total_diario WHERE fecha = ? AND usuario = ? AND codigo = ?",
+                        (fecha, usuario, str(codigo))).fetchone()
+    conn.close()
+    return int(fila[0]) if fila else 0
+
+# ======================================================
+# ESTADÍSTICAS DIARIAS POR USUARIO
+# ======================================================
+# Una fila por usuario y día: códigos contados, cuántos quedaron exactos
+# (según su último conteo del día) y escaneos. Se actualiza en cada
+# escaneo; la primera vez se puebla desde la tabla conteos.
+
+def _estadisticas_pobladas(c):
+    c.execute("SELECT EXISTS(SELECT 1 FROM meta WHERE clave = 'estadisticas_usuario')")
+    return bool(c.fetchone()[0])
+
+def _reconstruir_estadisticas(c):
+    c.execute("DELETE FROM estadisticas_usuario")
+    c.execute('''INSERT INTO estadisticas_usuario (usuario, fecha, conteos, exactos, escaneos)
+                 SELECT u.usuario, u.dia, COUNT(*), SUM(c.diferencia = 0), SUM(u.escaneos)
+                 FROM (SELECT usuario, date(fecha) AS dia, MAX(id) AS id, COUNT(*) AS escaneos
+                       FROM conteos_vigentes WHERE campana = ? GROUP BY usuario, date(fecha), codigo) u
+                 JOIN conteos c ON c.id = u.id
+                 GROUP BY u.usuario, u.dia''', (_campana_activa(c),))
+    c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('estadisticas_usuario', '1')")
+
+def asegurar_estadisticas():
+    """Poblar estadisticas_usuario desde conteos la primera vez"""
+    conn = get_connection()
+    pobladas = _estadisticas_pobladas(conn.cursor())
+    conn.close()
+    if pobladas:
+        return
+
+    with transaccion() as conn:
+        c = conn.cursor()
+        if not _estadisticas_pobladas(c):
+            _reconstruir_estadisticas(c)
+
+def _diferencias_del_dia(c, usuario, fecha, codigos):
+    """Diferencia del último conteo del día (YYYY-MM-DD) de cada código ya contado por el usuario"""
+    diferencias = {}
+    campana = _campana_activa(c)
+    for inicio in range(0, len(codigos), 500):
+        parte = codigos[inicio:inicio + 500]
+        c.execute(f'''SELECT codigo, diferencia FROM conteos
+                      WHERE id IN (SELECT MAX(id) FROM conteos_vigentes
+                                   WHERE campana = ? AND codigo IN ({", ".join("?" * len(parte))})
+                                     AND usuario = ? AND date(fecha) = ?
+                                   GROUP BY codigo)''',
+                  [campana] + parte + [usuario, fecha])
+        diferencias.update(c.fetchall())
+    return diferencias
+
+def _sumar_estadisticas(c, usuario, fecha, conteos, exactos, escaneos):
+    c.execute('''INSERT INTO estadisticas_usuario (usuario, fecha, conteos, exactos, escaneos)
+                 VALUES (?, ?, ?, ?, ?)
+                 ON CONFLICT(usuario, fecha) DO UPDATE SET
+                    conteos = conteos + excluded.conteos,
+                    exactos = exactos + excluded.exactos,
+                    escaneos = escaneos + excluded.escaneos''',
+              (usuario, fecha, conteos, exactos, escaneos))
+
+def _registrar_estadisticas(c, usuario, fecha, previas, finales, escaneos):
+    """
+    Sumar un lote a las estadísticas del día. previas: diferencia anterior de
+    los códigos ya contados hoy; finales: diferencia nueva de cada código.
+    """
+    nuevos = sum(1 for codigo in finales if codigo not in previas)
+    exactos = (sum(1 for diferencia in finales.values() if diferencia == 0)
+               - sum(1 for codigo in finales if previas.get(codigo) == 0))
+    _sumar_estadisticas(c, usuario, fecha, nuevos, exactos, escaneos)
+
+def obtener_estadisticas_usuario(usuario, fecha=None):
+    """
+    Conteos, exactos, escaneos y precisión (%) de un usuario: de un día
+    (YYYY-MM-DD) o de todo el historial si fecha es None.
+    """
+    asegurar_estadisticas()
+    conn = get_connection()
+    if fecha:
+        fila = conn.execute('''SELECT conteos, exactos, escaneos FROM estadisticas_usuario
+                               WHERE usuario = ? AND fecha = ?''', (usuario, fecha)).fetchone()
+    else:
+        fila = conn.execute('''SELECT SUM(conteos), SUM(exactos), SUM(escaneos) FROM estadisticas_usuario
+                               WHERE usuario = ?''', (usuario,)).fetchone()
+    conn.close()
+
+    conteos, exactos, escaneos = (int(v or 0) for v in (fila or (0, 0, 0)))
+    return {
+        'conteos': conteos,
+        'exactos': exactos,
+        'escaneos': escaneos,
+        'precision': round(exactos / conteos * 100, 1) if conteos else 0.0,
+    }
+
+# ======================================================
+# REGISTRO DE ESCANEOS POR LOTES (UNA TRANSACCIÓN)
+# ======================================================
+ESPERA_BLOQUEO_MS = 30_000
+_lock_escritura = threading.Lock()
+
+@contextmanager
+def transaccion():
+    """
+    Conexión con transacción de escritura (BEGIN IMMEDIATE): serializa a los
+    escritores, también entre procesos. Confirma al salir o revierte si hay error.
+    """
+    # Los hilos del mismo proceso hacen fila en el lock en lugar de reintentar
+    # contra el bloqueo de SQLite; entre procesos espera el busy_timeout
+    with _lock_escritura:
+        conn = get_connection()
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {ESPERA_BLOQUEO_MS}")
+            conn.execute("BEGIN IMMEDIATE")
+            # Campaña activa (rutas de la bitácora y del resumen) leída con la
+            # base bloqueada: otro proceso pudo haber iniciado una nueva
+            _cache_campana[ruta_tienda(DB_PATH)] = _campana_activa(conn.cursor())
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+def _dia_de_totales(c):
+    """Fecha (YYYY-MM-DD) que guarda total_diario, o None si no se pobló"""
+    fila = c.execute("SELECT valor FROM meta WHERE clave = 'total_diario'").fetchone()
+    return fila[0] if fila else None
+
+def _totales_previos(c, usuario, fecha, codigos, del_dia):
+    """
+    Total acumulado de cada código del usuario en la fecha antes de un lote.
+    total_diario solo guarda un día; para otro (un volcado de un turno
+    anterior) se toma el último conteo vigente de esa fecha.
+    """
+    totales = {}
+    for inicio in range(0, len(codigos), 500):
+        parte = codigos[inicio:inicio + 500]
+        marcas = ", ".join("?" * len(parte))
+        if del_dia:
+            c.execute(f'''SELECT codigo, total FROM total_diario
+                           WHERE fecha = ? AND usuario = ? AND codigo IN ({marcas})''',
+                      [fecha, usuario] + parte)
+        else:
+            c.execute(f'''SELECT codigo, conteo_fisico FROM conteos
+                           WHERE id IN (SELECT MAX(id) FROM conteos_vigentes
+                                        WHERE codigo IN ({marcas}) AND usuario = ? AND date(fecha) = ?
+                                        GROUP BY codigo)''',
+                      parte + [usuario, fecha])
+        totales.update(c.fetchall())
+    return totales
+
+def registrar_escaneos_lote(conn, usuario, fecha, escaneos):
+    """
+    Registrar escaneos de un usuario dentro de una transacción abierta.
+
+    escaneos: lista de dicts con codigo, producto, marca, area, stock_sistema,
+    cantidad_escaneada y timestamp, en orden y todos de la fecha (YYYY-MM-DD).
+    Completa 'total_acumulado' en cada uno y actualiza conteos, ultimo_conteo,
+    escaneado_por_producto, estadisticas_usuario y, si la fecha es la que
+    guarda, total_diario.
+    """
+    c = conn.cursor()
+    codigos = list(dict.fromkeys(str(e['codigo']) for e in escaneos))
+    
+    # Totales acumulados del día antes del lote
+    del_dia = _dia_de_totales(c) == fecha
+    totales = _totales_previos(c, usuario, fecha, codigos, del_dia)
+    
+    filas_conteos = []
+    escaneado = {}
+    ultimos = {}
+    for e in escaneos:
+        codigo = str(e['codigo'])
+        total = totales.get(codigo, 0) + int(e['cantidad_escaneada'])
+        totales[codigo] = total
+        e['total_acumulado'] = total
+        
+        fecha_conteo = e['timestamp'].isoformat()
+        diferencia = total - int(e['stock_sistema'])
+        filas_conteos.append((fecha_conteo, usuario, codigo, e['producto'], e['marca'], e['area'],
+                              int(e['stock_sistema']), total, diferencia))
+        cantidad, n = escaneado.get(codigo, (0, 0))
+        escaneado[codigo] = (cantidad + int(e['cantidad_escaneada']), n + 1)
+        ultimos[codigo] = (fecha_conteo, usuario, total, diferencia)
+    
+    # Estadísticas del día: comparar con el último conteo de hoy antes del lote
+    if _estadisticas_pobladas(c):
+        _registrar_estadisticas(c, usuario, fecha, _diferencias_del_dia(c, usuario, fecha, list(ultimos)),
+                                {codigo: nuevo[3] for codigo, nuevo in ultimos.items()}, len(escaneos))
+    
+    campana = _campana_activa(c)
+    c.executemany('''INSERT INTO conteos
+                     (fecha, usuario, codigo, producto, marca, area, stock_sistema, conteo_fisico, diferencia, campana)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', [fila + (campana,) for fila in filas_conteos])
+    
+    if _ultimo_conteo_poblado(c):
+        for codigo, nuevo in ultimos.items():
+            _actualizar_ultimo_conteo(c, codigo, nuevo)
+    else:
+        _reconstruir_ultimo_conteo(c)
+    
+    c.executemany('''INSERT INTO escaneado_por_producto (codigo, cantidad, escaneos)
+                     VALUES (?, ?, ?)
+                     ON CONFLICT(codigo) DO UPDATE SET
+                        cantidad = cantidad + excluded.cantidad,
+                        escaneos = escaneos + excluded.escaneos''',
+                  [(codigo, cantidad, n) for codigo, (cantidad, n) in escaneado.items()])
+    
+    if del_dia:
+        c.executemany('''INSERT INTO total_diario (fecha, usuario, codigo, total) VALUES (?, ?, ?, ?)
+                         ON CONFLICT(fecha, usuario, codigo) DO UPDATE SET total = excluded.total''',
+                      [(fecha, usuario, codigo, totales[codigo]) for codigo in ultimos])
+    return escaneos
+
+def _consulta_productos_con_escaneado(marcas, solo_no_escaneados=False, ordenar_por_marca=False):
+    """
+    Consulta SQL y parámetros de productos con su cantidad escaneada.
+    marcas=None incluye todo el catálogo.
+    """
+    query = '''SELECT p.codigo, p.producto, p.marca, p.area, p.stock_sistema,
+                      COALESCE(e.cantidad, 0) AS conteo_fisico
+               FROM productos p
+               LEFT JOIN escaneado_por_producto e ON e.codigo = p.codigo
+               WHERE 1 = 1'''
+    params = []
+    if marcas is not None:
+        query += f" AND p.marca IN ({', '.join('?' * len(marcas))})"
+        params = list(marcas)
+    if solo_no_escaneados:
+        query += " AND p.codigo IN (SELECT codigo FROM pendientes)"
+    if ordenar_por_marca:
+        query += " ORDER BY p.marca, p.codigo"
+    return query, params
+
+def _tipar_productos_con_escaneado(df):
+    df['codigo'] = df['codigo'].astype(str)
+    df['stock_sistema'] = pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int)
+    df['conteo_fisico'] = df['conteo_fisico'].fillna(0).astype(int)
+    return df
+
+def obtener_productos_con_escaneado(marcas, solo_no_escaneados=False):
+    """
+    Productos de las marcas indicadas con su cantidad escaneada acumulada
+    (columna conteo_fisico, 0 si no se ha escaneado). marcas=None incluye
+    todo el catálogo; solo_no_escaneados lee el conjunto de pendientes.
+    """
+    if marcas is not None and not marcas:
+        return pd.DataFrame(columns=['codigo', 'producto', 'marca', 'area', 'stock_sistema', 'conteo_fisico'])
+    
+    if solo_no_escaneados:
+        asegurar_pendientes()
+    conn = get_connection()
+    query, params = _consulta_productos_con_escaneado(marcas, solo_no_escaneados)
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    
+    return _tipar_productos_con_escaneado(df)
+
+def iterar_productos_con_escaneado(marcas, solo_no_escaneados=False, ordenar_por_marca=False,
+                                   tam_bloque=50_000):
+    """
+    Lo mismo que obtener_productos_con_escaneado, leído por bloques
+    (generador de DataFrames). marcas=None recorre todo el catálogo.
+    """
+    if marcas is not None and not marcas:
+        return
+    
+    if solo_no_escaneados:
+        asegurar_pendientes()
+    conn = get_connection()
+    try:
+        query, params = _consulta_productos_con_escaneado(marcas, solo_no_escaneados, ordenar_por_marca)
+        for bloque in pd.read_sql_query(query, conn, params=params, chunksize=tam_bloque):
+            yield _tipar_productos_con_escaneado(bloque)
+    finally:
+        conn.close()
+
+# ======================================================
+# IMPORTACIÓN INCREMENTAL DEL CATÁLOGO
+# ======================================================
+# Comparar el archivo entrante con productos y escribir solo lo que cambió:
+# reimportar un catálogo casi igual al de ayer no reescribe la tabla.
+COLUMNAS_PRODUCTO = ['codigo', 'producto', 'marca', 'area', 'stock_sistema']
+_COLUMNAS_TEXTO_PRODUCTO = ['producto', 'marca', 'area']
+
+def calcular_cambios_catalogo(df, eliminar_faltantes=False):
+    """
+    Diferencias entre un catálogo entrante (COLUMNAS_PRODUCTO, stock entero)
+    y la tabla productos, comparando por código. Si un código se repite gana
+    la última fila, como con INSERT OR REPLACE.
+
+    Devuelve un dict con 'nuevos' y 'modificados' (DataFrames con los valores
+    entrantes), 'eliminados' (códigos que no vienen en el archivo; vacío si
+    eliminar_faltantes es False) y 'sin_cambios' (cantidad).
+    """
+    entrante = df[COLUMNAS_PRODUCTO].drop_duplicates('codigo', keep='last')
+    entrante = entrante.astype({'codigo': str})
+
+    conn = get_connection()
+    actual = pd.read_sql_query("SELECT codigo, producto, marca, area, stock_sistema FROM productos",
+                               conn, dtype={'codigo': str})
+    conn.close()
+
+    unidos = entrante.merge(actual, on='codigo', how='outer', suffixes=('', '_actual'), indicator=True)
+    en_ambos = unidos['_merge'] == 'both'
+
+    distinto = pd.Series(False, index=unidos.index)
+    for col in _COLUMNAS_TEXTO_PRODUCTO:
+        distinto |= unidos[col].fillna('').astype(str) != unidos[f'{col}_actual'].fillna('').astype(str)
+    distinto |= (pd.to_numeric(unidos['stock_sistema'], errors='coerce')
+                 != pd.to_numeric(unidos['stock_sistema_actual'], errors='coerce'))
+
+    eliminados = unidos.loc[unidos['_merge'] == 'right_only', 'codigo'] if eliminar_faltantes else pd.Series(dtype=str)
+    return {
+        'nuevos': unidos.loc[unidos['_merge'] == 'left_only', COLUMNAS_PRODUCTO].reset_index(drop=True),
+        'modificados': unidos.loc[en_ambos & distinto, COLUMNAS_PRODUCTO].reset_index(drop=True),
+        'eliminados': eliminados.tolist(),
+        'sin_cambios': int((en_ambos & ~distinto).sum()),
+    }
+
+def _filas_producto(df, columnas):
+    """Tuplas para executemany, con None en lugar de NaN y stock entero"""
+    df = df[columnas].astype(object).where(df[columnas].notna(), None)
+    if 'stock_sistema' in columnas:
+        df['stock_sistema'] = [int(v) if v is not None else 0 for v in df['stock_sistema']]
+    return list(df.itertuples(index=False, name=None))
+
+def aplicar_cambios_catalogo(cambios):
+    """
+    Escribir los cambios de calcular_cambios_catalogo en una sola transacción
+    (incluye registrar las marcas nuevas). Devuelve las cantidades aplicadas.
+    """
+    nuevos, modificados, eliminados = cambios['nuevos'], cambios['modificados'], cambios['eliminados']
+    if nuevos.empty and modificados.empty and not eliminados:
+        return {'nuevos': 0, 'modificados': 0, 'eliminados': 0}
+
+    with transaccion() as conn:
+        c = conn.cursor()
+        anteriores = _marcas_de_codigos(c, list(modificados['codigo']) + list(eliminados))
+        c.executemany('''INSERT INTO productos (codigo, producto, marca, area, stock_sistema)
+                         VALUES (?, ?, ?, ?, ?)''', _filas_producto(nuevos, COLUMNAS_PRODUCTO))
+        c.executemany('''UPDATE productos SET producto = ?, marca = ?, area = ?, stock_sistema = ?
+                         WHERE codigo = ?''',
+                      _filas_producto(modificados, COLUMNAS_PRODUCTO[1:] + ['codigo']))
+        c.executemany("DELETE FROM productos WHERE codigo = ?", [(codigo,) for codigo in eliminados])
+        _registrar_marcas(c, pd.concat([nuevos['marca'], modificados['marca']]).unique())
+        _quitar_marcas_sin_productos(c, anteriores)
+        _marcar_cambio_catalogo(c)
+    _invalidar_marcas()
+
+    return {'nuevos': len(nuevos), 'modificados': len(modificados), 'eliminados': len(eliminados)}
+
+# ======================================================
+# HISTORIAL DE IMPORTACIONES
+# ======================================================
+# Cada importación guarda la huella (SHA-256) del archivo y la versión del
+# catálogo que dejó. Si se vuelve a subir el mismo archivo y el catálogo no
+# cambió desde entonces, no hay nada que leer ni comparar.
+COLUMNAS_IMPORTACION = ['fecha', 'usuario', 'archivo', 'huella', 'resultado', 'filas', 'nuevos',
+                        'modificados', 'eliminados', 'sin_cambios', 'eliminar_faltantes',
+                        'version_catalogo', 'segundos_lectura', 'segundos_comparacion',
+                        'segundos_escritura']
+
+def registrar_importacion(**datos):
+    """Agregar una importación al historial (claves de COLUMNAS_IMPORTACION; fecha y versión por defecto)"""
+    datos.setdefault('fecha', pd.Timestamp.now().isoformat(timespec='seconds'))
+    if 'version_catalogo' not in datos:
+        datos['version_catalogo'] = version_catalogo()
+    conn = get_connection()
+    conn.execute(f'''INSERT INTO importaciones ({", ".join(COLUMNAS_IMPORTACION)})
+                     VALUES ({", ".join("?" * len(COLUMNAS_IMPORTACION))})''',
+                 [datos.get(col) for col in COLUMNAS_IMPORTACION])
+    conn.commit()
+    conn.close()
+
+def importacion_vigente(huella, eliminar_faltantes=False):
+    """
+    Última importación de un archivo con esta huella si el catálogo sigue en
+    la versión que dejó (dict), o None. Pedir eliminar faltantes solo se
+    omite si esa importación también los eliminó.
+    """
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    fila = conn.execute('''SELECT * FROM importaciones
+                           WHERE huella = ? AND resultado != 'ERROR'
+                           ORDER BY id DESC LIMIT 1''', (huella,)).fetchone()
+    conn.close()
+    if fila is None or fila['version_catalogo'] != version_catalogo():
+        return None
+    if eliminar_faltantes and not fila['eliminar_faltantes']:
+        return None
+    return dict(fila)
+
+def obtener_historial_importaciones(limite=50):
+    """Últimas importaciones, de la más reciente a la más antigua"""
+    conn = get_connection()
+    df = pd.read_sql_query(f'''SELECT {", ".join(COLUMNAS_IMPORTACION)} FROM importaciones
+                               ORDER BY id DESC LIMIT ?''', conn, params=(limite,))
+    conn.close()
+    return df
+
 # ======================================================
 # FUNCIONES PARA REPORTES
 # ======================================================
 
 def obtener_resumen_por_marca():
-    """Obtener resumen de conteos agrupado por marca"""
+    """Obtener resumen de conteos (campaña activa) agrupado por marca"""
     conn = get_connection()
+    campana = _campana_activa(conn.cursor())
     
     query = """
     SELECT 
@@ -220,10 +1531,43 @@ def obtener_resumen_por_marca():
         COALESCE(SUM(p.stock_sistema), 0) as stock_total,
         COALESCE(SUM(c.diferencia), 0) as diferencia_neta
     FROM productos p
-    LEFT JOIN conteos c ON p.codigo = c.codigo
+    LEFT JOIN conteos_vigentes c ON c.campana = ? AND c.codigo = p.codigo
     GROUP BY p.marca
     """
     
-    df = pd.read_sql_query(query, conn)
+    df = pd.read_sql_query(query, conn, params=[campana])
     conn.close()
-    return df
\ No newline at end of file
+    return df
+
+def resumen_tienda():
+    """Totales de la tienda activa: productos, contados, unidades, diferencias y precisión"""
+    conn = get_connection()
+    c = conn.cursor()
+    productos, stock_total = c.execute(
+        "SELECT COUNT(*), COALESCE(SUM(stock_sistema), 0) FROM productos").fetchone()
+    conn.close()
+    
+    totales = obtener_totales_estado()
+    contados = sum(t['productos'] for t in totales.values())
+    exactos = totales['EXACTO']['productos']
+    return {
+        'productos': productos,
+        'stock_total': stock_total,
+        'productos_contados': contados,
+        'conteo_total': sum(t['conteo_fisico'] for t in totales.values()),
+        'diferencia_neta': sum(t['diferencia'] for t in totales.values()),
+        'exactos': exactos,
+        'leves': totales['LEVE']['productos'],
+        'criticos': totales['CRÍTICO']['productos'],
+        'precision': round(exactos / contados * 100, 1) if contados else 0.0,
+    }
+
+# ======================================================
+# INSTRUMENTACIÓN DE TIEMPOS
+# ======================================================
+# Cada función de este módulo registra su duración en metricas
+# (los generadores iterar_* y la transacción se miden donde se usan, y el
+# enrutado de tiendas es demasiado frecuente y barato para medirlo)
+_SIN_MEDIR = {"sufijo_tienda", "ruta_tienda", "usar_tienda", "tienda_actual", "en_tienda", "transaccion"}
+metricas.instrumentar(globals(), "db",
+                      filtro=lambda nombre: not nombre.startswith("iterar_") and nombre not in _SIN_MEDIR)
@@ -0,0 +1,798 @@
+import io
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+import database as db
+import metricas
+import ritmo_escaneo
+
+log = logging.getLogger(__name__)
+
+# ======================================================
+# ARCHIVOS DE ESCANEOS Y CONTEOS
+# ======================================================
+# Capa de almacenamiento de escaneos sin dependencia de streamlit,
+# compartida por la página de Conteo Físico y cualquier otro punto de entrada.
+# Nombres de la tienda por defecto en la campaña inicial; cada tienda y cada
+# campaña tienen sus propios archivos (ver archivo_escaneos/archivo_conteos).
+ARCHIVO_CONTEOS = "conteos.csv"
+ARCHIVO_ESCANEOS = "escaneos_detallados.csv"
+
+COLUMNAS_ESCANEOS = ["timestamp", "usuario", "codigo", "producto", "marca", "area",
+                     "cantidad_escaneada", "total_acumulado", "stock_sistema", "tipo_operacion"]
+COLUMNAS_CONTEOS = ["fecha", "usuario", "codigo", "producto", "marca", "area",
+                    "stock_sistema", "conteo_fisico", "diferencia"]
+
+# Evento de la bitácora que reinicia el conteo del día de un usuario para un
+# código: su cantidad_escaneada negativa compensa lo escaneado hasta entonces
+TIPO_RESET = "RESET"
+
+def sin_reinicios(df):
+    """Solo las filas de escaneo de la bitácora (sin los eventos RESET)"""
+    if 'tipo_operacion' not in df.columns:
+        return df
+    return df[df['tipo_operacion'] != TIPO_RESET]
+
+def archivo_escaneos(tienda=None, campana=None):
+    """Bitácora de escaneos de la tienda y de la campaña (por defecto las activas)"""
+    return db.ruta_campana(db.ruta_tienda(ARCHIVO_ESCANEOS, tienda), campana or db.campana_activa(tienda))
+
+def archivo_conteos(tienda=None, campana=None):
+    """Resumen diario de conteos de la tienda y de la campaña (por defecto las activas)"""
+    return db.ruta_campana(db.ruta_tienda(ARCHIVO_CONTEOS, tienda), campana or db.campana_activa(tienda))
+
+def leer_csv(ruta, **kwargs):
+    """Leer un CSV midiendo el tiempo de lectura"""
+    with metricas.medir(f"csv.leer.{os.path.basename(ruta)}"):
+        return pd.read_csv(ruta, **kwargs)
+
+def escribir_csv(df, ruta, operacion=None, **kwargs):
+    """Escribir un CSV midiendo el tiempo de escritura"""
+    with metricas.medir(operacion or f"csv.escribir.{os.path.basename(ruta)}"):
+        df.to_csv(ruta, **kwargs)
+
+# ======================================================
+# CONTEOS (RESUMEN DIARIO POR USUARIO Y CÓDIGO)
+# ======================================================
+# El resumen admite filas agregadas al final: por usuario, código y día gana
+# la última, y una fila sin conteo_fisico (reinicio) anula el conteo de ese
+# día. cargar_conteos devuelve solo las filas vigentes y toda reescritura
+# completa del archivo lo compacta.
+
+# Filas vigentes del resumen por archivo, con la firma (mtime, tamaño) con que se contaron
+_filas_conteos = {}
+
+def _resumen_vigente(df):
+    """Filas vigentes del resumen: la última por usuario, código y día, sin las anuladas"""
+    if df.empty:
+        return df
+    claves = pd.DataFrame({
+        'usuario': df['usuario'].values,
+        'codigo': df['codigo'].astype(str).values,
+        'dia': df['fecha'].astype(str).str[:10].values,
+    })
+    vigentes = ~claves.duplicated(keep='last').values & df['conteo_fisico'].notna().values
+    df = df[vigentes].reset_index(drop=True)
+
+    # Las filas de anulación dejan columnas numéricas como float al leer el archivo
+    for col in ('stock_sistema', 'conteo_fisico', 'diferencia'):
+        if col in df.columns and df[col].dtype.kind == 'f' and df[col].notna().all():
+            df[col] = df[col].astype('int64')
+    return df
+
+def _firma(ruta):
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+def _recordar_filas_conteos(ruta, filas):
+    _filas_conteos[ruta] = (_firma(ruta), filas)
+
+def contar_conteos():
+    """
+    Filas del resumen de conteos sin cargarlo: el contador se guarda al leer
+    o escribir el archivo y solo se vuelve a contar si otro proceso lo cambió.
+    """
+    ruta = archivo_conteos()
+    firma = _firma(ruta)
+    if firma is None:
+        return 0
+
+    guardado = _filas_conteos.get(ruta)
+    if guardado is None or guardado[0] != firma:
+        with metricas.medir("csv.contar.conteos"):
+            filas = len(_resumen_vigente(pd.read_csv(ruta, usecols=['fecha', 'usuario', 'codigo', 'conteo_fisico'])))
+        _filas_conteos[ruta] = guardado = (firma, filas)
+    return guardado[1]
+
+def cargar_conteos():
+    """Cargar conteos desde CSV con soporte para marca"""
+    ruta = archivo_conteos()
+    if os.path.exists(ruta):
+        df = leer_csv(ruta)
+
+        # Asegurar que todas las columnas requeridas existan
+        for col in COLUMNAS_CONTEOS:
+            if col not in df.columns:
+                if col == 'marca':
+                    df[col] = 'SIN MARCA'
+                else:
+                    df[col] = None
+
+        df = _resumen_vigente(df)
+        _recordar_filas_conteos(ruta, len(df))
+        return df
+    else:
+        return pd.DataFrame(columns=COLUMNAS_CONTEOS)
+
+def guardar_conteos(df):
+    """Guardar conteos en CSV (mantener compatibilidad); queda compactado"""
+    df = _resumen_vigente(df)
+    ruta = archivo_conteos()
+    escribir_csv(df, ruta, index=False)
+    _recordar_filas_conteos(ruta, len(df))
+
+def actualizar_resumen_conteo(usuario, codigo, producto, area, stock_sistema, nuevo_total, marca='SIN MARCA'):
+    """Actualizar el resumen diario de conteos (ahora incluye marca)"""
+    actualizar_resumen_conteos(usuario, [{
+        'codigo': codigo, 'producto': producto, 'marca': marca, 'area': area,
+        'stock_sistema': stock_sistema, 'total_acumulado': nuevo_total
+    }])
+
+def _filas_resumen(usuario, finales_df, ahora):
+    """Filas del resumen (COLUMNAS_CONTEOS) con el total de hoy de cada código"""
+    return pd.DataFrame({
+        'fecha': ahora.strftime('%Y-%m-%d %H:%M:%S'),
+        'usuario': usuario,
+        'codigo': finales_df['codigo'],
+        'producto': finales_df['producto'],
+        'marca': finales_df['marca'],
+        'area': finales_df['area'],
+        'stock_sistema': finales_df['stock_sistema'],
+        'conteo_fisico': finales_df['total_acumulado'],
+        'diferencia': finales_df['diferencia'],
+    }, columns=COLUMNAS_CONTEOS)
+
+def _encabezado(ruta):
+    """Columnas de la primera línea del CSV (None si no existe o está vacío)"""
+    if not os.path.exists(ruta) or os.path.getsize(ruta) == 0:
+        return None
+    with open(ruta, encoding='utf-8') as archivo:
+        return archivo.readline().strip().split(',')
+
+def _anexar_resumen_conteos(filas_nuevas, cambio_vigentes):
+    """
+    Agregar filas al final del resumen sin reescribirlo. cambio_vigentes es
+    cuánto cambian las filas vigentes (para mantener el contador; None si no
+    se sabe y hay que volver a contar). Un archivo con otras columnas se
+    reescribe completo, una sola vez.
+    """
+    ruta = archivo_conteos()
+    encabezado = _encabezado(ruta)
+    if encabezado is not None and encabezado != COLUMNAS_CONTEOS:
+        guardar_conteos(pd.concat([cargar_conteos()[COLUMNAS_CONTEOS], filas_nuevas], ignore_index=True))
+        return
+    firma = _firma(ruta) if encabezado is not None else None
+
+    escribir_csv(filas_nuevas, ruta, operacion=f"csv.anexar.{os.path.basename(ruta)}",
+                 mode='a' if firma else 'w', header=firma is None, index=False)
+
+    # Mantener el contador de filas vigentes si estaba al día
+    guardado = _filas_conteos.get(ruta)
+    if cambio_vigentes is None:
+        _filas_conteos.pop(ruta, None)
+    elif firma is None:
+        _recordar_filas_conteos(ruta, cambio_vigentes)
+    elif guardado is not None and guardado[0] == firma:
+        _recordar_filas_conteos(ruta, guardado[1] + cambio_vigentes)
+
+def actualizar_resumen_conteos(usuario, finales, nuevos=None, momento=None):
+    """
+    Actualizar el resumen diario con los totales finales de varios códigos
+    (dicts con codigo, producto, marca, area, stock_sistema, total_acumulado).
+    Las filas se agregan al final sin leer el archivo: la última fila del día
+    de cada código es la que vale. nuevos es cuántos códigos no tenían fila
+    ese día (None si no se sabe); momento es la fecha de las filas (ahora si
+    es None). Los errores se propagan al llamador.
+    """
+    finales_df = pd.DataFrame(finales).drop_duplicates('codigo', keep='last')
+    finales_df['codigo'] = finales_df['codigo'].astype(str)
+    finales_df['diferencia'] = finales_df['total_acumulado'] - finales_df['stock_sistema']
+
+    _anexar_resumen_conteos(_filas_resumen(usuario, finales_df, momento or datetime.now()), nuevos)
+
+def quitar_resumen_conteo(usuario, codigo):
+    """
+    Anular la fila de hoy de un usuario para un código: se agrega al final
+    una fila sin conteo_fisico, sin leer ni reescribir el resumen.
+    """
+    anulacion = pd.DataFrame([{
+        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'usuario': usuario,
+        'codigo': str(codigo),
+    }], columns=COLUMNAS_CONTEOS)
+    _anexar_resumen_conteos(anulacion, -1)
+
+# ======================================================
+# BITÁCORA DE ESCANEOS DETALLADOS
+# ======================================================
+def cargar_escaneos_detallados():
+    """Cargar escaneos desde CSV asegurando columna marca"""
+    ruta = archivo_escaneos()
+    if os.path.exists(ruta):
+        try:
+            df = leer_csv(ruta)
+
+            # Asegurar que todas las columnas requeridas existan
+            for col in COLUMNAS_ESCANEOS:
+                if col not in df.columns:
+                    if col == 'marca':
+                        df[col] = 'SIN MARCA'  # Valor por defecto para marca
+                    else:
+                        df[col] = None
+
+            # Convertir tipos de datos
+            if 'timestamp' in df.columns:
+                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+            if 'cantidad_escaneada' in df.columns:
+                df['cantidad_escaneada'] = pd.to_numeric(df['cantidad_escaneada'], errors='coerce').fillna(0).astype(int)
+            if 'total_acumulado' in df.columns:
+                df['total_acumulado'] = pd.to_numeric(df['total_acumulado'], errors='coerce').fillna(0).astype(int)
+            if 'stock_sistema' in df.columns:
+                df['stock_sistema'] = pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int)
+
+            return df
+        except Exception as e:
+            print(f"Error cargando escaneos: {e}")
+            return pd.DataFrame(columns=COLUMNAS_ESCANEOS)
+    else:
+        return pd.DataFrame(columns=COLUMNAS_ESCANEOS)
+
+def leer_ultimos_escaneos(n=5, tam_bloque=64 * 1024):
+    """
+    Últimas n filas de la bitácora (eventos RESET incluidos), leídas desde el
+    final del archivo: el costo no depende del tamaño de la bitácora.
+    """
+    ruta = archivo_escaneos()
+    if not os.path.exists(ruta) or os.path.getsize(ruta) == 0:
+        return pd.DataFrame(columns=COLUMNAS_ESCANEOS)
+
+    with metricas.medir(f"csv.cola.{os.path.basename(ruta)}"), open(ruta, 'rb') as archivo:
+        encabezado = archivo.readline()
+        inicio_datos = archivo.tell()
+        tamano = archivo.seek(0, os.SEEK_END)
+        desde = tamano
+        while True:
+            desde = max(inicio_datos, desde - tam_bloque)
+            archivo.seek(desde)
+            lineas = archivo.read(tamano - desde).splitlines()
+            if desde > inicio_datos:
+                lineas = lineas[1:]  # la primera puede estar cortada
+            lineas = [linea for linea in lineas if linea.strip()]
+            if len(lineas) >= n or desde == inicio_datos:
+                break
+
+    contenido = b"\n".join([encabezado.rstrip(b"\r\n")] + lineas[-n:])
+    df = pd.read_csv(io.BytesIO(contenido), dtype={'codigo': str})
+    for col in COLUMNAS_ESCANEOS:
+        if col not in df.columns:
+            df[col] = 'SIN MARCA' if col == 'marca' else None
+    return df
+
+def guardar_escaneo_detallado(escaneo_data):
+    """Guardar UN escaneo individual PERMANENTEMENTE con marca incluida"""
+    return guardar_escaneos_detallados([escaneo_data])
+
+def _normalizar_bitacora(ruta):
+    """Reescribir una bitácora antigua con las columnas actuales, una sola vez"""
+    df = leer_csv(ruta)
+    for col in COLUMNAS_ESCANEOS:
+        if col not in df.columns:
+            df[col] = None
+    escribir_csv(df[COLUMNAS_ESCANEOS], ruta, index=False)
+
+def guardar_escaneos_detallados(escaneos):
+    """
+    Agregar escaneos al final de la bitácora (modo 'append'): el costo no
+    depende del tamaño del archivo.
+    """
+    try:
+        for escaneo_data in escaneos:
+            # Asegurar tipos de datos
+            escaneo_data['cantidad_escaneada'] = int(escaneo_data['cantidad_escaneada'])
+            escaneo_data['total_acumulado'] = int(escaneo_data['total_acumulado'])
+            escaneo_data['stock_sistema'] = int(escaneo_data['stock_sistema'])
+
+            # Asegurar que la marca esté presente
+            if 'marca' not in escaneo_data:
+                escaneo_data['marca'] = 'SIN MARCA'
+
+        # Crear DataFrame con el orden correcto
+        nuevos = pd.DataFrame([{col: e.get(col, None) for col in COLUMNAS_ESCANEOS} for e in escaneos],
+                              columns=COLUMNAS_ESCANEOS)
+
+        ruta = archivo_escaneos()
+        encabezado = _encabezado(ruta)
+        existe = encabezado is not None
+        if existe and encabezado != COLUMNAS_ESCANEOS:
+            _normalizar_bitacora(ruta)
+
+        escribir_csv(nuevos, ruta, operacion=f"csv.anexar.{os.path.basename(ruta)}",
+                     mode='a' if existe else 'w', header=not existe, index=False)
+
+        return True, "Escaneo guardado permanentemente"
+    except Exception as e:
+        return False, f"Error al guardar escaneo: {str(e)}"
+
+def total_escaneado_hoy(usuario, codigo):
+    """Calcula el total escaneado hoy por un usuario para un código específico"""
+    try:
+        asegurar_totales_diarios()
+        return db.obtener_total_diario(usuario, codigo, datetime.now().strftime('%Y-%m-%d'))
+    except Exception as e:
+        print(f"Error calculando total: {e}")
+        return 0
+
+def reconstruir_totales_diarios(fecha=None, tam_bloque=1_000_000):
+    """Recalcular los totales del día por usuario y código leyendo la bitácora por bloques"""
+    fecha = fecha or datetime.now().strftime('%Y-%m-%d')
+    parciales = []
+    ruta = archivo_escaneos()
+    if os.path.exists(ruta):
+        with metricas.medir(f"csv.leer.{os.path.basename(ruta)}"):
+            for bloque in pd.read_csv(ruta, usecols=['timestamp', 'usuario', 'codigo', 'cantidad_escaneada'],
+                                      dtype={'codigo': str, 'timestamp': str}, chunksize=tam_bloque):
+                bloque = bloque[bloque['timestamp'].str.startswith(fecha, na=False)]
+                if bloque.empty:
+                    continue
+                bloque['cantidad_escaneada'] = pd.to_numeric(bloque['cantidad_escaneada'], errors='coerce').fillna(0)
+                parciales.append(bloque.groupby(['usuario', 'codigo'])['cantidad_escaneada'].sum())
+
+    if parciales:
+        totales = pd.concat(parciales).groupby(level=[0, 1]).sum().reset_index()
+        totales.columns = ['usuario', 'codigo', 'total']
+    else:
+        totales = pd.DataFrame(columns=['usuario', 'codigo', 'total'])
+    db.reemplazar_totales_diarios(fecha, totales)
+
+def asegurar_totales_diarios():
+    """Poblar los totales del día desde la bitácora la primera vez en cada día"""
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    if not db.totales_diarios_poblados(hoy):
+        reconstruir_totales_diarios(hoy)
+
+# ======================================================
+# EXPORTACIÓN POR BLOQUES
+# ======================================================
+TAM_BLOQUE_EXPORTACION = 100_000
+
+def iterar_escaneos(fecha_inicio=None, fecha_fin=None, usuario=None, tam_bloque=TAM_BLOQUE_EXPORTACION):
+    """Leer la bitácora por bloques aplicando los filtros de fecha y usuario"""
+    ruta = archivo_escaneos()
+    if not os.path.exists(ruta):
+        return
+
+    for bloque in pd.read_csv(ruta, dtype={'codigo': str}, chunksize=tam_bloque):
+        for col in COLUMNAS_ESCANEOS:
+            if col not in bloque.columns:
+                bloque[col] = 'SIN MARCA' if col == 'marca' else None
+
+        bloque['fecha'] = pd.to_datetime(bloque['timestamp'], errors='coerce', format='ISO8601').dt.date
+        mask = bloque['fecha'].notna()
+        if fecha_inicio is not None:
+            mask &= bloque['fecha'] >= fecha_inicio
+        if fecha_fin is not None:
+            mask &= bloque['fecha'] <= fecha_fin
+        if usuario and usuario != "Todos":
+            mask &= bloque['usuario'] == usuario
+
+        if mask.any():
+            yield bloque[mask]
+
+def csv_por_bloques(bloques, columnas):
+    """Convertir DataFrames por bloques en trozos de CSV (bytes) con un solo encabezado"""
+    encabezado = True
+    for bloque in bloques:
+        if bloque.empty:
+            continue
+        yield bloque.to_csv(index=False, header=encabezado, columns=columnas).encode('utf-8')
+        encabezado = False
+
+    if encabezado:
+        yield pd.DataFrame(columns=columnas).to_csv(index=False).encode('utf-8')
+
+def volcar_a_archivo(trozos, sufijo=".csv"):
+    """Escribir los trozos de una exportación en un archivo temporal y devolver su ruta"""
+    with tempfile.NamedTemporaryFile("wb", suffix=sufijo, delete=False) as archivo:
+        for trozo in trozos:
+            archivo.write(trozo)
+    return archivo.name
+
+# ======================================================
+# VERSIÓN DE LOS DATOS (PARA CACHÉS)
+# ======================================================
+def version_datos():
+    """
+    Huella de la bitácora, los conteos y la base de datos de la tienda activa
+    (fecha de modificación y tamaño). Cambia con cualquier escritura; sirve
+    como clave de caché.
+    """
+    huella = [db.tienda_actual()]
+    for ruta in (archivo_escaneos(), archivo_conteos(), db.ruta_tienda(db.DB_PATH)):
+        try:
+            info = os.stat(ruta)
+            huella.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            huella.append(None)
+    return tuple(huella)
+
+# ======================================================
+# AGREGADOS EN BASE DE DATOS ALIMENTADOS POR LA BITÁCORA
+# ======================================================
+def reconstruir_escaneado_por_producto(tam_bloque=1_000_000):
+    """Recalcular la cantidad escaneada por producto leyendo la bitácora por bloques"""
+    parciales = []
+    ruta = archivo_escaneos()
+    if os.path.exists(ruta):
+        with metricas.medir(f"csv.leer.{os.path.basename(ruta)}"):
+            for bloque in pd.read_csv(ruta, usecols=lambda col: col in ('codigo', 'cantidad_escaneada', 'tipo_operacion'),
+                                      dtype={'codigo': str}, chunksize=tam_bloque):
+                bloque['cantidad_escaneada'] = pd.to_numeric(bloque['cantidad_escaneada'], errors='coerce').fillna(0)
+                # Los eventos RESET descuentan cantidad pero no son escaneos
+                bloque['escaneo'] = (bloque['tipo_operacion'] != TIPO_RESET
+                                     if 'tipo_operacion' in bloque.columns else True)
+                parciales.append(bloque.groupby('codigo').agg(sum=('cantidad_escaneada', 'sum'),
+                                                              count=('escaneo', 'sum')))
+
+    if parciales:
+        agregado = pd.concat(parciales).groupby(level=0).sum()
+    else:
+        agregado = pd.DataFrame(columns=['sum', 'count'])
+
+    agregado = agregado.reset_index()
+    agregado.columns = ['codigo', 'cantidad', 'escaneos']
+    agregado['cantidad'] = agregado['cantidad'].astype(int)
+    agregado['escaneos'] = agregado['escaneos'].astype(int)
+    db.reemplazar_escaneado_por_producto(agregado)
+
+def asegurar_agregados():
+    """Poblar los agregados de la base desde la bitácora la primera vez"""
+    if not db.escaneado_por_producto_poblado():
+        reconstruir_escaneado_por_producto()
+
+# ======================================================
+# REGISTRO DE ESCANEOS (ÚNICO PUNTO DE ESCRITURA)
+# ======================================================
+# La bitácora y el resumen se anexan con la base bloqueada (el orden de los
+# archivos sigue al de la base entre procesos). Si la transacción falla,
+# incluso al confirmarla, los archivos se recortan al tamaño que tenían.
+
+def _preparar_archivos():
+    """Llevar la bitácora y el resumen a las columnas actuales antes de anexar en una transacción"""
+    ruta = archivo_escaneos()
+    encabezado = _encabezado(ruta)
+    if encabezado is not None and encabezado != COLUMNAS_ESCANEOS:
+        _normalizar_bitacora(ruta)
+    ruta = archivo_conteos()
+    encabezado = _encabezado(ruta)
+    if encabezado is not None and encabezado != COLUMNAS_CONTEOS:
+        guardar_conteos(cargar_conteos()[COLUMNAS_CONTEOS])
+
+def _tamanos_archivos():
+    """Tamaño actual de la bitácora y del resumen (None si no existen)"""
+    return {ruta: os.path.getsize(ruta) if os.path.exists(ruta) else None
+            for ruta in (archivo_escaneos(), archivo_conteos())}
+
+def _recortar_archivos(tamanos):
+    """Deshacer lo anexado después de tomar los tamaños"""
+    for ruta, tamano in tamanos.items():
+        try:
+            if tamano is None:
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            elif os.path.getsize(ruta) > tamano:
+                with open(ruta, 'r+b') as archivo:
+                    archivo.truncate(tamano)
+        except OSError:
+            log.exception("No se pudo recortar %s tras una transacción fallida", ruta)
+        _filas_conteos.pop(ruta, None)
+
+def registrar_escaneo(usuario, codigo, prod, cantidad):
+    """
+    Registrar un escaneo de un producto del catálogo.
+
+    Guarda el escaneo en la bitácora, registra el conteo en la base de datos,
+    actualiza el resumen diario y alimenta los contadores de ritmo.
+    Devuelve (True, escaneo_data) o (False, mensaje de error).
+    """
+    exito, resultado = registrar_escaneos_lote(usuario, [(codigo, prod, cantidad)])
+    return (True, resultado[0]) if exito else (False, resultado)
+
+def registrar_escaneos_lote(usuario, escaneos):
+    """
+    Registrar varios escaneos de un usuario en una sola transacción.
+
+    escaneos es una lista de (codigo, prod, cantidad), con prod la fila del
+    catálogo (producto, marca, area, stock_sistema). La base se bloquea para
+    escritura mientras se calcula el total acumulado y se anexa la bitácora,
+    así dos procesos (la página y la API) no mezclan totales.
+    Devuelve (True, [escaneo_data, ...]) o (False, mensaje de error).
+    """
+    if not escaneos:
+        return True, []
+
+    filas = []
+    for codigo, prod, cantidad in escaneos:
+        # Obtener marca (asegurar que existe)
+        marca = prod.get("marca", "SIN MARCA")
+        if pd.isna(marca) or marca == "":
+            marca = "SIN MARCA"
+
+        filas.append({
+            "timestamp": datetime.now(),
+            "usuario": usuario,
+            "codigo": codigo,
+            "producto": prod["producto"],
+            "marca": marca,
+            "area": prod["area"],
+            "cantidad_escaneada": int(cantidad),
+            "total_acumulado": 0,
+            "stock_sistema": int(prod["stock_sistema"]),
+            "tipo_operacion": "ESCANEO"
+        })
+
+    return _confirmar_escaneos(usuario, filas)
+
+def _confirmar_escaneos(usuario, filas, contar_ritmo=True):
+    """Escribir filas de escaneo ya armadas en la base, la bitácora y el resumen (una transacción)"""
+    asegurar_totales_diarios()
+    _preparar_archivos()
+
+    # Cada día por separado: los totales y las estadísticas son por fecha
+    por_dia = {}
+    for fila in filas:
+        por_dia.setdefault(fila["timestamp"].strftime("%Y-%m-%d"), []).append(fila)
+
+    tamanos = {}
+    try:
+        with db.transaccion() as conn:
+            tamanos = _tamanos_archivos()
+            for dia, filas_dia in por_dia.items():
+                db.registrar_escaneos_lote(conn, usuario, dia, filas_dia)
+            if contar_ritmo:
+                ritmo_escaneo.registrar_lote(conn, usuario, filas)
+
+            exito, mensaje = guardar_escaneos_detallados(filas)
+            if not exito:
+                raise RuntimeError(mensaje)
+
+            for filas_dia in por_dia.values():
+                # Un código sin total del día antes del lote agrega una fila vigente al resumen
+                primeras = {}
+                for fila in filas_dia:
+                    primeras.setdefault(str(fila["codigo"]), fila)
+                nuevos = sum(fila["total_acumulado"] == int(fila["cantidad_escaneada"])
+                             for fila in primeras.values())
+                actualizar_resumen_conteos(usuario, filas_dia, nuevos=nuevos,
+                                           momento=max(fila["timestamp"] for fila in filas_dia))
+    except Exception as e:
+        _recortar_archivos(tamanos)
+        log.exception("Error al registrar escaneos de %s", usuario)
+        return False, f"Error al registrar escaneos: {str(e)}"
+
+    return True, filas
+
+def reiniciar_conteo(usuario, codigo, prod):
+    """
+    Reiniciar a 0 el conteo de hoy de un usuario para un producto.
+
+    En lugar de reescribir la bitácora se anexa un evento RESET con la
+    cantidad escaneada hoy en negativo, así los totales que suman la bitácora
+    lo respetan y queda el rastro de auditoría; el resumen recibe una fila de
+    anulación (quitar_resumen_conteo). Devuelve (True, cantidad descontada)
+    o (False, mensaje de error).
+    """
+    asegurar_totales_diarios()
+    hoy = datetime.now().strftime("%Y-%m-%d")
+    codigo = str(codigo)
+
+    marca = prod.get("marca", "SIN MARCA")
+    if pd.isna(marca) or marca == "":
+        marca = "SIN MARCA"
+
+    _preparar_archivos()
+    tamanos = {}
+    try:
+        with db.transaccion() as conn:
+            tamanos = _tamanos_archivos()
+            total = db.registrar_reinicio(conn, usuario, codigo, hoy)
+            if total:
+                exito, mensaje = guardar_escaneos_detallados([{
+                    "timestamp": datetime.now(),
+                    "usuario": usuario,
+                    "codigo": codigo,
+                    "producto": prod["producto"],
+                    "marca": marca,
+                    "area": prod["area"],
+                    "cantidad_escaneada": -total,
+                    "total_acumulado": 0,
+                    "stock_sistema": int(prod["stock_sistema"]),
+                    "tipo_operacion": TIPO_RESET
+                }])
+                if not exito:
+                    raise RuntimeError(mensaje)
+
+                quitar_resumen_conteo(usuario, codigo)
+    except Exception as e:
+        _recortar_archivos(tamanos)
+        log.exception("Error al reiniciar el conteo de %s para %s", usuario, codigo)
+        return False, f"Error al reiniciar conteo: {str(e)}"
+
+    return True, total
+
+# ======================================================
+# CARGA DE VOLCADOS DE ESCÁNER (SIN CONEXIÓN)
+# ======================================================
+# Archivo de texto o CSV con una lectura por línea: "codigo",
+# "codigo<sep>cantidad" o "codigo<sep>cantidad<sep>fecha y hora", con
+# separador coma, punto y coma, tabulador, barra o espacios, y encabezado
+# opcional.
+TAM_BLOQUE_VOLCADO = 100_000
+_SEPARADORES_VOLCADO = ["\t", ";", ",", "|"]
+_ENCABEZADOS_CODIGO = {"codigo", "código", "code", "barcode", "ean", "sku"}
+_COLUMNAS_VOLCADO = ["codigo", "cantidad", "momento", "hora"]
+
+def _formato_volcado(primera_linea):
+    """Separador, número de columnas y si la primera línea es encabezado"""
+    linea = primera_linea.strip().lstrip("\ufeff")
+    separador = next((sep for sep in _SEPARADORES_VOLCADO if sep in linea), r"\s+")
+    campos = linea.split() if separador == r"\s+" else linea.split(separador)
+    # Separados por espacios, "2024-05-17 18:30" ocupa dos campos (fecha y hora)
+    columnas = min(len(campos), 4 if separador == r"\s+" else 3)
+
+    primero = campos[0].strip().strip('"').lower() if campos else ""
+    encabezado = primero in _ENCABEZADOS_CODIGO
+    if columnas >= 2 and not encabezado:
+        # "codigo,cantidad" o similar: la segunda columna no es un número
+        try:
+            float(campos[1].strip().strip('"'))
+        except ValueError:
+            encabezado = True
+    return separador, columnas, encabezado
+
+def leer_volcado_escaner(archivo, tam_bloque=TAM_BLOQUE_VOLCADO):
+    """
+    Leer un volcado de escáner por bloques. archivo es una ruta o un objeto
+    tipo archivo (p. ej. el de st.file_uploader). Genera DataFrames con fila
+    (línea física en el archivo, contando las vacías), codigo, cantidad y
+    momento (texto sin convertir; momento vacío si el volcado no lo trae).
+    """
+    if hasattr(archivo, "read"):
+        archivo.seek(0)
+        primera = archivo.readline()
+        archivo.seek(0)
+    else:
+        with open(archivo, "rb") as f:
+            primera = f.readline()
+    if isinstance(primera, bytes):
+        primera = primera.decode("utf-8", errors="replace")
+    if not primera.strip():
+        return
+
+    separador, columnas, encabezado = _formato_volcado(primera)
+    nombres = _COLUMNAS_VOLCADO[:columnas]
+
+    # Las líneas vacías se leen (y luego se descartan) para que fila sea la línea física
+    lector = pd.read_csv(archivo, sep=separador, header=None, names=nombres, usecols=range(columnas),
+                         skiprows=1 if encabezado else 0, dtype=str, chunksize=tam_bloque,
+                         skip_blank_lines=False, encoding="utf-8-sig", encoding_errors="replace")
+    with lector:
+        for bloque in lector:
+            bloque.insert(0, "fila", bloque.index + (2 if encabezado else 1))
+            vacias = bloque[nombres].apply(lambda col: col.fillna("").str.strip() == "").all(axis=1)
+            bloque = bloque[~vacias].copy()
+            if columnas == 1:
+                bloque["cantidad"] = "1"
+            if "hora" in bloque:
+                bloque["momento"] = bloque["momento"].str.cat(bloque.pop("hora"), sep=" ", na_rep="").str.strip()
+            if "momento" not in bloque:
+                bloque["momento"] = None
+            yield bloque
+
+def registrar_volcado_escaner(usuario, archivo, fecha=None, tam_bloque=TAM_BLOQUE_VOLCADO):
+    """
+    Registrar un volcado de escáner completo en una sola transacción.
+
+    Los códigos se resuelven con un único cruce contra el catálogo de la
+    tienda activa; las líneas con código desconocido, cantidad inválida o
+    fecha ilegible o futura se reportan juntas y no se registran. Cada
+    lectura queda con la fecha y hora del volcado si la trae, o con fecha
+    (date elegida por el operador; hoy si es None). Devuelve (True, resumen)
+    o (False, mensaje de error); resumen trae lineas, aceptados, unidades,
+    desconocidos (codigo, lineas, unidades, primera_fila) e invalidos.
+    """
+    ahora = datetime.now()
+    if fecha is None or fecha == ahora.date():
+        momento_defecto = ahora
+    else:
+        momento_defecto = datetime.combine(fecha, datetime.min.time())
+
+    try:
+        bloques = []
+        for bloque in leer_volcado_escaner(archivo, tam_bloque):
+            bloque["codigo"] = bloque["codigo"].fillna("").str.strip().str.replace(r"[\r\n]", "", regex=True)
+            bloque["cantidad"] = pd.to_numeric(bloque["cantidad"].fillna("1").str.strip(), errors="coerce")
+            bloques.append(bloque)
+    except Exception as e:
+        return False, f"Error al leer el archivo: {str(e)}"
+
+    lecturas = (pd.concat(bloques, ignore_index=True) if bloques
+                else pd.DataFrame(columns=["fila", "codigo", "cantidad", "momento"]))
+
+    texto_momento = lecturas["momento"].fillna("").astype(str).str.strip()
+    momentos = pd.to_datetime(texto_momento.where(texto_momento != ""), errors="coerce",
+                              format="mixed", dayfirst=True)
+    momento_valido = (texto_momento == "") | (momentos.notna() & (momentos <= ahora))
+    lecturas["timestamp"] = momentos.fillna(pd.Timestamp(momento_defecto))
+
+    # Cantidad entera positiva, código no vacío y fecha legible que no sea futura
+    mask_valida = ((lecturas["codigo"] != "") & lecturas["cantidad"].notna() &
+                   (lecturas["cantidad"] >= 1) & (lecturas["cantidad"] % 1 == 0) & momento_valido)
+    invalidos = lecturas.loc[~mask_valida, ["fila", "codigo", "cantidad", "momento"]]
+    validas = lecturas[mask_valida].astype({"cantidad": int})
+
+    catalogo = db.obtener_productos_df_por_codigos(validas["codigo"].unique())
+    unidas = validas.merge(catalogo, on="codigo", how="left", indicator=True)
+    encontradas = unidas["_merge"] == "both"
+
+    desconocidos = (unidas[~encontradas]
+                    .groupby("codigo", sort=False)
+                    .agg(lineas=("fila", "size"), unidades=("cantidad", "sum"), primera_fila=("fila", "min"))
+                    .reset_index()
+                    .sort_values("primera_fila"))
+
+    conocidas = unidas[encontradas]
+    resumen = {
+        "lineas": len(lecturas),
+        "aceptados": len(conocidas),
+        "unidades": int(conocidas["cantidad"].sum()),
+        "productos": conocidas["codigo"].nunique(),
+        "desconocidos": desconocidos,
+        "invalidos": invalidos,
+    }
+    if conocidas.empty:
+        return True, resumen
+
+    filas = pd.DataFrame({
+        "timestamp": conocidas["timestamp"],
+        "usuario": usuario,
+        "codigo": conocidas["codigo"],
+        "producto": conocidas["producto"],
+        "marca": conocidas["marca"],
+        "area": conocidas["area"],
+        "cantidad_escaneada": conocidas["cantidad"],
+        "total_acumulado": 0,
+        "stock_sistema": conocidas["stock_sistema"],
+        "tipo_operacion": "VOLCADO",
+    }).to_dict("records")
+
+    # Lecturas de un turno ya terminado: no cuentan para el ritmo en vivo
+    exito, resultado = _confirmar_escaneos(usuario, filas, contar_ritmo=False)
+    if not exito:
+        return False, resultado
+    return True, resumen
+
+# ======================================================
+# INSTRUMENTACIÓN DE TIEMPOS
+# ======================================================
+# leer_csv/escribir_csv ya se miden por archivo; los generadores se miden al
+# consumirlos y las rutas por tienda son triviales
+_SIN_MEDIR = {"leer_csv", "escribir_csv", "iterar_escaneos", "csv_por_bloques",
+              "archivo_escaneos", "archivo_conteos"}
+metricas.instrumentar(globals(), "escaneos", filtro=lambda nombre: nombre not in _SIN_MEDIR)
@@ -0,0 +1,138 @@
+"""
+Exportación de la conciliación (stock vs. conteo) a Excel con memoria constante.
+
+Usa el modo write-only de openpyxl: las filas se escriben una a una y no se
+guardan en memoria. Los datos llegan por bloques ordenados por marca; cada
+marca va en su propia hoja y al inicio del libro una hoja "Resumen" con los
+totales por marca.
+"""
+import os
+import re
+import tempfile
+from datetime import datetime
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+import metricas
+
+COLUMNAS_CONCILIACION = ['codigo', 'producto', 'marca', 'area', 'stock_sistema',
+                         'conteo_fisico', 'diferencia', 'estado']
+ENCABEZADOS_CONCILIACION = ['Código', 'Producto', 'Marca', 'Área', 'Stock Sis.',
+                            'Conteo', 'Diferencia', 'Estado']
+ENCABEZADOS_RESUMEN = ['Marca', 'Productos', 'Contados', 'No escaneados', 'Exactos',
+                       'Sobrantes', 'Faltantes', 'Stock total', 'Conteo total', 'Diferencia neta']
+ANCHOS_CONCILIACION = [14, 40, 20, 18, 12, 12, 12, 14]
+
+_CARACTERES_INVALIDOS = re.compile(r'[\[\]:*?/\\]')
+_MAX_NOMBRE_HOJA = 31
+
+
+def _nombre_hoja(marca, usados):
+    """Nombre de hoja válido en Excel (31 caracteres, sin []:*?/\\) y único"""
+    base = _CARACTERES_INVALIDOS.sub('_', str(marca)).strip("'") or 'SIN MARCA'
+    base = base[:_MAX_NOMBRE_HOJA]
+    nombre = base
+    n = 2
+    while nombre.lower() in usados or nombre.lower() == 'resumen':
+        sufijo = f" ({n})"
+        nombre = base[:_MAX_NOMBRE_HOJA - len(sufijo)] + sufijo
+        n += 1
+    usados.add(nombre.lower())
+    return nombre
+
+
+def _nueva_hoja(wb, titulo, encabezados, anchos):
+    ws = wb.create_sheet(titulo)
+    for i, ancho in enumerate(anchos, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = ancho
+    ws.freeze_panes = 'A2'
+    ws.append(encabezados)
+    return ws
+
+
+def _texto(valor):
+    """Celdas de texto: los nulos de pandas (NaN/None) quedan vacíos"""
+    return None if valor is None or valor != valor else valor
+
+
+def _totales_vacios():
+    return {'productos': 0, 'contados': 0, 'exactos': 0, 'sobrantes': 0, 'faltantes': 0,
+            'stock': 0, 'conteo': 0, 'diferencia': 0}
+
+
+def _escribir_libro(bloques, ruta):
+    with metricas.medir("excel.exportar.conciliacion"):
+        wb = Workbook(write_only=True)
+        ws_resumen = _nueva_hoja(wb, 'Resumen', ENCABEZADOS_RESUMEN, [24] + [14] * 9)
+
+        totales = {}
+        usados = set()
+        marca_actual = None
+        ws = None
+
+        for bloque in bloques:
+            if bloque.empty:
+                continue
+            for fila in bloque[COLUMNAS_CONCILIACION].itertuples(index=False, name=None):
+                codigo, producto, marca, area, stock, conteo, diferencia, estado = fila
+                if marca != marca_actual:
+                    marca_actual = marca
+                    ws = _nueva_hoja(wb, _nombre_hoja(marca, usados), ENCABEZADOS_CONCILIACION,
+                                     ANCHOS_CONCILIACION)
+                    totales.setdefault(marca, _totales_vacios())
+
+                stock, conteo, diferencia = int(stock), int(conteo), int(diferencia)
+                ws.append([str(codigo), _texto(producto), marca, _texto(area),
+                           stock, conteo, diferencia, _texto(estado)])
+
+                t = totales[marca]
+                t['productos'] += 1
+                t['contados'] += conteo > 0
+                t['exactos'] += conteo > 0 and diferencia == 0
+                t['sobrantes'] += diferencia > 0
+                t['faltantes'] += diferencia < 0
+                t['stock'] += stock
+                t['conteo'] += conteo
+                t['diferencia'] += diferencia
+
+        total = _totales_vacios()
+        for marca, t in totales.items():
+            ws_resumen.append([marca, t['productos'], t['contados'], t['productos'] - t['contados'],
+                               t['exactos'], t['sobrantes'], t['faltantes'],
+                               t['stock'], t['conteo'], t['diferencia']])
+            for clave in total:
+                total[clave] += t[clave]
+        ws_resumen.append(['TOTAL', total['productos'], total['contados'],
+                           total['productos'] - total['contados'], total['exactos'],
+                           total['sobrantes'], total['faltantes'],
+                           total['stock'], total['conteo'], total['diferencia']])
+
+        wb.save(ruta)
+
+
+def escribir_conciliacion_excel(bloques, ruta=None):
+    """
+    Escribir la conciliación en un libro .xlsx y devolver su ruta.
+
+    bloques: DataFrames con COLUMNAS_CONCILIACION, ordenados por marca
+    (una marca puede continuar en el bloque siguiente). Solo se guardan en
+    memoria los totales por marca para la hoja Resumen.
+    """
+    temporal = ruta is None
+    if temporal:
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as archivo:
+            ruta = archivo.name
+
+    try:
+        _escribir_libro(bloques, ruta)
+    except Exception:
+        if temporal:
+            os.remove(ruta)
+        raise
+    return ruta
+
+
+def nombre_archivo_excel(prefijo):
+    """Nombre de descarga con fecha y hora"""
+    return f"{prefijo}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
@@ -0,0 +1,165 @@
+"""
+Lectura de archivos de stock con varias hojas y varios archivos en paralelo.
+
+Las hojas de todos los archivos se reparten en un pool de procesos (hasta
+uno por núcleo); cada tarea abre su libro una sola vez y lee un grupo de
+hojas. Con un solo núcleo se lee en el proceso actual, un libro a la vez.
+Las hojas sin las columnas requeridas se omiten y se informan. Los resultados se unen
+en el orden de los archivos y de sus hojas, y los códigos repetidos se
+resuelven con una regla explícita (REGLAS_DUPLICADOS).
+
+Este módulo no depende de streamlit: los procesos hijos lo importan sin
+cargar app.py.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import metricas
+
+COLUMNAS_STOCK = ['codigo', 'producto', 'marca', 'area', 'stock_sistema']
+COLUMNAS_REQUERIDAS = {'codigo', 'producto', 'area', 'stock_sistema'}
+
+REGLAS_DUPLICADOS = {
+    'ultimo': "La última aparición gana (orden de archivos y hojas)",
+    'primero': "La primera aparición gana",
+    'sumar': "Sumar el stock de todas las apariciones (datos de la primera)",
+}
+
+
+def _contexto_procesos():
+    """forkserver si existe: no copia los hilos del servidor de streamlit como fork"""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    contexto = multiprocessing.get_context("forkserver")
+    # pandas y openpyxl se importan una sola vez en el servidor, no en cada proceso
+    contexto.set_forkserver_preload([__name__])
+    return contexto
+
+
+def listar_hojas(ruta):
+    """Nombres de las hojas de un libro"""
+    with pd.ExcelFile(ruta) as libro:
+        return list(libro.sheet_names)
+
+
+def leer_hoja(libro, hoja):
+    """
+    Leer y normalizar una hoja (libro es una ruta o un pd.ExcelFile abierto):
+    columnas en minúscula, marca por defecto, códigos limpios y stock entero.
+    Devuelve (DataFrame, None) o (None, motivo) si la hoja no tiene las
+    columnas requeridas.
+    """
+    df = pd.read_excel(libro, sheet_name=hoja, dtype=str,
+                       usecols=lambda x: str(x).strip().lower() in COLUMNAS_STOCK)
+    df.columns = [str(col).strip().lower() for col in df.columns]
+
+    faltantes = COLUMNAS_REQUERIDAS - set(df.columns)
+    if faltantes:
+        return None, f"Faltan columnas: {', '.join(sorted(faltantes))}"
+
+    if 'marca' not in df.columns:
+        df['marca'] = 'SIN MARCA'
+    df = df[COLUMNAS_STOCK].copy()
+    df['codigo'] = df['codigo'].fillna('').str.strip().str.replace(r'[\r\n]', '', regex=True)
+    df['stock_sistema'] = pd.to_numeric(df['stock_sistema'], errors='coerce').fillna(0).astype(int)
+    return df[df['codigo'] != ''].reset_index(drop=True), None
+
+
+def _leer_tarea(tarea):
+    """
+    Leer un grupo de hojas de un libro abriéndolo una sola vez. tarea es
+    (indice del archivo, nombre, ruta, hojas) con hojas una lista de
+    (indice, hoja), o None para todas. Devuelve [(orden, nombre, hoja, df, motivo)].
+    """
+    i_archivo, nombre, ruta, hojas = tarea
+    with pd.ExcelFile(ruta) as libro:
+        if hojas is None:
+            hojas = list(enumerate(libro.sheet_names))
+        return [((i_archivo, i_hoja), nombre, hoja, *leer_hoja(libro, hoja)) for i_hoja, hoja in hojas]
+
+
+def _repartir_hojas(archivos, procesos):
+    """Tareas de hasta ceil(hojas totales / procesos) hojas, sin mezclar libros"""
+    hojas_por_archivo = [list(enumerate(listar_hojas(ruta))) for _, ruta in archivos]
+    total = sum(len(hojas) for hojas in hojas_por_archivo)
+    tam = max(1, -(-total // procesos))
+
+    tareas = []
+    for i_archivo, ((nombre, ruta), hojas) in enumerate(zip(archivos, hojas_por_archivo)):
+        for inicio in range(0, len(hojas), tam):
+            tareas.append((i_archivo, nombre, ruta, hojas[inicio:inicio + tam]))
+    return tareas
+
+
+def resolver_duplicados(df, regla='ultimo'):
+    """
+    Dejar una fila por código según la regla. df trae las filas en orden de
+    aparición. Devuelve (DataFrame sin duplicados, DataFrame de duplicados
+    con codigo, apariciones y origenes).
+    """
+    if regla not in REGLAS_DUPLICADOS:
+        raise ValueError(f"Regla de duplicados desconocida: {regla}")
+
+    repetidos = df['codigo'].duplicated(keep=False)
+    origen = df.loc[repetidos, 'archivo'] + ' / ' + df.loc[repetidos, 'hoja']
+    duplicados = (df.loc[repetidos, ['codigo']].assign(origen=origen)
+                  .groupby('codigo', sort=False)['origen']
+                  .agg(apariciones='size', origenes=lambda o: ', '.join(dict.fromkeys(o)))
+                  .reset_index())
+
+    if regla == 'sumar':
+        stock = df.groupby('codigo', sort=False)['stock_sistema'].sum()
+        unico = df.drop_duplicates('codigo', keep='first').copy()
+        unico['stock_sistema'] = unico['codigo'].map(stock).astype(int)
+    else:
+        unico = df.drop_duplicates('codigo', keep='last' if regla == 'ultimo' else 'first')
+    return unico.reset_index(drop=True), duplicados
+
+
+def leer_archivos_stock(archivos, regla='ultimo', max_procesos=None):
+    """
+    Leer todas las hojas de varios libros y unirlas.
+
+    archivos: lista de (nombre, ruta) en el orden en que se subieron.
+    Devuelve (DataFrame con COLUMNAS_STOCK + archivo y hoja, informe) donde
+    informe trae hojas_leidas, hojas_omitidas (archivo, hoja, motivo),
+    filas_leidas, duplicados (DataFrame) y procesos.
+    """
+    with metricas.medir("importacion.leer_archivos"):
+        procesos = max_procesos or os.cpu_count() or 1
+        if procesos > 1:
+            tareas = _repartir_hojas(archivos, procesos)
+            procesos = min(procesos, len(tareas))
+
+        if procesos <= 1:
+            procesos = 1
+            resultados = [r for i, (nombre, ruta) in enumerate(archivos)
+                          for r in _leer_tarea((i, nombre, ruta, None))]
+        else:
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=_contexto_procesos()) as pool:
+                resultados = [r for grupo in pool.map(_leer_tarea, tareas) for r in grupo]
+
+        partes, omitidas = [], []
+        for orden, nombre, hoja, df, motivo in sorted(resultados, key=lambda r: r[0]):
+            if df is None:
+                omitidas.append({'archivo': nombre, 'hoja': hoja, 'motivo': motivo})
+            else:
+                partes.append(df.assign(archivo=nombre, hoja=hoja))
+
+        if partes:
+            todas = pd.concat(partes, ignore_index=True)
+        else:
+            todas = pd.DataFrame(columns=COLUMNAS_STOCK + ['archivo', 'hoja'])
+        unicas, duplicados = resolver_duplicados(todas, regla)
+
+    informe = {
+        'hojas_leidas': len(partes),
+        'hojas_omitidas': pd.DataFrame(omitidas, columns=['archivo', 'hoja', 'motivo']),
+        'filas_leidas': len(todas),
+        'duplicados': duplicados,
+        'procesos': procesos,
+    }
+    return unicas, informe
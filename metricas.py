@@ -0,0 +1,118 @@
+"""
+Medición ligera de tiempos por operación.
+
+Streamlit re-ejecuta app.py en cada interacción, pero este módulo se importa
+una sola vez por proceso: las muestras se conservan entre ejecuciones y se
+resumen en percentiles p50/p95/p99 por operación.
+"""
+import functools
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Ventana móvil: últimas N muestras por operación
+MUESTRAS_POR_OPERACION = 500
+ARCHIVO_METRICAS = "metricas_rendimiento.json"
+
+_muestras = defaultdict(lambda: deque(maxlen=MUESTRAS_POR_OPERACION))
+_lock = threading.Lock()
+
+
+def registrar(operacion, segundos):
+    """Agregar una muestra de duración para una operación"""
+    with _lock:
+        _muestras[operacion].append(segundos)
+
+
+@contextmanager
+def medir(operacion):
+    """Medir el bloque 'with' como una muestra de la operación"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(operacion, time.perf_counter() - inicio)
+
+
+def cronometrar(operacion):
+    """Decorador que mide cada llamada a la función"""
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            with medir(operacion):
+                return func(*args, **kwargs)
+        envoltura.__cronometrada__ = True
+        return envoltura
+    return decorador
+
+
+def instrumentar(espacio, prefijo, filtro=None):
+    """
+    Envolver las funciones definidas en un módulo (su globals()).
+
+    Solo se envuelven las funciones propias del módulo, no las importadas,
+    y se omiten las que ya estén cronometradas.
+    """
+    modulo = espacio.get("__name__")
+    for nombre, valor in list(espacio.items()):
+        if not callable(valor) or getattr(valor, "__module__", None) != modulo:
+            continue
+        if not hasattr(valor, "__code__") or nombre.startswith("_"):
+            continue
+        if getattr(valor, "__cronometrada__", False):
+            continue
+        if filtro and not filtro(nombre):
+            continue
+        espacio[nombre] = cronometrar(f"{prefijo}.{nombre}")(valor)
+
+
+def _percentil(ordenadas, p):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    indice = max(0, math.ceil(p / 100 * len(ordenadas)) - 1)
+    return ordenadas[indice]
+
+
+def resumen():
+    """Percentiles por operación, ordenados por tiempo total"""
+    with _lock:
+        copia = {op: list(valores) for op, valores in _muestras.items()}
+
+    filas = []
+    for operacion, valores in copia.items():
+        if not valores:
+            continue
+        ordenadas = sorted(valores)
+        filas.append({
+            "operacion": operacion,
+            "muestras": len(ordenadas),
+            "p50_ms": round(_percentil(ordenadas, 50) * 1000, 2),
+            "p95_ms": round(_percentil(ordenadas, 95) * 1000, 2),
+            "p99_ms": round(_percentil(ordenadas, 99) * 1000, 2),
+            "max_ms": round(ordenadas[-1] * 1000, 2),
+            "total_s": round(sum(ordenadas), 3),
+        })
+
+    filas.sort(key=lambda f: f["total_s"], reverse=True)
+    return filas
+
+
+def exportar(ruta=ARCHIVO_METRICAS):
+    """Escribir el resumen actual en un archivo JSON local"""
+    datos = {
+        "generado": datetime.now().isoformat(timespec="seconds"),
+        "muestras_por_operacion": MUESTRAS_POR_OPERACION,
+        "operaciones": resumen(),
+    }
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+def reiniciar():
+    """Descartar todas las muestras"""
+    with _lock:
+        _muestras.clear()
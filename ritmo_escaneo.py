@@ -0,0 +1,106 @@
+"""
+Ritmo de escaneo en vivo (escaneos por minuto) por operador y por marca.
+
+Los contadores viven en la tabla ritmo_escaneo de la base de cada tienda:
+cubetas de RESOLUCION_SEGUNDOS por operador, por marca y en total, que se
+suman en la misma transacción que registra los escaneos. Así la página y la
+API de escaneos (otro proceso) alimentan los mismos contadores. Solo se
+guardan las cubetas de la ventana más larga y leerlos no toca la bitácora.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import database as db
+
+VENTANAS = {"1m": 60, "5m": 300, "1h": 3600}
+RESOLUCION_SEGUNDOS = 10
+
+_CUBETAS = max(VENTANAS.values()) // RESOLUCION_SEGUNDOS
+_TOTAL = ("total", "")
+
+
+def _periodo(momento=None):
+    if momento is None:
+        segundos = time.time()
+    elif isinstance(momento, datetime):
+        segundos = momento.timestamp()
+    else:
+        segundos = float(momento)
+    return int(segundos // RESOLUCION_SEGUNDOS)
+
+
+def registrar_lote(conn, usuario, filas, momento=None):
+    """
+    Contar escaneos confirmados dentro de la transacción abierta que los
+    registra. filas son dicts con marca, cantidad_escaneada y timestamp; las
+    que caen fuera de la ventana más larga no se cuentan.
+    """
+    limite = _periodo(momento) - _CUBETAS
+    sumas = {}
+    for fila in filas:
+        periodo = _periodo(fila["timestamp"])
+        if periodo <= limite:
+            continue
+        cantidad = int(fila["cantidad_escaneada"])
+        for dimension, clave in (("operador", usuario), ("marca", fila["marca"]), _TOTAL):
+            escaneos, unidades = sumas.get((periodo, dimension, clave), (0, 0))
+            sumas[(periodo, dimension, clave)] = (escaneos + 1, unidades + cantidad)
+
+    c = conn.cursor()
+    c.executemany('''INSERT INTO ritmo_escaneo (periodo, dimension, clave, escaneos, unidades)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(periodo, dimension, clave) DO UPDATE SET
+                        escaneos = escaneos + excluded.escaneos,
+                        unidades = unidades + excluded.unidades''',
+                  [clave + valores for clave, valores in sumas.items()])
+    # Acotar la tabla: descartar las cubetas que ya salieron de la ventana más larga
+    c.execute("DELETE FROM ritmo_escaneo WHERE periodo <= ?", (limite,))
+
+
+@contextmanager
+def _transaccion(tienda):
+    with db.en_tienda(tienda or db.tienda_actual()), db.transaccion() as conn:
+        yield conn
+
+
+def _fila(clave, escaneos, unidades, ventana):
+    minutos = VENTANAS[ventana] / 60
+    return {
+        "clave": clave,
+        "escaneos": escaneos,
+        "unidades": unidades,
+        "escaneos_por_minuto": round(escaneos / minutos, 2),
+    }
+
+
+def _sumar(dimension, ventana, momento, tienda):
+    actual = _periodo(momento)
+    desde = actual - VENTANAS[ventana] // RESOLUCION_SEGUNDOS
+    conn = db.get_connection(tienda)
+    filas = conn.execute('''SELECT clave, SUM(escaneos), SUM(unidades) FROM ritmo_escaneo
+                            WHERE periodo > ? AND periodo <= ? AND dimension = ?
+                            GROUP BY clave''', (desde, actual, dimension)).fetchall()
+    conn.close()
+    return filas
+
+
+def ritmo(dimension, ventana="5m", momento=None, tienda=None):
+    """Escaneos por minuto de cada operador o marca en la ventana, de mayor a menor"""
+    filas = [_fila(clave, escaneos, unidades, ventana)
+             for clave, escaneos, unidades in _sumar(dimension, ventana, momento, tienda) if escaneos]
+    filas.sort(key=lambda f: f["escaneos"], reverse=True)
+    return filas
+
+
+def ritmo_total(ventana="5m", momento=None, tienda=None):
+    """Escaneos por minuto de todos los operadores de la tienda en la ventana"""
+    filas = _sumar(_TOTAL[0], ventana, momento, tienda)
+    escaneos, unidades = filas[0][1:] if filas else (0, 0)
+    return _fila("TOTAL", escaneos, unidades, ventana)
+
+
+def reiniciar(tienda=None):
+    """Vaciar los contadores de la tienda"""
+    with _transaccion(tienda) as conn:
+        conn.execute("DELETE FROM ritmo_escaneo")
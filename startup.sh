@@ -12,9 +12,21 @@ pip install --no-cache-dir -r requirements.txt
 echo "Verificando instalación..."
 pip list | grep streamlit
 
+# API de escaneos para escáneres de mano (api_escaneos.py). Solo escucha en
+# 127.0.0.1 y exige INVENTARIO_API_TOKEN: cada petición envía
+# "Authorization: Bearer <token>". Sin el token la API no se inicia.
+if [ -n "$INVENTARIO_API_TOKEN" ]; then
+    echo "Iniciando API de escaneos..."
+    python api_escaneos.py --puerto 8001 &
+else
+    echo "INVENTARIO_API_TOKEN no definido: la API de escaneos no se inicia"
+fi
+
 echo "Iniciando Streamlit..."
+# Las exportaciones se sirven desde static/descargas (sin cargarlas en memoria)
 streamlit run app.py \
     --server.port=8000 \
+    --server.enableStaticServing=true \
     --server.address=0.0.0.0 \
     --server.enableCORS=true \
     --server.enableXsrfProtection=false \
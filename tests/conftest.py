@@ -0,0 +1,132 @@
+"""
+Fixtures compartidas: cada prueba trabaja con una base SQLite y unos CSV
+propios en un directorio temporal (DB_PATH y el directorio actual).
+"""
+import importlib
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import database as db  # noqa: E402
+import escaneos  # noqa: E402
+
+USUARIOS = ["Ana", "Luis"]
+
+
+@pytest.fixture
+def datos(tmp_path, monkeypatch):
+    """Base y archivos vacíos de la tienda por defecto"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "inventario.db"))
+    db.usar_tienda(db.TIENDA_POR_DEFECTO)
+    yield tmp_path
+    db.usar_tienda(db.TIENDA_POR_DEFECTO)
+
+
+def crear_catalogo(n=30, marcas=("LETI", "GENVEN", "OTROS"), stock=3):
+    """Catálogo sintético P001..Pn repartido en marcas y dos áreas"""
+    df = pd.DataFrame({
+        "codigo": [f"P{i:03d}" for i in range(1, n + 1)],
+        "producto": [f"Producto {i}" for i in range(1, n + 1)],
+        "marca": [marcas[i % len(marcas)] for i in range(n)],
+        "area": ["Farmacia" if i % 2 else "Consumo" for i in range(n)],
+        "stock_sistema": stock,
+    })
+    db.guardar_productos_df(df)
+    return df
+
+
+def poblar_agregados():
+    """Poblar todas las tablas mantenidas, para que los escaneos las actualicen incrementalmente"""
+    db.obtener_totales_estado()
+    db.asegurar_pendientes()
+    db.asegurar_estadisticas()
+    escaneos.asegurar_agregados()
+    escaneos.asegurar_totales_diarios()
+
+
+@pytest.fixture
+def catalogo(datos):
+    df = crear_catalogo()
+    poblar_agregados()
+    return {fila["codigo"]: fila for fila in df.to_dict("records")}
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """app.py importado con el sustituto de streamlit de los benchmarks: (app, stub)"""
+    from benchmarks import stub_streamlit
+    monkeypatch.setitem(sys.modules, "streamlit", stub_streamlit.crear_modulo())
+    monkeypatch.delitem(sys.modules, "app", raising=False)
+    stub_streamlit.estado.clear()
+    stub_streamlit.RESPUESTAS.clear()
+    modulo = importlib.import_module("app")
+    yield modulo, stub_streamlit
+    sys.modules.pop("app", None)
+    stub_streamlit.estado.clear()
+    stub_streamlit.RESPUESTAS.clear()
+
+
+def escanear(usuario, catalogo, codigos, cantidad=1):
+    """Registrar un lote de escaneos (un código puede repetirse)"""
+    exito, resultado = escaneos.registrar_escaneos_lote(
+        usuario, [(codigo, catalogo[codigo], cantidad) for codigo in codigos])
+    assert exito, resultado
+    return resultado
+
+
+def _tabla(sql, conn):
+    return sorted(tuple(fila) for fila in conn.execute(sql).fetchall())
+
+
+def estado_mantenido():
+    """
+    Contenido de las tablas mantenidas. Filas en cero y ausentes valen lo
+    mismo para los lectores, así que las filas en cero se omiten.
+    """
+    conn = db.get_connection()
+    estado = {
+        "ultimo_conteo": _tabla("SELECT codigo, fecha, usuario, conteo_fisico, diferencia, estado "
+                                "FROM ultimo_conteo", conn),
+        "totales_estado": _tabla("SELECT estado, productos, conteo_fisico, diferencia FROM totales_estado "
+                                 "WHERE productos != 0", conn),
+        "escaneado_por_producto": _tabla("SELECT codigo, cantidad, escaneos FROM escaneado_por_producto "
+                                         "WHERE cantidad != 0 OR escaneos != 0", conn),
+        "total_diario": _tabla("SELECT fecha, usuario, codigo, total FROM total_diario WHERE total != 0", conn),
+        "estadisticas_usuario": _tabla("SELECT usuario, fecha, conteos, exactos, escaneos FROM estadisticas_usuario "
+                                       "WHERE conteos != 0 OR exactos != 0 OR escaneos != 0", conn),
+        "pendientes": _tabla("SELECT codigo, marca, area FROM pendientes", conn),
+        "avance_marca_area": _tabla("SELECT marca, area, productos, pendientes FROM avance_marca_area", conn),
+    }
+    conn.close()
+    return estado
+
+
+def reconstruir_todo():
+    """Recalcular las tablas mantenidas desde la tabla conteos y la bitácora"""
+    with db.transaccion() as conn:
+        c = conn.cursor()
+        db._reconstruir_ultimo_conteo(c)
+        db._reconstruir_estadisticas(c)
+    escaneos.reconstruir_escaneado_por_producto()
+    escaneos.reconstruir_totales_diarios()
+
+
+def resumen_conteos():
+    """Resumen CSV como {(usuario, codigo): conteo_fisico} de hoy"""
+    df = escaneos.cargar_conteos()
+    hoy = pd.Timestamp.now().strftime("%Y-%m-%d")
+    df = df[df["fecha"].astype(str).str.startswith(hoy)]
+    return {(fila.usuario, str(fila.codigo)): int(fila.conteo_fisico) for fila in df.itertuples()}
+
+
+def totales_del_dia():
+    """total_diario de hoy como {(usuario, codigo): total}, sin los totales en cero"""
+    hoy = pd.Timestamp.now().strftime("%Y-%m-%d")
+    return {(usuario, codigo): total for fecha, usuario, codigo, total in estado_mantenido()["total_diario"]
+            if fecha == hoy}
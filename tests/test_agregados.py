@@ -0,0 +1,69 @@
+"""Las tablas mantenidas en cada escaneo deben coincidir con una reconstrucción desde la bitácora"""
+from datetime import date
+
+import database as db
+import escaneos
+from conftest import escanear, estado_mantenido, reconstruir_todo, resumen_conteos, totales_del_dia
+
+
+def test_escaneos_mantienen_agregados(catalogo):
+    escanear("Ana", catalogo, ["P001", "P002", "P003"])
+    escanear("Ana", catalogo, ["P001", "P001", "P004"], cantidad=2)
+    escanear("Luis", catalogo, ["P002", "P005"], cantidad=3)
+    escanear("Luis", catalogo, ["P005"])
+
+    mantenido = estado_mantenido()
+    reconstruir_todo()
+    assert estado_mantenido() == mantenido
+
+
+def test_totales_tras_escaneos(catalogo):
+    escanear("Ana", catalogo, ["P001", "P001", "P002"])
+    escanear("Ana", catalogo, ["P001", "P002"], cantidad=2)
+
+    assert escaneos.total_escaneado_hoy("Ana", "P001") == 4
+    assert db.obtener_total_diario("Ana", "P002", date.today().isoformat()) == 3
+
+    totales = db.obtener_totales_estado()
+    assert totales["LEVE"]["productos"] == 1    # P001: 4 contra 3
+    assert totales["EXACTO"]["productos"] == 1  # P002: 3 contra 3
+    assert db.contar_pendientes() == len(catalogo) - 2
+    assert db.contar_escaneos() == 5
+
+    stats = db.obtener_estadisticas_usuario("Ana")
+    assert (stats["conteos"], stats["exactos"], stats["escaneos"]) == (2, 1, 5)
+
+
+def test_resumen_csv_coincide_con_la_base(catalogo):
+    escanear("Ana", catalogo, ["P001", "P002"])
+    escanear("Ana", catalogo, ["P001"])
+    escanear("Luis", catalogo, ["P001", "P003"], cantidad=2)
+
+    assert resumen_conteos() == totales_del_dia()
+    assert escaneos.contar_conteos() == len(totales_del_dia())
+
+
+def test_escaneo_repetido_solo_agrega_al_resumen(catalogo):
+    escanear("Ana", catalogo, ["P001", "P002"])
+    ruta = escaneos.archivo_conteos()
+    with open(ruta, "rb") as archivo:
+        antes = archivo.read()
+
+    escanear("Ana", catalogo, ["P001"])  # repetido
+    escanear("Ana", catalogo, ["P002", "P003"], cantidad=2)  # repetido y nuevo en un lote
+
+    with open(ruta, "rb") as archivo:
+        assert archivo.read().startswith(antes)
+    assert resumen_conteos() == totales_del_dia() == {("Ana", "P001"): 2, ("Ana", "P002"): 3,
+                                                      ("Ana", "P003"): 2}
+    assert escaneos.contar_conteos() == 3
+    escaneos._filas_conteos.clear()  # volver a contar desde el archivo
+    assert escaneos.contar_conteos() == len(escaneos.cargar_conteos()) == 3
+
+
+def test_ultimo_codigo_del_usuario(catalogo):
+    assert db.obtener_ultimo_codigo_usuario("Ana") is None
+    escanear("Ana", catalogo, ["P001", "P004"])
+    escanear("Luis", catalogo, ["P002"])
+    assert db.obtener_ultimo_codigo_usuario("Ana") == "P004"
+    assert db.obtener_ultimo_codigo_usuario("Luis") == "P002"
@@ -0,0 +1,72 @@
+"""La API de escaneos solo atiende peticiones con el token configurado"""
+import http.client
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+import api_escaneos
+import database as db
+from conftest import crear_catalogo
+
+TOKEN = "secreto-de-prueba"
+
+
+@pytest.fixture
+def api(datos, monkeypatch):
+    """Servidor en un puerto libre de 127.0.0.1 con un usuario de inventario"""
+    crear_catalogo(5)
+    pd.DataFrame([["inventario", "Operador", "-", "inventario", "1", db.TIENDA_POR_DEFECTO]],
+                 columns=["username", "nombre", "password", "rol", "activo", "tienda"]
+                 ).to_csv("usuarios.csv", index=False)
+    monkeypatch.setattr(api_escaneos, "TOKEN", TOKEN)
+
+    servidor = api_escaneos.crear_servidor(puerto=0)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor.server_address
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _post(direccion, token=None):
+    conexion = http.client.HTTPConnection(*direccion, timeout=10)
+    encabezados = {"Content-Type": "application/json"}
+    if token:
+        encabezados["Authorization"] = f"Bearer {token}"
+    cuerpo = json.dumps({"usuario": "inventario", "escaneos": [{"codigo": "P001", "cantidad": 2}]})
+    conexion.request("POST", "/escaneos", body=cuerpo, headers=encabezados)
+    respuesta = conexion.getresponse()
+    datos = json.loads(respuesta.read())
+    conexion.close()
+    return respuesta.status, datos
+
+
+def test_escucha_solo_en_localhost(api):
+    assert api[0] == "127.0.0.1"
+
+
+def test_rechaza_sin_token_o_con_otro(api):
+    assert _post(api)[0] == 401
+    assert _post(api, "otro")[0] == 401
+    assert db.obtener_total_diario("Operador", "P001", pd.Timestamp.now().strftime("%Y-%m-%d")) == 0
+
+
+def test_acepta_con_token(api):
+    estado, datos = _post(api, TOKEN)
+    assert estado == 200
+    assert datos["aceptados"] == 1
+    assert datos["totales"][0]["total_acumulado"] == 2
+
+
+def test_sin_token_configurado_rechaza_todo(api, monkeypatch):
+    monkeypatch.setattr(api_escaneos, "TOKEN", None)
+    assert _post(api, "None")[0] == 401
+    assert _post(api)[0] == 401
+
+
+def test_no_inicia_sin_token(monkeypatch):
+    monkeypatch.setattr(api_escaneos, "TOKEN", None)
+    with pytest.raises(SystemExit):
+        api_escaneos.main(["--puerto", "0"])
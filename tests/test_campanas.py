@@ -0,0 +1,99 @@
+"""Campañas de conteo: cierre, tablas mantenidas de la campaña nueva y comparación"""
+import sqlite3
+
+import pandas as pd
+
+import database as db
+import escaneos
+from conftest import escanear, estado_mantenido, reconstruir_todo, resumen_conteos, totales_del_dia
+
+
+def _cierre(campana):
+    conn = db.get_connection()
+    filas = conn.execute('''SELECT codigo, conteo_fisico, diferencia FROM cierre_campana
+                            WHERE campana = ? ORDER BY codigo''', (campana,)).fetchall()
+    conn.close()
+    return filas
+
+
+def test_cierre_de_campana(catalogo):
+    escanear("Ana", catalogo, ["P001", "P001", "P002", "P003"])
+    escanear("Luis", catalogo, ["P003", "P004"], cantidad=2)
+    escaneos.reiniciar_conteo("Ana", "P002", catalogo["P002"])
+
+    nueva = db.iniciar_campana("Segunda")
+    assert db.campana_activa() == nueva
+    assert escaneos.archivo_escaneos().endswith(f"_c{nueva}.csv")
+
+    # El cierre guardado desde ultimo_conteo coincide con uno calculado desde conteos
+    guardado = _cierre(1)
+    assert [fila[0] for fila in guardado] == ["P001", "P003", "P004"]
+    with db.transaccion() as conn:
+        db._guardar_cierre(conn.cursor(), 1, desde_ultimo_conteo=False)
+    assert _cierre(1) == guardado
+
+    campanas = db.listar_campanas().set_index("id")
+    assert campanas.loc[1, "productos_contados"] == 3
+    assert bool(campanas.loc[nueva, "activa"])
+
+    # La campaña nueva empieza vacía y sus tablas se mantienen igual que una reconstrucción
+    assert db.contar_pendientes() == len(catalogo)
+    assert escaneos.contar_conteos() == 0
+    escanear("Ana", catalogo, ["P001", "P005"])
+    escaneos.reiniciar_conteo("Ana", "P005", catalogo["P005"])
+    escanear("Ana", catalogo, ["P001"])
+
+    mantenido = estado_mantenido()
+    reconstruir_todo()
+    assert estado_mantenido() == mantenido
+    assert resumen_conteos() == totales_del_dia() == {("Ana", "P001"): 2}
+
+
+def test_campana_iniciada_por_otro_proceso(catalogo):
+    escanear("Ana", catalogo, ["P001"])
+    assert db.campana_activa() == 1
+
+    # Otro proceso inicia la campaña 2 sin pasar por la caché de este
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("INSERT INTO campanas (id, nombre, inicio) VALUES (2, 'Externa', '2026-01-01')")
+    conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('campana_activa', '2')")
+    conn.commit()
+    conn.close()
+
+    # La escritura siguiente relee la campaña con la base bloqueada
+    escanear("Ana", catalogo, ["P002"])
+    assert db.campana_activa() == 2
+    conn = db.get_connection()
+    assert conn.execute("SELECT campana FROM conteos WHERE codigo = 'P002'").fetchall() == [(2,)]
+    conn.close()
+    bitacora = pd.read_csv(escaneos.archivo_escaneos(), dtype={"codigo": str})
+    assert escaneos.archivo_escaneos().endswith("_c2.csv")
+    assert bitacora["codigo"].tolist() == ["P002"]
+
+
+def _sin_conexion(*args, **kwargs):
+    raise AssertionError("La campaña activa debería salir de la memoria del proceso")
+
+
+def test_campana_activa_no_abre_conexiones(catalogo, monkeypatch):
+    escanear("Ana", catalogo, ["P001"])
+    monkeypatch.setattr(db, "get_connection", _sin_conexion)
+    for _ in range(3):
+        escaneos.archivo_escaneos()
+        escaneos.archivo_conteos()
+
+
+def test_comparar_campanas_con_nombres_libres(catalogo):
+    escanear("Ana", catalogo, ["P001", "P002"], cantidad=3)  # P001 exacto, P002 exacto
+    db.iniciar_campana('Enero "2026"')
+    escanear("Ana", catalogo, ["P001"], cantidad=2)
+    db.iniciar_campana("O'Higgins; DROP TABLE productos")
+    escanear("Ana", catalogo, ["P001"])
+
+    df, columnas = db.comparar_campanas(n=3)
+    assert columnas == ['Campaña inicial (#1)', 'Enero "2026" (#2)', "O'Higgins; DROP TABLE productos (#3)"]
+    p001 = df.set_index("codigo").loc["P001"]
+    assert [p001[col] for col in columnas] == [0, -1, -2]
+    assert p001["contadas"] == 3
+    assert p001["tendencia"] == -2
+    assert db.contar_productos() == len(catalogo)
@@ -0,0 +1,30 @@
+"""El dashboard respeta el filtro de marca de la barra lateral"""
+from conftest import escanear
+
+
+def _ejecutar_dashboard(app, stub, monkeypatch, marca):
+    metricas, tablas = {}, []
+    monkeypatch.setattr(app.st, "metric", lambda etiqueta, valor, *a, **k: metricas.__setitem__(etiqueta, valor),
+                        raising=False)
+    monkeypatch.setattr(app, "mostrar_tabla_paginada", lambda df, **k: tablas.append(df))
+    stub.estado.update(autenticado=True, usuario="admin", nombre="Admin", rol="admin",
+                       marca_seleccionada=marca)
+    stub.RESPUESTAS["Mostrar solo productos NO escaneados"] = True
+    app.inicializar_sesion()
+    app.mostrar_dashboard()
+    return metricas, tablas[0]
+
+
+def test_no_escaneados_con_filtro_de_marca(catalogo, app, monkeypatch):
+    app, stub = app
+    escanear("Ana", catalogo, ["P001", "P002", "P004"])  # dos de LETI, uno de GENVEN
+    leti = sum(fila["marca"] == "LETI" for fila in catalogo.values())
+
+    metricas, pendientes = _ejecutar_dashboard(app, stub, monkeypatch, "LETI")
+    assert metricas["**Total Productos**"] == leti
+    assert metricas["**No Escaneados**"] == leti - 2
+    assert len(pendientes) == leti - 2
+    assert set(pendientes["codigo"].map(lambda c: catalogo[c]["marca"])) == {"LETI"}
+
+    metricas, pendientes = _ejecutar_dashboard(app, stub, monkeypatch, "Todas")
+    assert metricas["**No Escaneados**"] == len(pendientes) == len(catalogo) - 3
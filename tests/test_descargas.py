@@ -0,0 +1,92 @@
+"""Las exportaciones se sirven desde el disco, sin cargarlas enteras en memoria"""
+import io
+import os
+import time
+import tracemalloc
+
+import openpyxl
+import pytest
+
+import database as db
+
+
+@pytest.fixture
+def descarga(app, tmp_path, monkeypatch):
+    """app con el servidor estático en tmp_path y registro de llamadas de descarga"""
+    app, stub = app
+    llamadas = []
+    monkeypatch.setattr(app, "DIRECTORIO_DESCARGAS", str(tmp_path / "static" / "descargas"))
+    monkeypatch.setattr(app.st, "markdown", lambda texto, **k: llamadas.append(("enlace", texto)), raising=False)
+    monkeypatch.setattr(app.st, "error", lambda texto, **k: llamadas.append(("error", texto)), raising=False)
+    monkeypatch.setattr(app.st, "download_button",
+                        lambda etiqueta, data, **k: llamadas.append(("memoria", data.read())), raising=False)
+    return app, llamadas
+
+
+def _temporal(tmp_path, tamano=1000):
+    ruta = tmp_path / "export.tmp"
+    ruta.write_bytes(b"x" * tamano)
+    return str(ruta)
+
+
+def test_servidor_estatico_publica_el_archivo(descarga, tmp_path, monkeypatch):
+    app, llamadas = descarga
+    monkeypatch.setattr(app.st, "get_option", lambda opcion: opcion == "server.enableStaticServing", raising=False)
+    ruta = _temporal(tmp_path)
+
+    app.ofrecer_descarga("⬇️ Descargar CSV", ruta, "detalle LETI.csv", "text/csv")
+
+    assert not os.path.exists(ruta)
+    [(tipo, enlace)] = llamadas
+    assert tipo == "enlace" and 'download="detalle LETI.csv"' in enlace
+    url = enlace.split('href="')[1].split('"')[0]
+    assert url.startswith("app/static/descargas/") and url.endswith("/detalle%20LETI.csv")
+    token = url.split("/")[3]
+    publicado = os.path.join(app.DIRECTORIO_DESCARGAS, token, "detalle LETI.csv")
+    assert os.path.getsize(publicado) == 1000
+
+    # Las descargas vencidas se borran al publicar la siguiente
+    viejo = time.time() - app.VIGENCIA_DESCARGAS_SEGUNDOS - 1
+    os.utime(os.path.dirname(publicado), (viejo, viejo))
+    app.ofrecer_descarga("⬇️ Descargar CSV", _temporal(tmp_path), "otro.csv", "text/csv")
+    assert not os.path.exists(publicado)
+
+
+def test_sin_servidor_estatico_limita_la_descarga_en_memoria(descarga, tmp_path, monkeypatch):
+    app, llamadas = descarga
+    monkeypatch.setattr(app.st, "get_option", lambda opcion: False, raising=False)
+    monkeypatch.setattr(app, "LIMITE_DESCARGA_EN_MEMORIA", 2000)
+
+    app.ofrecer_descarga("⬇️ Descargar", _temporal(tmp_path, 1500), "chico.csv", "text/csv")
+    ruta = _temporal(tmp_path, 2500)
+    app.ofrecer_descarga("⬇️ Descargar", ruta, "grande.csv", "text/csv")
+
+    assert [tipo for tipo, _ in llamadas] == ["memoria", "error"]
+    assert len(llamadas[0][1]) == 1500
+    assert not os.path.exists(ruta)
+
+
+def test_excel_de_conciliacion_sin_cargarlo_en_memoria(descarga, catalogo, monkeypatch):
+    app, llamadas = descarga
+    monkeypatch.setattr(app.st, "get_option", lambda opcion: opcion == "server.enableStaticServing", raising=False)
+    bloques = (app.agregar_estado_marca(bloque, False)
+               for bloque in db.iterar_productos_con_escaneado(None, ordenar_por_marca=True))
+    ruta = app.escribir_conciliacion_excel(bloques)
+    tamano = os.path.getsize(ruta)
+    with open(ruta, "ab") as archivo:
+        archivo.write(b"\0" * (5 * 1024 * 1024 - tamano))  # relleno: la descarga no debe leerlo
+
+    tracemalloc.start()
+    app.ofrecer_descarga("⬇️ Descargar Excel", ruta, app.nombre_archivo_excel("conciliacion_marcas"), app.MIME_EXCEL)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert pico < 1024 * 1024
+
+    [(tipo, enlace)] = llamadas
+    assert tipo == "enlace"
+    publicado = os.path.join(os.path.dirname(app.DIRECTORIO_DESCARGAS),
+                             *enlace.split('href="')[1].split('"')[0].split("/")[2:])
+    with open(publicado, "rb") as archivo:
+        contenido = archivo.read(tamano)
+    libro = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True)
+    assert set(libro.sheetnames) >= {"Resumen", "LETI", "GENVEN", "OTROS"}
@@ -0,0 +1,56 @@
+"""Importación incremental del catálogo: solo se escribe lo que cambió"""
+import pandas as pd
+
+import database as db
+from conftest import escanear, estado_mantenido, reconstruir_todo
+
+
+def _productos():
+    conn = db.get_connection()
+    df = pd.read_sql_query("SELECT codigo, producto, marca, area, stock_sistema FROM productos ORDER BY codigo",
+                           conn, dtype={'codigo': str})
+    conn.close()
+    return df.reset_index(drop=True)
+
+
+def _entrante(catalogo):
+    df = pd.DataFrame(list(catalogo.values()))[db.COLUMNAS_PRODUCTO]
+    df.loc[df['codigo'] == 'P002', 'stock_sistema'] = 9
+    df.loc[df['codigo'] == 'P003', 'marca'] = 'NUEVA'
+    df = df[df['codigo'] != 'P030']
+    nuevo = pd.DataFrame([['P031', 'Producto 31', 'LETI', 'Consumo', 4]], columns=db.COLUMNAS_PRODUCTO)
+    return pd.concat([df, nuevo], ignore_index=True)
+
+
+def test_delta_solo_escribe_cambios(catalogo):
+    entrante = _entrante(catalogo)
+    version = db.version_catalogo()
+
+    cambios = db.calcular_cambios_catalogo(entrante, eliminar_faltantes=True)
+    assert cambios['nuevos']['codigo'].tolist() == ['P031']
+    assert sorted(cambios['modificados']['codigo']) == ['P002', 'P003']
+    assert cambios['eliminados'] == ['P030']
+    assert cambios['sin_cambios'] == len(catalogo) - 3
+
+    assert db.aplicar_cambios_catalogo(cambios) == {'nuevos': 1, 'modificados': 2, 'eliminados': 1}
+    assert db.version_catalogo() > version
+    esperado = entrante.sort_values('codigo').reset_index(drop=True).astype({'stock_sistema': 'int64'})
+    pd.testing.assert_frame_equal(_productos(), esperado, check_dtype=False)
+    assert 'NUEVA' in db.obtener_todas_marcas()
+
+    # Reimportar el mismo archivo no cambia nada
+    otra_vez = db.calcular_cambios_catalogo(entrante, eliminar_faltantes=True)
+    assert otra_vez['nuevos'].empty and otra_vez['modificados'].empty and not otra_vez['eliminados']
+    assert db.aplicar_cambios_catalogo(otra_vez) == {'nuevos': 0, 'modificados': 0, 'eliminados': 0}
+
+
+def test_agregados_tras_importar(catalogo):
+    escanear("Ana", catalogo, ["P001", "P002", "P030"])
+    db.aplicar_cambios_catalogo(db.calcular_cambios_catalogo(_entrante(catalogo), eliminar_faltantes=True))
+    escanear("Ana", {**catalogo, 'P031': {'producto': 'Producto 31', 'marca': 'LETI', 'area': 'Consumo',
+                                          'stock_sistema': 4}}, ["P031", "P003"])
+
+    assert db.contar_pendientes() == len(catalogo) - 4  # 30 - P030 + P031, menos P001, P002, P003 y P031
+    mantenido = estado_mantenido()
+    reconstruir_todo()
+    assert estado_mantenido() == mantenido
@@ -0,0 +1,31 @@
+"""El registro de marcas (y su caché) sigue al catálogo"""
+import database as db
+from conftest import crear_catalogo
+
+
+def test_eliminar_ultimo_producto_quita_la_marca(datos):
+    crear_catalogo(6, marcas=("LETI", "OTROS"))
+    db.crear_marca("PROPIA")
+    assert db.obtener_todas_marcas() == ["LETI", "OTROS", "PROPIA"]
+
+    for codigo in ["P002", "P004"]:  # quedan productos OTROS
+        db.eliminar_producto(codigo)
+    assert "OTROS" in db.obtener_todas_marcas()
+
+    db.eliminar_producto("P006")
+    assert db.obtener_todas_marcas() == ["LETI", "PROPIA"]
+
+
+def test_cambiar_de_marca_quita_la_anterior(datos):
+    crear_catalogo(2, marcas=("LETI", "OTROS"))
+    db.guardar_producto("P002", "Producto 2", "LETI", "Consumo", 3)
+    assert db.obtener_todas_marcas() == ["LETI"]
+
+
+def test_importar_sin_una_marca_la_quita(datos):
+    catalogo = crear_catalogo(4, marcas=("LETI", "OTROS"))
+    assert "OTROS" in db.obtener_todas_marcas()
+
+    entrante = catalogo[catalogo["marca"] == "LETI"]
+    db.aplicar_cambios_catalogo(db.calcular_cambios_catalogo(entrante, eliminar_faltantes=True))
+    assert db.obtener_todas_marcas() == ["LETI"]
@@ -0,0 +1,82 @@
+"""Reiniciar un conteo es un evento RESET en la bitácora y una anulación en el resumen"""
+import database as db
+import escaneos
+from conftest import escanear, estado_mantenido, reconstruir_todo, resumen_conteos, totales_del_dia
+
+
+def _reiniciar(usuario, catalogo, codigo):
+    exito, total = escaneos.reiniciar_conteo(usuario, codigo, catalogo[codigo])
+    assert exito, total
+    return total
+
+
+def test_reinicio_mantiene_agregados(catalogo):
+    escanear("Ana", catalogo, ["P001", "P001", "P002", "P003"])
+    escanear("Luis", catalogo, ["P001", "P004"], cantidad=3)
+
+    assert _reiniciar("Ana", catalogo, "P001") == 2
+    assert _reiniciar("Luis", catalogo, "P004") == 3
+    escanear("Ana", catalogo, ["P001"], cantidad=3)  # se vuelve a contar después del reinicio
+    assert _reiniciar("Ana", catalogo, "P009") == 0  # sin conteo hoy: no hay nada que anular
+
+    assert escaneos.total_escaneado_hoy("Ana", "P001") == 3
+    assert escaneos.total_escaneado_hoy("Luis", "P004") == 0
+
+    mantenido = estado_mantenido()
+    reconstruir_todo()
+    assert estado_mantenido() == mantenido
+
+
+def test_reinicio_no_reescribe_el_resumen(catalogo):
+    escanear("Ana", catalogo, ["P001", "P002"])
+    ruta = escaneos.archivo_conteos()
+    with open(ruta, "rb") as archivo:
+        antes = archivo.read()
+
+    _reiniciar("Ana", catalogo, "P001")
+
+    with open(ruta, "rb") as archivo:
+        despues = archivo.read()
+    assert despues.startswith(antes) and len(despues) > len(antes)
+    assert resumen_conteos() == totales_del_dia() == {("Ana", "P002"): 1}
+
+
+def test_contador_de_conteos_tras_reinicios(catalogo):
+    escanear("Ana", catalogo, ["P001", "P002", "P003"])
+    _reiniciar("Ana", catalogo, "P002")
+    escanear("Ana", catalogo, ["P002"])
+    _reiniciar("Ana", catalogo, "P003")
+
+    assert escaneos.contar_conteos() == 2
+    escaneos._filas_conteos.clear()  # volver a contar desde el archivo
+    assert escaneos.contar_conteos() == len(escaneos.cargar_conteos()) == 2
+    assert resumen_conteos() == totales_del_dia()
+
+
+def _filas_conteos(conn, sql="SELECT id, usuario, codigo, conteo_fisico FROM conteos ORDER BY id"):
+    return conn.execute(sql).fetchall()
+
+
+def test_reinicio_no_borra_conteos(catalogo):
+    escanear("Ana", catalogo, ["P001", "P001", "P002"])
+    escanear("Luis", catalogo, ["P001"])
+    conn = db.get_connection()
+    antes = _filas_conteos(conn)
+
+    _reiniciar("Ana", catalogo, "P001")
+
+    despues = _filas_conteos(conn)
+    assert despues[:len(antes)] == antes  # las filas anuladas siguen en la tabla
+    assert [fila[1:] for fila in despues[len(antes):]] == [("Ana", "P001", None)]
+    vigentes = _filas_conteos(conn, "SELECT usuario, codigo FROM conteos_vigentes ORDER BY id")
+    assert vigentes == [("Ana", "P002"), ("Luis", "P001")]
+    assert conn.execute("SELECT usuario, conteo_fisico FROM ultimo_conteo WHERE codigo = 'P001'").fetchall() == \
+        [("Luis", 1)]
+    conn.close()
+
+    # Un escaneo después del reinicio vuelve a contar desde cero
+    escanear("Ana", catalogo, ["P001"])
+    assert escaneos.total_escaneado_hoy("Ana", "P001") == 1
+    mantenido = estado_mantenido()
+    reconstruir_todo()
+    assert estado_mantenido() == mantenido
@@ -0,0 +1,46 @@
+"""El ritmo de escaneo se comparte entre procesos a través de la base de la tienda"""
+import os
+import subprocess
+import sys
+import time
+
+import database as db
+import ritmo_escaneo
+from conftest import RAIZ, escanear
+
+# Otro proceso (como la API de escaneos) registra un lote en la misma base
+OTRO_PROCESO = """
+import escaneos
+prod = {"producto": "Producto 2", "marca": "GENVEN", "area": "Consumo", "stock_sistema": 3}
+exito, resultado = escaneos.registrar_escaneos_lote("Luis", [("P002", prod, 4), ("P002", prod, 1)])
+assert exito, resultado
+"""
+
+
+def _por_clave(filas):
+    return {fila["clave"]: (fila["escaneos"], fila["unidades"]) for fila in filas}
+
+
+def test_ritmo_incluye_escaneos_de_otro_proceso(catalogo, datos):
+    escanear("Ana", catalogo, ["P001", "P004"], cantidad=2)
+    entorno = dict(os.environ, INVENTARIO_DB=db.DB_PATH, PYTHONPATH=RAIZ)
+    subprocess.run([sys.executable, "-c", OTRO_PROCESO], cwd=datos, env=entorno, check=True)
+
+    assert _por_clave(ritmo_escaneo.ritmo("operador", "1m")) == {"Ana": (2, 4), "Luis": (2, 5)}
+    assert _por_clave(ritmo_escaneo.ritmo("marca", "1m")) == {"LETI": (2, 4), "GENVEN": (2, 5)}
+    total = ritmo_escaneo.ritmo_total("1m")
+    assert (total["escaneos"], total["unidades"], total["escaneos_por_minuto"]) == (4, 9, 4.0)
+
+
+def test_ritmo_por_ventana(catalogo):
+    escanear("Ana", catalogo, ["P001"])
+    dentro_de_5m = time.time() + 120
+    assert ritmo_escaneo.ritmo_total("1m", momento=dentro_de_5m)["escaneos"] == 0
+    assert ritmo_escaneo.ritmo_total("5m", momento=dentro_de_5m)["escaneos"] == 1
+
+    # Las cubetas fuera de la ventana más larga se descartan al registrar
+    conn = db.get_connection()
+    with db.transaccion() as conn_escritura:
+        ritmo_escaneo.registrar_lote(conn_escritura, "Ana", [], momento=time.time() + 7200)
+    assert conn.execute("SELECT COUNT(*) FROM ritmo_escaneo").fetchone()[0] == 0
+    conn.close()
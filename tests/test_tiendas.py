@@ -0,0 +1,81 @@
+"""Cada tienda escribe en su propia base y sus propios CSV"""
+import os
+import threading
+
+import pytest
+
+import database as db
+import escaneos
+from conftest import crear_catalogo, escanear, estado_mantenido, poblar_agregados, reconstruir_todo, totales_del_dia
+
+
+@pytest.fixture
+def tiendas(datos):
+    """Catálogo en la tienda por defecto y en la tienda Norte"""
+    catalogos = {}
+    for tienda in (db.TIENDA_POR_DEFECTO, "Norte"):
+        with db.en_tienda(tienda):
+            df = crear_catalogo(10)
+            poblar_agregados()
+        catalogos[tienda] = {fila["codigo"]: fila for fila in df.to_dict("records")}
+    return catalogos
+
+
+def test_escaneos_van_a_la_tienda_activa(tiendas):
+    with db.en_tienda("Norte"):
+        escanear("Ana", tiendas["Norte"], ["P001", "P001", "P002"])
+        assert escaneos.archivo_escaneos() == "escaneos_detallados_norte.csv"
+        assert os.path.exists(db.ruta_tienda(db.DB_PATH))
+        assert totales_del_dia() == {("Ana", "P001"): 2, ("Ana", "P002"): 1}
+        mantenido = estado_mantenido()
+        reconstruir_todo()
+        assert estado_mantenido() == mantenido
+
+    # La tienda por defecto no ve nada de lo anterior
+    assert totales_del_dia() == {}
+    assert db.contar_pendientes() == len(tiendas[db.TIENDA_POR_DEFECTO])
+    assert not os.path.exists(escaneos.archivo_escaneos())
+
+
+def test_fragmento_en_otro_hilo_usa_su_tienda(tiendas, app):
+    app, stub = app
+    stub.estado.update(autenticado=True, usuario="ana", nombre="Ana", rol="inventario", tienda="Norte")
+    app.inicializar_sesion()
+    stub.RESPUESTAS.update({"Código del producto": "P003", "✅ Registrar": True})
+
+    # Streamlit vuelve a ejecutar el fragmento en un hilo nuevo, sin la tienda que fijó main()
+    errores = []
+
+    def reejecutar_fragmento():
+        try:
+            app.mostrar_panel_escaneo("Norte", "Ana", "Todas", [])
+        except stub.Rerun:
+            pass
+        except Exception as e:  # pragma: no cover - se reporta en el hilo principal
+            errores.append(e)
+
+    hilo = threading.Thread(target=reejecutar_fragmento)
+    hilo.start()
+    hilo.join()
+    assert not errores
+
+    with db.en_tienda("Norte"):
+        assert totales_del_dia() == {("Ana", "P003"): 1}
+    assert totales_del_dia() == {}
+    assert db.tienda_actual() == db.TIENDA_POR_DEFECTO
+
+
+def test_nombres_que_comparten_archivo_se_rechazan(datos, app):
+    app, _ = app
+    assert db.registrar_tienda("Norte") == (True, "Norte")
+    assert db.registrar_tienda("Norte") == (True, "Norte")
+
+    for nombre in ("norte", "NORTE.", " Norte!", "Principal"):
+        exito, mensaje = db.registrar_tienda(nombre)
+        assert not exito and "se confunde" in mensaje
+    assert db.listar_tiendas() == [db.TIENDA_POR_DEFECTO, "Norte"]
+
+    exito, mensaje = app.crear_usuario("luis", "Luis", "clave", "inventario", "NORTE")
+    assert not exito and "Norte" in mensaje
+    assert "luis" not in app.cargar_usuarios()["username"].values
+    assert app.crear_usuario("ana", "Ana", "clave", "inventario", "Norte")[0]
@@ -0,0 +1,60 @@
+"""Un escaneo fallido no deja filas en la bitácora ni en el resumen"""
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import database as db
+import escaneos
+from conftest import escanear, estado_mantenido, resumen_conteos, totales_del_dia
+
+
+def _contenido(ruta):
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, "rb") as archivo:
+        return archivo.read()
+
+
+def _archivos():
+    return {ruta: _contenido(ruta) for ruta in (escaneos.archivo_escaneos(), escaneos.archivo_conteos())}
+
+
+def _falla_al_confirmar(monkeypatch):
+    original = db.transaccion
+
+    @contextmanager
+    def transaccion():
+        with original() as conn:
+            yield conn
+            raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(db, "transaccion", transaccion)
+
+
+def test_escaneo_revertido_al_confirmar(catalogo, monkeypatch):
+    escanear("Ana", catalogo, ["P001", "P002"])
+    antes, mantenido, resumen = _archivos(), estado_mantenido(), resumen_conteos()
+
+    _falla_al_confirmar(monkeypatch)
+    exito, mensaje = escaneos.registrar_escaneos_lote("Ana", [("P001", catalogo["P001"], 1),
+                                                              ("P003", catalogo["P003"], 2)])
+    assert not exito and "disk I/O error" in mensaje
+    exito, mensaje = escaneos.reiniciar_conteo("Ana", "P002", catalogo["P002"])
+    assert not exito
+
+    assert _archivos() == antes
+    assert estado_mantenido() == mantenido
+    assert resumen_conteos() == resumen == totales_del_dia()
+    assert escaneos.contar_conteos() == 2
+
+
+def test_primer_escaneo_revertido_no_deja_archivos(catalogo, monkeypatch):
+    def falla(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(escaneos, "_anexar_resumen_conteos", falla)
+    exito, mensaje = escaneos.registrar_escaneos_lote("Ana", [("P001", catalogo["P001"], 1)])
+    assert not exito and "disco lleno" in mensaje
+    assert set(_archivos().values()) == {None}
+    assert totales_del_dia() == {}
+    assert db.contar_pendientes() == len(catalogo)
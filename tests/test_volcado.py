@@ -0,0 +1,81 @@
+"""Un volcado de escáner se registra en el día de sus lecturas y reporta la línea física"""
+import io
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import database as db
+import escaneos
+from conftest import estado_mantenido, reconstruir_todo, totales_del_dia
+
+
+def _registrar(texto, fecha=None):
+    exito, resumen = escaneos.registrar_volcado_escaner("Ana", io.BytesIO(texto.encode()), fecha)
+    assert exito, resumen
+    return resumen
+
+
+def _estadisticas(fecha):
+    return db.obtener_estadisticas_usuario("Ana", fecha.strftime("%Y-%m-%d"))
+
+
+def test_volcado_usa_la_fecha_de_cada_lectura(catalogo):
+    ayer = datetime.now() - timedelta(days=1)
+    hoy = datetime.now()
+    texto = (f"codigo,cantidad,fecha\n"
+             f"P001,2,{ayer:%Y-%m-%d} 18:00:00\n"
+             f"P002,1,{ayer:%Y-%m-%d} 18:05:00\n"
+             f"P001,1,{hoy:%Y-%m-%d %H:%M:%S}\n")
+    resumen = _registrar(texto)
+    assert resumen["aceptados"] == 3 and resumen["invalidos"].empty
+
+    # Solo la lectura de hoy entra en los totales del día
+    assert totales_del_dia() == {("Ana", "P001"): 1}
+    assert _estadisticas(ayer)["escaneos"] == 2
+    assert _estadisticas(hoy)["escaneos"] == 1
+
+    # Un segundo volcado del mismo turno sigue acumulando sobre el total de ese día
+    _registrar(f"P001 3 {ayer:%Y-%m-%d} 19:00\n")
+    conn = db.get_connection()
+    fila = conn.execute('''SELECT conteo_fisico FROM conteos_vigentes
+                           WHERE codigo = 'P001' AND date(fecha) = ? ORDER BY id DESC''',
+                        (f"{ayer:%Y-%m-%d}",)).fetchone()
+    conn.close()
+    assert fila[0] == 5
+    assert totales_del_dia() == {("Ana", "P001"): 1}
+
+    mantenido = estado_mantenido()
+    reconstruir_todo()
+    assert estado_mantenido() == mantenido
+
+
+def test_volcado_sin_fecha_toma_la_del_operador(catalogo):
+    ayer = (datetime.now() - timedelta(days=1)).date()
+    _registrar("P001,2\nP003,1\n", fecha=ayer)
+
+    assert totales_del_dia() == {}
+    assert _estadisticas(ayer)["escaneos"] == 2
+
+    bitacora = pd.read_csv(escaneos.archivo_escaneos(), dtype={"timestamp": str})
+    assert bitacora["timestamp"].str.startswith(ayer.strftime("%Y-%m-%d")).all()
+
+
+def test_volcado_reporta_la_linea_fisica(catalogo):
+    texto = ("codigo;cantidad\n"
+             "P001;1\n"
+             "\n"
+             "\n"
+             "P002;x\n"
+             "   \n"
+             "ZZZ;1\n")
+    resumen = _registrar(texto)
+
+    assert resumen["lineas"] == 3
+    assert resumen["invalidos"]["fila"].tolist() == [5]
+    assert resumen["desconocidos"]["primera_fila"].tolist() == [7]
+
+    manana = datetime.now() + timedelta(days=1)
+    _, resumen = escaneos.registrar_volcado_escaner(
+        "Ana", io.BytesIO(f"P001,1,{manana:%Y-%m-%d} 08:00\n\nP002,1,no es fecha\n".encode()))
+    assert resumen["aceptados"] == 0
+    assert resumen["invalidos"]["fila"].tolist() == [1, 3]